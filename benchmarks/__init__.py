@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 25 09:40:12 2026
+
+@author: oreilly
+
+Performance benchmarks of the meta-modeler. Run with:
+
+    python -m benchmarks.run [--quick] [--output results.json]
+"""
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 25 09:52:37 2026
+
+@author: oreilly
+"""
+
+import os
+import random
+
+import numpy as np
+import pandas as pd
+
+from metamodeler.ontologyIndex import OntologyIndex
+from metamodeler.referenceStore import ReferenceSummary
+
+
+# Generators of synthetic projects and corpora of realistic sizes. They are
+# seeded so that successive runs of the benchmarks process the same data.
+
+extensions = [".mm_py", ".mm_hoc", ".mm_mod"]
+units      = ["mV", "ms", "S/cm**2", "mS/cm**2", "um", "nA", "degC", "uF/cm**2"]
+
+fillerLines = ["def compute(x, y):",
+               "    return x*y + 0.5*(x - y)",
+               "for i in range(100):",
+               "    v = v + dt*(-v + i_ext)/tau",
+               "objref stim",
+               "stim = new IClamp(0.5)",
+               "NEURON {",
+               "    SUFFIX na",
+               "}",
+               "# Parameters of the model are defined below.",
+               ""]
+
+
+def tagStr(paramName, args):
+    if len(args) == 0:
+        return "#|" + paramName + "|#"
+    return "#|" + paramName + "(" + ", ".join([key + '="' + value + '"' for key, value in args]) + ")|#"
+
+
+def generateTags(rng, nbTags, paramNames):
+    # Varied argument lists: no argument, units, descriptors and
+    # transformations of the reference values.
+    tags = []
+    for noTag in range(nbTags):
+        args = []
+        if rng.random() < 0.6:
+            args.append(("unit", rng.choice(units)))
+        if rng.random() < 0.3:
+            args.append(("region", "soma" if rng.random() < 0.5 else "dend"))
+        if rng.random() < 0.2:
+            args.append(("temperature", str(rng.randint(20, 37))))
+        if rng.random() < 0.1:
+            args.append(("transformation", "median(values)"))
+        args.append(("index", str(noTag)))
+        tags.append(tagStr(rng.choice(paramNames), args))
+    return tags
+
+
+def generateParameterTypes(nbTypes=50):
+    """
+     Stand-ins for the parameter types known by NAT (only their names and
+     IDs are used), to set as FileSetup.parameterTypes so that projects can
+     be created without NAT.
+    """
+    return [StubObject(name="literature_param_" + str(no), ID="param_type_" + str(no)) for no in range(nbTypes)]
+
+
+def generateProject(path, nbFiles=50, nbTagsPerFile=60, nbFillerLines=400, seed=0):
+    """
+     Write in path nbFiles meta-model files holding nbTagsPerFile tags each,
+     spread among nbFillerLines lines of code. Tag names are drawn among the
+     names of generateParameterTypes() (literature-backed parameters) and
+     custom names. Return the list of the file names.
+    """
+    rng        = random.Random(seed)
+    knownNames = [paramType.name for paramType in generateParameterTypes()]
+    paramNames = knownNames + ["custom_param_" + str(no) for no in range(len(knownNames))]
+
+    os.makedirs(path, exist_ok=True)
+    fileNames = []
+    for noFile in range(nbFiles):
+        lines = [rng.choice(fillerLines) for noLine in range(nbFillerLines)]
+        for tag in generateTags(rng, nbTagsPerFile, paramNames):
+            lines.insert(rng.randrange(len(lines)+1), "x_" + str(rng.randint(0, 10**6)) + " = " + tag)
+
+        subDir   = "dir" + str(noFile % 5)
+        fileName = os.path.join(path, subDir, "file" + str(noFile) + rng.choice(extensions))
+        os.makedirs(os.path.dirname(fileName), exist_ok=True)
+        with open(fileName, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        fileNames.append(fileName)
+    return fileNames
+
+
+
+class StubObject:
+    # Stand-in for the nat objects of the search results (annotations,
+    # parameter instances, tags), with only the accessed attributes.
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class StubReferenceManager:
+    # Publication information without accessing web services nor the cache file.
+    def getInfoFromID(self, pubId, alwaysFetch=False):
+        return {"authors": "Author " + pubId, "year": 1980 + int(pubId[3:]) % 40, "journal": "Journal"}
+
+
+speciesRootId = "NIFORG:birnlex_569"
+cellRootId    = "sao1813327414"
+regionRootId  = "NIFGA:birnlex_1167"
+
+
+def generateOntology(nbTermsPerRoot=2000, seed=0):
+    """
+     Synthetic ontology with the roots used for scoring. Each term has a
+     few subclasses. Return an OntologyIndex.
+    """
+    rng   = random.Random(seed)
+    trees = {}
+    dics  = {speciesRootId: "Eumetazoa", cellRootId: "Cell", regionRootId: "Regional part of brain"}
+    children = {}
+    for rootId, prefix in [(speciesRootId, "species"), (cellRootId, "cell"), (regionRootId, "region")]:
+        terms = {}
+        for noTerm in range(nbTermsPerRoot):
+            id   = prefix + ":" + str(noTerm)
+            name = prefix + " " + "".join([rng.choice("abcdefghij") for no in range(rng.randint(3, 12))])
+            terms[id] = name
+            dics[id]  = name
+            if noTerm >= 10:
+                children.setdefault(prefix + ":" + str(noTerm % 10), {})[id] = name
+        trees[rootId] = terms
+    return OntologyIndex(trees, dics, lambda id: children.get(id, {}))
+
+
+def generateSearchResult(nbRows=10000, nbPublications=500, seed=0):
+    """
+     Synthetic result of a search of the corpus, with the columns of the
+     DataFrame returned by nat ParameterSearch.search().
+    """
+    rng  = random.Random(seed)
+    rows = []
+    for noRow in range(nbRows):
+        species  = [StubObject(id="species:" + str(rng.randrange(100)), name="species")]
+        cellId   = "cell:" + str(rng.randrange(100))
+        regionId = "region:" + str(rng.randrange(100))
+        requiredTags = [StubObject(id=cellId, name=cellId, rootId=cellRootId),
+                        StubObject(id=regionId, name=regionId, rootId=regionRootId)]
+        rows.append({"Values"        : rng.lognormvariate(0, 1),
+                     "Unit"          : rng.choice(["mV", "V", "ms", "s"]),
+                     "Species"       : species,
+                     "Cell"          : cellId,
+                     "obj_annotation": StubObject(ID="annotation" + str(noRow),
+                                                  pubId="pub" + str(rng.randrange(nbPublications))),
+                     "obj_parameter" : StubObject(id="instance" + str(noRow), requiredTags=requiredTags)})
+    return pd.DataFrame(rows)
+
+
+def generateReferences(nbReferences=20, seed=0):
+    rng = np.random.default_rng(seed)
+    return [ReferenceSummary("instance" + str(no), float(value), "mV", spread=1.0, size=10)
+            for no, value in enumerate(rng.lognormal(0, 1, nbReferences))]
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 25 10:31:05 2026
+
+@author: oreilly
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from collections import OrderedDict
+
+import numpy as np
+
+from metamodeler.tagParser import TagParser
+from metamodeler.projectSetup import ProjectSetup, FileSetup
+from metamodeler.modelParameter import Transformation
+from metamodeler.ontologyIndex import OntologyIndex
+from metamodeler import ranking
+
+from .generators import (generateProject, generateParameterTypes, generateSearchResult, generateOntology,
+                         generateReferences, StubReferenceManager)
+
+
+defaultThresholdFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+
+# Sizes of the synthetic data, for complete runs and for quick checks.
+sizes = {"full" : {"nbFiles": 50, "nbTagsPerFile": 60, "nbRows": 10000, "nbApply": 10000, "repeat": 5},
+         "quick": {"nbFiles": 10, "nbTagsPerFile": 20, "nbRows": 1000,  "nbApply": 1000,  "repeat": 2}}
+
+
+# Modules that the core of the package (tag parsing, loading and saving of
+# projects, generation of models) must not import.
+heavyModules = ["numpy", "quantities", "pandas", "scipy", "nat", "PySide"]
+
+# Run in a new interpreter, with the path of a saved project as argument.
+coreImportCode = """
+import sys, json, time
+start = time.perf_counter()
+import metamodeler.projectSetup
+duration = time.perf_counter() - start
+projectSetup = metamodeler.projectSetup.ProjectSetup.load(sys.argv[1])
+projectSetup.save()
+projectSetup.generateModel()
+print(json.dumps({"duration": duration, "modules": sorted(set([name.split(".")[0] for name in sys.modules]))}))
+"""
+
+
+def timeIt(fct, repeat, setup=None):
+    # Best and median durations, in seconds, of repeat calls of fct. If
+    # given, setup is called (untimed) before each call and its return
+    # value is passed to fct.
+    durations = []
+    for noRepeat in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        fct(*args)
+        durations.append(time.perf_counter() - start)
+    return {"best": min(durations), "median": float(np.median(durations)), "repeat": repeat}
+
+
+
+class BenchmarkSuite:
+    """
+     Time the hot paths of the meta-modeler on synthetic data. Every
+     benchmark is a method named bench<Name> returning its timings (or None
+     if it cannot run in this environment). They are run in the order of
+     benchmarkNames.
+    """
+
+    benchmarkNames = ["TagParsing", "ProjectCreation", "ReloadMM", "Save", "Load", "GenerateModel",
+                      "CoreImport", "RankPropositions", "ComputeScores", "PropositionTableModel", "TransformationApply"]
+
+    def __init__(self, workDir, size="full"):
+        # Neither NAT nor its parameter types are needed.
+        FileSetup.parameterTypes = generateParameterTypes()
+
+        self.workDir     = workDir
+        self.size        = sizes[size]
+        self.projectPath = os.path.join(workDir, "project")
+        self.fileNames   = generateProject(self.projectPath, self.size["nbFiles"], self.size["nbTagsPerFile"])
+        self.texts       = []
+        for fileName in self.fileNames:
+            with open(fileName) as f:
+                self.texts.append(f.read())
+
+        # Scoring uses a synthetic ontology and does not access the
+        # publication web services.
+        OntologyIndex.sharedIndex = generateOntology()
+        self.refMng       = StubReferenceManager()
+        self.searchResult = generateSearchResult(self.size["nbRows"])
+        self.attributes   = {"unit": "mV", "species": "species:3", "cell_type": "cell:5"}
+        self.projectSetup = None
+
+
+    def benchTagParsing(self):
+        parser = TagParser()
+        def parse():
+            for text in self.texts:
+                for paramStr in parser.getParamStr(text):
+                    parser.getParamKey(paramStr)
+        return timeIt(parse, self.size["repeat"])
+
+
+    def benchProjectCreation(self):
+        def create():
+            if os.path.exists(os.path.join(self.projectPath, ".mmproject.pck")):
+                os.remove(os.path.join(self.projectPath, ".mmproject.pck"))
+            self.projectSetup = ProjectSetup(self.projectPath)
+        return timeIt(create, self.size["repeat"])
+
+
+    def getProjectSetup(self):
+        if self.projectSetup is None:
+            self.projectSetup = ProjectSetup(self.projectPath)
+        return self.projectSetup
+
+
+    def benchReloadMM(self):
+        return timeIt(self.getProjectSetup().reloadMM, self.size["repeat"])
+
+
+    def benchSave(self):
+        return timeIt(self.getProjectSetup().save, self.size["repeat"])
+
+
+    def benchLoad(self):
+        self.getProjectSetup().save()
+        return timeIt(lambda: ProjectSetup.load(self.projectPath), self.size["repeat"])
+
+
+    def benchGenerateModel(self):
+        return timeIt(self.getProjectSetup().generateModel, self.size["repeat"])
+
+
+    def benchCoreImport(self):
+        # Import time of the core in a new interpreter. The heavy modules
+        # imported by the core, even after loading, saving and generating
+        # a project, are reported as unexpected.
+        self.getProjectSetup().save()
+        env        = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        durations  = []
+        unexpected = set()
+        for noRepeat in range(self.size["repeat"]):
+            output = subprocess.run([sys.executable, "-c", coreImportCode, self.projectPath], env=env,
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            durations.append(result["duration"])
+            unexpected.update(set(result["modules"]) & set(heavyModules))
+        return {"best": min(durations), "median": float(np.median(durations)), "repeat": self.size["repeat"],
+                "unexpectedModules": sorted(unexpected)}
+
+
+    def benchRankPropositions(self):
+        return timeIt(lambda: ranking.rankPropositions(self.searchResult, self.attributes, self.refMng),
+                      self.size["repeat"])
+
+
+    def benchComputeScores(self):
+        setup = lambda: ranking.buildPropositions(self.searchResult, self.refMng)[0]
+        return timeIt(lambda propositions: ranking.computeScores(propositions, self.attributes),
+                      self.size["repeat"], setup)
+
+
+    def benchPropositionTableModel(self):
+        # Only if Qt is available.
+        try:
+            from metamodeler.proposer import PropositionTableModel
+        except ImportError:
+            return None
+        model = PropositionTableModel()
+        model.refMng = self.refMng
+        return timeIt(lambda: model.refreshData(self.searchResult, self.attributes), self.size["repeat"])
+
+
+    def benchTransformationApply(self):
+        references     = generateReferences()
+        transformation = Transformation("median(values)*2")
+        def apply():
+            for noApply in range(self.size["nbApply"]):
+                transformation.apply(references)
+        return timeIt(apply, self.size["repeat"])
+
+
+    def run(self, names=None):
+        results = OrderedDict()
+        for name in BenchmarkSuite.benchmarkNames:
+            if not names is None and not name in names:
+                continue
+            timings = getattr(self, "bench" + name)()
+            if not timings is None:
+                results[name] = timings
+        return results
+
+
+
+def checkThresholds(results, thresholds):
+    # A benchmark passes if its best time does not exceed its threshold and
+    # if it did not import unexpected modules.
+    passed = True
+    for name, timings in results.items():
+        timings["threshold"] = thresholds.get(name)
+        timings["passed"]    = None if timings["threshold"] is None else timings["best"] <= timings["threshold"]
+        if len(timings.get("unexpectedModules", [])):
+            timings["passed"] = False
+        if timings["passed"] is False:
+            passed = False
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmarks of the meta-modeler.")
+    parser.add_argument("--quick", action="store_true", help="Use small synthetic data (thresholds are not checked).")
+    parser.add_argument("--output", default="benchmarkResults.json", help="JSON file receiving the results.")
+    parser.add_argument("--thresholds", default=defaultThresholdFile, help="JSON file of the regression " +
+                                                                          "thresholds (best time, in seconds).")
+    parser.add_argument("--only", nargs="*", default=None, help="Names of the benchmarks to run.")
+    args = parser.parse_args()
+
+    size    = "quick" if args.quick else "full"
+    workDir = tempfile.mkdtemp(prefix="mmbench_")
+    try:
+        results = BenchmarkSuite(workDir, size).run(args.only)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    thresholds = {}
+    if not args.quick:
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    passed = checkThresholds(results, thresholds)
+
+    output = OrderedDict([("python"  , platform.python_version()),
+                          ("platform", platform.platform()),
+                          ("numpy"   , np.__version__),
+                          ("size"    , size),
+                          ("date"    , time.strftime("%Y-%m-%dT%H:%M:%S")),
+                          ("passed"  , passed),
+                          ("results" , results)])
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=4)
+
+    for name, timings in results.items():
+        status = "" if timings.get("passed") is None else ("  ok" if timings["passed"] else "  REGRESSION")
+        if len(timings.get("unexpectedModules", [])):
+            status += "  (imports " + ", ".join(timings["unexpectedModules"]) + ")"
+        print(name.ljust(25) + "{:10.4f} s".format(timings["best"]) + status)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
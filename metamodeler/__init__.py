@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 31 09:12:37 2026
+
+@author: oreilly
+"""
+
+import importlib
+
+
+# The main classes are available from the package, e.g.,
+# metamodeler.ProjectSetup, but their modules are only imported on first
+# access (PEP 562), so that importing the package or one of its core
+# modules does not import the GUI, NAT or NumPy.
+exports = {"ProjectSetup"      : "projectSetup",
+           "FileSetup"         : "projectSetup",
+           "OperationCancelled": "projectSetup",
+           "TagParser"         : "tagParser",
+           "ModelTemplate"     : "modelTemplate",
+           "DependencyGraph"   : "dependencies",
+           "Transformation"    : "modelParameter",
+           "Ensemble"          : "ensemble",
+           "AutoCurator"       : "autoCuration",
+           "OntologyIndex"     : "ontologyIndex",
+           "ReferenceManager"  : "referenceManager",
+           "SessionReplayer"   : "session",
+           "SharedCorpus"      : "sharedCorpus",
+           "ProjectWatcher"    : "watcher"}
+
+
+def __getattr__(name):
+    if not name in exports:
+        raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
+    value = getattr(importlib.import_module("." + exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(exports))
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 10:15:40 2026
+
+@author: oreilly
+"""
+
+import warnings
+
+from .units import normalizeUnit, unitFactor
+from .utils import lazyImport
+
+np = lazyImport("numpy")
+
+
+class PackedReferences:
+    """
+     Reference summaries (see referenceStore.py) of several parameters packed
+     in 2D arrays: one row per parameter, padded with NaN. The values and
+     spreads of a row are rescaled to the unit of its first reference.
+     Unknown spreads and sample sizes are NaN.
+    """
+
+    def __init__(self, referenceLists):
+        width  = max([1] + [len(references) for references in referenceLists])
+        shape  = (len(referenceLists), width)
+
+        self.units   = []
+        self.values  = np.full(shape, np.nan)
+        self.spreads = np.full(shape, np.nan)
+        self.sizes   = np.full(shape, np.nan)
+
+        for noRow, references in enumerate(referenceLists):
+            if len(references) == 0:
+                self.units.append(None)
+                continue
+
+            unit    = normalizeUnit(references[0].unit)
+            factors = np.array([unitFactor(normalizeUnit(ref.unit), unit) for ref in references])
+            nbRefs  = len(references)
+            self.units.append(unit)
+            self.values[noRow, :nbRefs]  = np.array([ref.value for ref in references], dtype=float)*factors
+            self.spreads[noRow, :nbRefs] = np.array([ref.spread for ref in references], dtype=float)*factors
+            self.sizes[noRow, :nbRefs]   = np.array([ref.size for ref in references], dtype=float)
+
+
+    @property
+    def counts(self):
+        return np.sum(~np.isnan(self.values), axis=1)
+
+
+
+def bootstrapMeanCI(values, nBootstrap=500, confidence=0.95, seed=0, maxChunkSize=2**22):
+    """
+     Percentile bootstrap confidence interval of the mean of each row of
+     values (NaN-padded on the right). Rows are processed by chunks so that
+     no more than about maxChunkSize resampled values are held in memory.
+    """
+    nbRows, width = values.shape
+    counts = np.sum(~np.isnan(values), axis=1)
+    low    = np.full(nbRows, np.nan)
+    high   = np.full(nbRows, np.nan)
+    alpha  = 50.0*(1.0 - confidence)
+    rng    = np.random.default_rng(seed)
+    mask   = np.arange(width)
+
+    chunkSize = max(1, maxChunkSize//(nBootstrap*width))
+    for start in range(0, nbRows, chunkSize):
+        stop   = min(start + chunkSize, nbRows)
+        chunk  = values[start:stop]
+        nbRefs = counts[start:stop, None, None]
+
+        # Resample with replacement among the valid (leading) values of each
+        # row. Positions beyond the number of references are masked out.
+        indexes = (rng.random((stop-start, nBootstrap, width))*nbRefs).astype(int)
+        samples = chunk[np.arange(stop-start)[:, None, None], indexes]
+        samples = np.where(mask < nbRefs, samples, 0.0)
+
+        # Rows without reference give NaN means, hence NaN bounds.
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.sum(samples, axis=2)/nbRefs[:, :, 0]
+        low[start:stop], high[start:stop] = np.percentile(means, [alpha, 100.0-alpha], axis=1)
+
+    return low, high
+
+
+
+def aggregate(packed, nBootstrap=500, confidence=0.95, seed=0):
+    """
+     Compute, for every row of packed (a PackedReferences object):
+         n            : number of references
+         mean, median : unweighted statistics of the reference values
+         weightedMean : mean weighted by the sample sizes (references with
+                        unknown sample size weight 1)
+         pooledMean,
+         pooledSE     : inverse-variance pooling of the references reporting
+                        a spread, using spread/sqrt(sample size) (or the
+                        spread alone if the sample size is unknown) as
+                        standard error
+         ciLow, ciHigh: bootstrap confidence interval of the mean
+     Each statistic is returned as a 1D array, NaN where it is undefined.
+    """
+    values = packed.values
+    valid  = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    sizes  = np.where(np.isnan(packed.sizes), 1.0, packed.sizes)
+
+    with np.errstate(all="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+
+        mean   = np.nanmean(values, axis=1)
+        median = np.nanmedian(values, axis=1)
+
+        weights      = np.where(valid, sizes, 0.0)
+        weightedMean = np.sum(weights*filled, axis=1)/np.sum(weights, axis=1)
+
+        standardErrors   = packed.spreads/np.sqrt(sizes)
+        inverseVariances = np.where(valid & ~np.isnan(standardErrors), 1.0/standardErrors**2, 0.0)
+        sumInverse       = np.sum(inverseVariances, axis=1)
+        hasSpread        = sumInverse > 0
+        pooledMean       = np.where(hasSpread, np.sum(inverseVariances*filled, axis=1)/sumInverse, np.nan)
+        pooledSE         = np.where(hasSpread, np.sqrt(1.0/sumInverse), np.nan)
+
+        ciLow, ciHigh = bootstrapMeanCI(values, nBootstrap, confidence, seed)
+
+    return {"n"           : np.sum(valid, axis=1),
+            "mean"        : mean,
+            "median"      : median,
+            "weightedMean": weightedMean,
+            "pooledMean"  : pooledMean,
+            "pooledSE"    : pooledSE,
+            "ciLow"       : ciLow,
+            "ciHigh"      : ciHigh}
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 09:12:44 2026
+
+@author: oreilly
+"""
+
+import os
+import json
+import argparse
+import threading
+import traceback
+from copy import copy
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from nat.annotationSearch import ConditionAtom
+
+from .modelParameter import ModelParameterInstance
+from .ranking import rankPropositions
+from .dependencies import DependencyGraph
+from .projectSetup import ProjectSetup
+from .corpus import defaultDBPath
+from .service import openSearcher
+from .sharedCorpus import (SharedCorpus, SharedInstance, exportCorpus, projectCorpusContent,
+                           isExportComplete)
+from . import instrumentation
+
+
+class CurationEntry:
+    """
+     Outcome of the automatic curation of a parameter, for review. status is
+     one of:
+         "curated"         : propositions have been selected,
+         "no proposition"  : the search returned no annotated instance,
+         "below threshold" : no proposition reached the minimal score,
+         "error"           : the search or the scoring failed (see message).
+    """
+
+    def __init__(self, node, status, nbPropositions=0, selected=None, bestRejected=None, message=None):
+        self.node           = node
+        self.status         = status
+        self.nbPropositions = nbPropositions
+        self.selected       = [] if selected is None else selected
+        self.bestRejected   = bestRejected
+        self.message        = message
+
+    @staticmethod
+    def describe(proposition):
+        # What a reviewer needs to know about a proposition. "mismatches"
+        # lists the attributes (unit, species, ...) that did not match.
+        return OrderedDict([("id"        , proposition["obj_parameter"].id),
+                            ("score"     , proposition["score"]),
+                            ("value"     , proposition["value"]),
+                            ("unit"      , proposition["unit"]),
+                            ("authors"   , proposition["authors"]),
+                            ("year"      , proposition["year"]),
+                            ("mismatches", list(proposition["color"]))])
+
+    def toJSON(self):
+        return OrderedDict([("parameter"     , DependencyGraph.nodeStr(self.node)),
+                            ("status"        , self.status),
+                            ("nbPropositions", self.nbPropositions),
+                            ("selected"      , [CurationEntry.describe(prop) for prop in self.selected]),
+                            ("bestRejected"  , None if self.bestRejected is None
+                                                    else CurationEntry.describe(self.bestRejected)),
+                            ("message"       , self.message)])
+
+
+
+class CurationReport:
+
+    def __init__(self, topK, minScore):
+        self.topK     = topK
+        self.minScore = minScore
+        self.entries  = []
+
+    def count(self, status):
+        return len([entry for entry in self.entries if entry.status == status])
+
+    def summary(self):
+        return (str(len(self.entries)) + " parameters processed: " +
+                ", ".join([str(self.count(status)) + " " + status
+                           for status in ["curated", "no proposition", "below threshold", "error"]]) + ".")
+
+    def toJSON(self):
+        return OrderedDict([("topK"    , self.topK),
+                            ("minScore", self.minScore),
+                            ("summary" , self.summary()),
+                            ("entries" , [entry.toJSON() for entry in self.entries])])
+
+    def save(self, fileName):
+        with open(fileName, 'w') as f:
+            json.dump(self.toJSON(), f, indent=4, default=str)
+
+
+
+# In the process mode of AutoCurator, the propositions are ranked by worker
+# processes attached to a shared export of the corpus (see sharedCorpus.py).
+# The tasks carry only a parameter name and the attributes of its tags.
+_curationState = {}
+
+def _initCurationWorker(path):
+    _curationState["corpus"] = SharedCorpus(path)
+
+def _rankShared(paramName, attributesList):
+    # Propositions, or the formatted exception, for each set of attributes.
+    corpus  = _curationState["corpus"]
+    results = []
+    try:
+        resultDF = corpus.searchResult(paramName)
+    except Exception:
+        return [(None, traceback.format_exc())]*len(attributesList)
+    for attributes in attributesList:
+        try:
+            results.append((rankPropositions(resultDF, attributes, corpus.publications, corpus.ontology)[0], None))
+        except Exception:
+            results.append((None, traceback.format_exc()))
+    return results
+
+
+
+class AutoCurator:
+    """
+     Headless curation of the literature-backed parameters of a project.
+     For every incomplete ModelParameterInstance (or every one of them, if
+     overwrite is True), the annotated instances of the corpus are searched
+     and ranked as in the curation window (see ranking.py), against the project properties
+     updated with the arguments of the tag. The topK best propositions
+     scoring at least minScore are selected as references.
+
+     The corpus is searched only once per parameter name and the names are
+     processed in parallel by nbWorkers threads. The searcher is not
+     thread-safe, so the searches themselves are serialized.
+
+     If sharedCorpusPath is given, the names are instead ranked by nbWorkers
+     processes attached to the export of the corpus in this directory
+     (exported from the searcher first if it does not exist or lacks some
+     of the parameter names or ontology terms of the project), which is not
+     limited by the serialized searches nor by the GIL.
+    """
+
+    def __init__(self, projectSetup, searcher, topK=3, minScore=0.0, nbWorkers=4, overwrite=False, refMng=None,
+                 sharedCorpusPath=None):
+        self.projectSetup     = projectSetup
+        self.searcher         = searcher
+        self.topK             = topK
+        self.minScore         = minScore
+        self.nbWorkers        = nbWorkers
+        self.overwrite        = overwrite
+        self.refMng           = refMng
+        self.sharedCorpusPath = sharedCorpusPath
+        self.searchLock       = threading.Lock()
+
+
+    def nodesByName(self):
+        nodes = OrderedDict()
+        for fileName in sorted(self.projectSetup.files):
+            for paramKey, parameter in self.projectSetup.files[fileName].parameters.items():
+                if isinstance(parameter, ModelParameterInstance) and (self.overwrite or not parameter.isComplete()):
+                    nodes.setdefault(paramKey[0], []).append((fileName, paramKey))
+        return nodes
+
+
+    def search(self, paramName):
+        with self.searchLock:
+            self.searcher.setSearchConditions(ConditionAtom("Parameter name", paramName))
+            self.searcher.expandRequiredTags = True
+            self.searcher.onlyCentralTendancy = True
+            with instrumentation.span("ParameterSearch.search", paramName=paramName):
+                return self.searcher.search()
+
+
+    def rank(self, resultDF, attributes):
+        return rankPropositions(resultDF, attributes, self.refMng)[0]
+
+
+    def attributesOf(self, node):
+        attributes = copy(self.projectSetup.properties)
+        attributes.update(self.projectSetup.getParameter(node).args)
+        return attributes
+
+
+    def curateName(self, paramName, nodes):
+        with instrumentation.span("AutoCurator.curateName", paramName=paramName):
+            return self.__curateName(paramName, nodes)
+
+
+    def __curateName(self, paramName, nodes):
+        try:
+            resultDF = self.search(paramName)
+        except Exception:
+            return [CurationEntry(node, "error", message=traceback.format_exc()) for node in nodes]
+
+        entries = []
+        for node in nodes:
+            try:
+                propositions = self.rank(resultDF, self.attributesOf(node))
+            except Exception:
+                entries.append(CurationEntry(node, "error", message=traceback.format_exc()))
+                continue
+            entries.append(self.entry(node, propositions))
+        return entries
+
+
+    def entry(self, node, propositions):
+        # Propositions are sorted by decreasing score.
+        accepted = [prop for prop in propositions if prop["score"] >= self.minScore]
+        selected = accepted[:self.topK]
+        rejected = propositions[len(selected):]
+        if len(propositions) == 0:
+            status = "no proposition"
+        elif len(selected) == 0:
+            status = "below threshold"
+        else:
+            status = "curated"
+        return CurationEntry(node, status, len(propositions), selected, rejected[0] if len(rejected) else None)
+
+
+    def runShared(self, nodes):
+        # Entries of the nodes, ranked by worker processes (see _rankShared).
+        # An export made for an earlier state of the project may lack some
+        # parameter names or ancestors; the lookups would then fail.
+        paramNames, ancestorIds = projectCorpusContent(self.projectSetup)
+        if not isExportComplete(self.sharedCorpusPath, paramNames, ancestorIds):
+            exportCorpus(self.sharedCorpusPath, self.searcher, paramNames, ancestorIds, self.refMng)
+        entries = []
+        with ProcessPoolExecutor(max(1, self.nbWorkers), initializer=_initCurationWorker,
+                                 initargs=(self.sharedCorpusPath,)) as executor:
+            futures = [(paramNodes, executor.submit(_rankShared, paramName,
+                                                    [self.attributesOf(node) for node in paramNodes]))
+                       for paramName, paramNodes in nodes.items()]
+            for paramNodes, future in futures:
+                for node, (propositions, message) in zip(paramNodes, future.result()):
+                    if propositions is None:
+                        entries.append(CurationEntry(node, "error", message=message))
+                    else:
+                        entries.append(self.entry(node, propositions))
+        return entries
+
+
+    def run(self, apply=True):
+        """
+         Curate the parameters and return a CurationReport. If apply is
+         False, the project is left untouched (dry run).
+        """
+        report = CurationReport(self.topK, self.minScore)
+        nodes  = self.nodesByName()
+        if not self.sharedCorpusPath is None:
+            report.entries.extend(self.runShared(nodes))
+        else:
+            with ThreadPoolExecutor(max(1, self.nbWorkers)) as executor:
+                futures = [executor.submit(self.curateName, paramName, paramNodes)
+                           for paramName, paramNodes in nodes.items()]
+                for future in futures:
+                    report.entries.extend(future.result())
+
+        if apply:
+            self.apply(report)
+        return report
+
+
+    def apply(self, report):
+        # Modifications of the project are made from the calling thread only.
+        curated = [entry for entry in report.entries if entry.status == "curated"]
+        # Resolved before any modification, so that a failure leaves the
+        # project unchanged.
+        references = [[self.referenceInstance(prop) for prop in entry.selected] for entry in curated]
+        for entry, referenceInstances in zip(curated, references):
+            self.projectSetup.getParameter(entry.node).referenceInstances = referenceInstances
+
+        for entry in curated:
+            self.projectSetup.parameterChanged(*entry.node)
+        if len(curated):
+            self.projectSetup.markDirty()
+
+
+    @staticmethod
+    def referenceInstance(proposition):
+        # Propositions ranked by worker processes only hold the IDs of the
+        # instances, which are resolved in the corpus of the process.
+        store = ModelParameterInstance.referenceStore
+        if isinstance(proposition["obj_parameter"], SharedInstance):
+            instance = store.resolve(proposition["obj_parameter"].id)
+            if instance is None:
+                raise ValueError("The parameter instance " + proposition["obj_parameter"].id +
+                                 " is not in the corpus.")
+            return instance
+        store.register(proposition["obj_parameter"], proposition["obj_annotation"])
+        return proposition["obj_parameter"]
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Automatically curate the incomplete parameters of a project.")
+    parser.add_argument("project", help="Path of the project folder.")
+    parser.add_argument("--db", default=None, help="Path of the local annotation corpus " +
+                                                   "(default: as configured in settings.ini).")
+    parser.add_argument("--top-k", type=int, default=3, help="Maximal number of references per parameter.")
+    parser.add_argument("--min-score", type=float, default=0.0, help="Minimal score of selected references.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of parameter names processed in parallel.")
+    parser.add_argument("--overwrite", action="store_true", help="Also curate the complete parameters.")
+    parser.add_argument("--dry-run", action="store_true", help="Only write the report.")
+    parser.add_argument("--report", default="curationReport.json", help="File name of the review report.")
+    parser.add_argument("--trace", default=None, help="File name of a Chrome trace of the timings of the run.")
+    parser.add_argument("--service", default=None, help="Socket of the service to use if it serves the " +
+                                                        "same corpus (default: the service of the user).")
+    parser.add_argument("--local", action="store_true", help="Load the corpus even if a service is running.")
+    parser.add_argument("--shared-corpus", default=None, help="Rank in worker processes attached to the export " +
+                                                              "of the corpus in this directory (exported " +
+                                                              "first if it does not exist or is " +
+                                                              "incomplete for the project).")
+    args = parser.parse_args()
+
+    if not args.trace is None:
+        instrumentation.enable()
+
+    dbPath = defaultDBPath() if args.db is None else args.db
+
+    projectSetup = ProjectSetup.load(args.project)
+    if projectSetup is None:
+        projectSetup = ProjectSetup(args.project)
+
+    searcher, refMng = openSearcher(os.path.abspath(dbPath), args.service, args.local)
+    curator = AutoCurator(projectSetup, searcher, args.top_k, args.min_score, args.workers,
+                          args.overwrite, refMng, args.shared_corpus)
+    report = curator.run(apply=not args.dry_run)
+    report.save(args.report)
+    print(report.summary())
+    if not args.trace is None:
+        instrumentation.exportTrace(args.trace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:20:07 2026
+
+@author: oreilly
+"""
+
+import threading
+import time
+import traceback
+
+
+class AutoSaver:
+    """
+     Coalesce save requests. Every call to markDirty() (re)starts a short
+     timer; once it expires without new changes, or at the latest maxDelay
+     seconds after the first unsaved change, snapshotFct() is called and the
+     bytes it returns are passed to writeFct() in a background thread.
+     flush() waits for the background writes in progress, saves
+     synchronously any pending change and must be called before exiting. A
+     failed background write is retried after delay seconds.
+
+     The snapshot is taken from the thread running the timer callbacks,
+     which must be the thread modifying the saved object (e.g., the GUI
+     thread, with timerFactory creating Qt timers). timerFactory(delay,
+     callback) returns a started single-shot timer with a cancel() method
+     (by default, a threading.Timer, for objects that are not modified
+     concurrently).
+    """
+
+    defaultDelay = 1.0
+
+    def __init__(self, snapshotFct, writeFct, delay=None, maxDelay=None, timerFactory=None):
+        if delay is None:
+            delay = AutoSaver.defaultDelay
+        if maxDelay is None:
+            maxDelay = 5*delay
+
+        self.snapshotFct  = snapshotFct
+        self.writeFct     = writeFct
+        self.delay        = delay
+        self.maxDelay     = maxDelay
+        self.timerFactory = threadingTimer if timerFactory is None else timerFactory
+
+        self.dirty        = False
+        self.dirtySince   = None
+        self.timer        = None
+        self.retryTimer   = None
+        self.noSnapshot   = 0      # Number of the last snapshot taken
+        self.noWritten    = 0      # Number of the last snapshot written
+        self.nbWriting    = 0      # Number of background writes in progress
+        self.failed       = None   # (number, data) of a snapshot whose write failed
+        self.lock         = threading.Lock()   # Protects the state above
+        self.condition    = threading.Condition(self.lock)  # Notified at the end of background writes
+        self.writeLock    = threading.Lock()   # Serializes the writes
+
+
+    def markDirty(self):
+        with self.lock:
+            now = time.monotonic()
+            if not self.dirty:
+                self.dirty      = True
+                self.dirtySince = now
+            delay = min(self.delay, max(self.dirtySince + self.maxDelay - now, 0.0))
+            if not self.timer is None:
+                self.timer.cancel()
+            self.timer = self.timerFactory(delay, self.__timeout)
+
+
+    def __timeout(self):
+        try:
+            noSnapshot, data = self.__snapshot(background=True)
+        except Exception:
+            # Keep the changes pending so that flush() can report the error.
+            traceback.print_exc()
+            return
+        if not data is None:
+            thread = threading.Thread(target=self.__backgroundWrite, args=(noSnapshot, data))
+            thread.daemon = True
+            thread.start()
+
+
+    def __snapshot(self, background=False):
+        with self.lock:
+            if not self.dirty:
+                return None, None
+            try:
+                data = self.snapshotFct()
+            except:
+                self.dirty = True
+                raise
+            self.dirty      = False
+            self.dirtySince = None
+            self.noSnapshot += 1
+            if background:
+                # Counted before the thread starts so that flush() waits for it.
+                self.nbWriting += 1
+            return self.noSnapshot, data
+
+
+    def __backgroundWrite(self, noSnapshot, data):
+        try:
+            self.__write(noSnapshot, data)
+        except Exception:
+            traceback.print_exc()
+            # The same snapshot is written again later, unless a more recent
+            # one is written first. Retrying the write from a background
+            # timer does not require the thread of the snapshots.
+            with self.lock:
+                if not self.retryTimer is None:
+                    self.retryTimer.cancel()
+                self.retryTimer = threadingTimer(self.delay, self.__retry)
+        finally:
+            with self.condition:
+                self.nbWriting -= 1
+                self.condition.notify_all()
+
+
+    def __retry(self):
+        with self.lock:
+            self.retryTimer = None
+            if self.failed is None:
+                return
+            noSnapshot, data = self.failed
+            self.nbWriting += 1
+        self.__backgroundWrite(noSnapshot, data)
+
+
+    def __write(self, noSnapshot, data):
+        with self.writeLock:
+            # A more recent snapshot may already have been written.
+            if noSnapshot <= self.noWritten:
+                return
+            try:
+                self.writeFct(data)
+            except:
+                with self.lock:
+                    if self.failed is None or self.failed[0] < noSnapshot:
+                        self.failed = (noSnapshot, data)
+                raise
+            with self.lock:
+                self.noWritten = noSnapshot
+                if not self.failed is None and self.failed[0] <= noSnapshot:
+                    self.failed = None
+
+
+    def flush(self):
+        with self.condition:
+            for timer in [self.timer, self.retryTimer]:
+                if not timer is None:
+                    timer.cancel()
+            self.timer = self.retryTimer = None
+            # Snapshots taken by the timer may not be written yet.
+            while self.nbWriting:
+                self.condition.wait()
+            failed = self.failed
+        noSnapshot, data = self.__snapshot()
+        if data is None and not failed is None:
+            noSnapshot, data = failed
+        if not data is None:
+            self.__write(noSnapshot, data)
+
+
+    @property
+    def isDirty(self):
+        # Changes are pending until the snapshot including them is written.
+        with self.lock:
+            return self.dirty or self.noWritten < self.noSnapshot
+
+
+
+def threadingTimer(delay, callback):
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+    return timer
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 28 09:36:20 2026
+
+@author: oreilly
+"""
+
+import threading
+import traceback
+
+from PySide import QtCore
+
+from .projectSetup import OperationCancelled
+
+
+class BackgroundJob(QtCore.QThread):
+    """
+     Run fct(progress, isCancelled) in a thread, fct being one of the long
+     operations of ProjectSetup (e.g., scanMM or generateModel). Its progress
+     and outcome are reported by signals, which are delivered in the thread
+     of the receivers (i.e., the GUI thread):
+         progressed(done, total, name) : after every processed file,
+         succeeded(result)             : with the value returned by fct,
+         failed(exception, traceback)  : if fct raised an exception,
+         cancelled()                   : if fct stopped after cancel().
+    """
+
+    progressed = QtCore.Signal(int, int, str)
+    succeeded  = QtCore.Signal(object)
+    failed     = QtCore.Signal(object, str)
+    cancelled  = QtCore.Signal()
+
+    def __init__(self, fct, parent=None):
+        super(BackgroundJob, self).__init__(parent)
+        self.fct         = fct
+        self.cancelEvent = threading.Event()
+
+    def cancel(self):
+        self.cancelEvent.set()
+
+    def isCancelled(self):
+        return self.cancelEvent.is_set()
+
+    def run(self):
+        try:
+            result = self.fct(self.progressed.emit, self.isCancelled)
+        except OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(e, traceback.format_exc())
+        else:
+            self.succeeded.emit(result)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 10:02:31 2026
+
+@author: oreilly
+"""
+
+import os
+from bisect import bisect_right
+from collections import OrderedDict
+
+from .tagParser import TagParser
+
+
+class FileContextIndex:
+    """
+     Index of the tags of a meta-model file. It keeps the lines of the file
+     and maps every parameter key to the line numbers and character spans
+     of its tags so that the code context of a parameter can be displayed
+     without reading and parsing the file again. The index is tied to the
+     modification time of the file and must be rebuilt when it is stale.
+    """
+
+    def __init__(self, path, text=None):
+        self.path  = path
+        self.mtime = os.stat(path).st_mtime
+        if text is None:
+            with open(path, 'r') as f:
+                text = f.read()
+
+        self.lines = text.split("\n")
+        if len(self.lines) > 1 and self.lines[-1] == "":
+            self.lines.pop()
+
+        lineStarts = [0]
+        for line in self.lines[:-1]:
+            lineStarts.append(lineStarts[-1] + len(line) + 1)
+
+        # tags: first tag string found for each parameter key, in order of
+        #       appearance in the file.
+        # hits: list of (line number, start, end) for each parameter key,
+        #       start and end being relative to the beginning of the line.
+        self.tags = OrderedDict()
+        self.hits = {}
+        parser = TagParser()
+        for match in TagParser.p.finditer(text):
+            paramStr = match.group(0)
+            paramKey = parser.getParamKey(paramStr)
+            noLine   = bisect_right(lineStarts, match.start()) - 1
+            start    = match.start() - lineStarts[noLine]
+            end      = min(start + len(paramStr), len(self.lines[noLine]))
+            if not paramKey in self.tags:
+                self.tags[paramKey] = paramStr
+                self.hits[paramKey] = []
+            self.hits[paramKey].append((noLine, start, end))
+
+
+    def isStale(self):
+        try:
+            return os.stat(self.path).st_mtime != self.mtime
+        except FileNotFoundError:
+            return True
+
+
+    def getContext(self, paramKey, nbLineContext=3):
+        """
+         Return the code snippet showing the tags of paramKey with
+         nbLineContext lines of context around them, along with the
+         (start, end) positions of these tags within the snippet.
+        """
+        if not paramKey in self.hits:
+            return "", []
+
+        tagLines = OrderedDict()
+        for noLine, start, end in self.hits[paramKey]:
+            tagLines.setdefault(noLine, []).append((start, end))
+
+        shownLines = set()
+        for noLine in tagLines:
+            shownLines.update(range(max(noLine-nbLineContext, 0),
+                                    min(noLine+nbLineContext+1, len(self.lines))))
+
+        parts         = []
+        highlights    = []
+        position      = 0
+        lastAddedLine = -1
+        for noLine in sorted(shownLines):
+            if noLine - lastAddedLine > 1:
+                parts.append("[...]\n")
+                position += 6
+            prefix = str(noLine+1).ljust(5)
+            for start, end in tagLines.get(noLine, []):
+                highlights.append((position + len(prefix) + start, position + len(prefix) + end))
+            line = prefix + self.lines[noLine] + "\n"
+            parts.append(line)
+            position += len(line)
+            lastAddedLine = noLine
+
+        if lastAddedLine < len(self.lines)-1:
+            parts.append("[...]\n")
+
+        return "".join(parts), highlights
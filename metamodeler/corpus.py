@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 29 09:05:12 2026
+
+@author: oreilly
+"""
+
+import os
+import configparser
+
+from nat.annotationSearch import ParameterSearch, CompiledCorpus
+
+from .modelParameter import ModelParameterInstance
+
+
+def defaultDBPath():
+    # Settings saved by the settings dialog, read without Qt.
+    config = configparser.ConfigParser()
+    config.read("settings.ini")
+    return config["GIT"]["local"]
+
+
+def compileCorpus(dbPath):
+    compiledCorpus = CompiledCorpus(os.path.join(dbPath, "annotations.bin"))
+    compiledCorpus.compileCorpus(pathDB=dbPath)
+    return compiledCorpus
+
+
+def openCorpus(dbPath):
+    # Compile the local corpus, use it to resolve the references of the
+    # parameters and return a searcher of this corpus.
+    compiledCorpus = compileCorpus(dbPath)
+    ModelParameterInstance.referenceStore.setCorpus(compiledCorpus)
+    return ParameterSearch(pathDB=dbPath, compiledCorpus=compiledCorpus)
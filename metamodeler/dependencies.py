@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 14:27:50 2026
+
+@author: oreilly
+"""
+
+from collections import OrderedDict, deque
+
+
+class CyclicDependencyError(ValueError):
+    pass
+
+
+class DependencyGraph:
+    """
+     Directed acyclic graph of the dependencies between the parameters of a
+     project. Nodes are (fileName, paramKey) tuples. A parameter whose
+     transformation uses the name of another parameter depends on it. Names
+     are first looked up among the parameters of the same file and then
+     among those of the whole project; they must designate a single
+     parameter.
+    """
+
+    def __init__(self, projectSetup):
+        self.bindings     = OrderedDict() # node -> {name used in the expression: node}
+        self.dependents   = {}            # node -> list of the nodes depending on it
+
+        nodesByName = {}
+        fileNodesByName = {}
+        for fileName, fileSetup in projectSetup.files.items():
+            fileNodesByName[fileName] = {}
+            for paramKey in fileSetup.parameters:
+                node = (fileName, paramKey)
+                nodesByName.setdefault(paramKey[0], []).append(node)
+                fileNodesByName[fileName].setdefault(paramKey[0], []).append(node)
+
+        for fileName, fileSetup in projectSetup.files.items():
+            for paramKey, parameter in fileSetup.parameters.items():
+                transformation = getattr(parameter, "transformation", None)
+                if transformation is None or len(transformation.dependencies) == 0:
+                    continue
+                node = (fileName, paramKey)
+                self.bindings[node] = {}
+                for name in sorted(transformation.dependencies):
+                    candidates = fileNodesByName[fileName].get(name, [])
+                    if len(candidates) == 0:
+                        candidates = nodesByName.get(name, [])
+                    if len(candidates) == 0:
+                        raise ValueError("Parameter " + DependencyGraph.nodeStr(node) +
+                                         " depends on '" + name + "', which is not a parameter of the project.")
+                    if len(candidates) > 1:
+                        raise ValueError("Parameter " + DependencyGraph.nodeStr(node) + " depends on '" + name +
+                                         "', which is ambiguous: " + ", ".join([DependencyGraph.nodeStr(candidate)
+                                                                                 for candidate in candidates]))
+                    self.bindings[node][name] = candidates[0]
+                    self.dependents.setdefault(candidates[0], []).append(node)
+
+        self.order = self.sortNodes()
+        self.rank  = {node:no for no, node in enumerate(self.order)}
+
+
+    @staticmethod
+    def nodeStr(node):
+        fileName, (name, args) = node
+        return fileName + ":" + name + "(" + args + ")"
+
+
+    def sortNodes(self):
+        # Kahn's algorithm over the nodes taking part in a dependency.
+        nodes = set(self.bindings)
+        for dependencies in self.bindings.values():
+            nodes.update(dependencies.values())
+
+        nbDependencies = {node:len(set(self.bindings.get(node, {}).values())) for node in nodes}
+        queue = deque(sorted([node for node in nodes if nbDependencies[node] == 0]))
+        order = []
+        while len(queue):
+            node = queue.popleft()
+            order.append(node)
+            for dependent in sorted(set(self.dependents.get(node, []))):
+                nbDependencies[dependent] -= 1
+                if nbDependencies[dependent] == 0:
+                    queue.append(dependent)
+
+        if len(order) != len(nodes):
+            cycle = sorted([node for node in nodes if nbDependencies[node] > 0])
+            raise CyclicDependencyError("Cyclic dependency between parameters " +
+                                        ", ".join([DependencyGraph.nodeStr(node) for node in cycle]))
+        return order
+
+
+    def downstream(self, nodes):
+        """
+         Return, in topological order, the nodes depending directly or
+         indirectly on any of nodes (nodes themselves being excluded).
+        """
+        found = set()
+        queue = deque(nodes)
+        while len(queue):
+            node = queue.popleft()
+            for dependent in self.dependents.get(node, []):
+                if not dependent in found:
+                    found.add(dependent)
+                    queue.append(dependent)
+        return sorted(found, key=self.rank.get)
+
+
+    def derivedNodes(self):
+        # Nodes with dependencies, in topological order.
+        return [node for node in self.order if node in self.bindings]
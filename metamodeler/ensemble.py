@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 10:36:27 2026
+
+@author: oreilly
+"""
+
+import os
+import json
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .modelParameter import ModelParameterInstance, ArrayParameterInstance, Transformation
+from .aggregation import PackedReferences
+from .units import unitFactor, toBaseUnit
+from .modelTemplate import ModelTemplate
+from .utils import lazyImport
+
+np = lazyImport("numpy")
+
+
+class ParameterRange:
+    """
+     User-defined range of values of a parameter, expressed in the unit of
+     the parameter. Values are drawn uniformly within [low, high], or
+     log-uniformly if log is True.
+    """
+
+    def __init__(self, low, high, log=False):
+        if low > high:
+            raise ValueError("Invalid range: the lower bound (" + str(low) +
+                             ") is larger than the upper bound (" + str(high) + ").")
+        if log and low <= 0:
+            raise ValueError("Log-uniform ranges must have a positive lower bound. Received " + str(low) + ".")
+        self.low  = low
+        self.high = high
+        self.log  = log
+
+    def sample(self, rng, nbVariants):
+        if self.log:
+            return np.exp(rng.uniform(np.log(self.low), np.log(self.high), nbVariants))
+        return rng.uniform(self.low, self.high, nbVariants)
+
+
+
+def bootstrapReferences(packed, nbVariants, rng, referenceSpread=False):
+    """
+     Resample with replacement the references of every row of packed (a
+     PackedReferences object), once for each variant. The returned array
+     has shape (nb rows, nbVariants, width) and is padded with NaN like
+     packed.values. If referenceSpread is True, the resampled values are
+     also perturbed with a normal noise of the spread reported by their
+     reference (when known).
+    """
+    nbRows, width = packed.values.shape
+    counts  = packed.counts[:, None, None]
+    rows    = np.arange(nbRows)[:, None, None]
+    indexes = (rng.random((nbRows, nbVariants, width))*counts).astype(int)
+    samples = packed.values[rows, indexes]
+    if referenceSpread:
+        noise   = rng.standard_normal(samples.shape)*packed.spreads[rows, indexes]
+        samples = samples + np.where(np.isnan(noise), 0.0, noise)
+    return np.where(np.arange(width) < counts, samples, np.nan)
+
+
+
+# Variants are written by worker processes. The templates and the text of
+# the fixed values are sent once to every worker, through the initializer
+# of the pool. The sampled values are saved once in a .npy file that the
+# workers memory-map, so that the tasks only carry ranges of variants. The
+# sidecar files of array-valued parameters are written once and linked in
+# the directory of every variant.
+_workerState = {}
+
+def _initWorker(outputDir, templates, constants, varyingColumns, nameWidth, sidecars, valuesFileName):
+    _workerState["outputDir"]      = outputDir
+    _workerState["templates"]      = templates
+    _workerState["constants"]      = constants
+    _workerState["varyingColumns"] = varyingColumns
+    _workerState["nameWidth"]      = nameWidth
+    _workerState["sidecars"]       = sidecars
+    _workerState["values"]         = np.load(valuesFileName, mmap_mode="r")
+    _workerState["subDirs"]        = sorted(set([os.path.dirname(outputName)
+                                                 for outputName, template, columns in templates]))
+
+def _writeVariants(firstVariant, lastVariant):
+    state = _workerState
+    rows  = state["values"][firstVariant:lastVariant].tolist()
+    for noVariant, row in enumerate(rows, firstVariant):
+        valueStrs = list(state["constants"])
+        for column, value in zip(state["varyingColumns"], row):
+            valueStrs[column] = str(value)
+
+        variantDir = os.path.join(state["outputDir"], Ensemble.variantName(noVariant, state["nameWidth"]))
+        for subDir in state["subDirs"]:
+            os.makedirs(os.path.join(variantDir, subDir), exist_ok=True)
+        for outputName, template, columns in state["templates"]:
+            with open(os.path.join(variantDir, outputName), 'w') as f:
+                f.write(template.render([valueStrs[column] for column in columns]))
+        for stagedName, sidecarName in state["sidecars"]:
+            linkFile(stagedName, os.path.join(variantDir, sidecarName))
+    return len(rows)
+
+
+def linkFile(source, destination):
+    # Hard links cost no space nor copy, but they cannot cross file systems.
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+
+class Ensemble:
+    """
+     Set of variants of the model of a project, used for parameter sweeps
+     and sensitivity analyses. In every variant, the value of a parameter is
+     either:
+         - drawn from a user-defined range (ranges maps parameter names or
+           (fileName, paramKey) nodes to ParameterRange objects or to
+           (low, high) tuples),
+         - drawn from the literature: the references of the parameter are
+           resampled with replacement and its transformation is applied to
+           the resampled values (if sampleLiterature is True),
+         - computed from the values of the variant for the parameters
+           depending on other parameters (see dependencies.py),
+         - or fixed to its value in the project.
+
+     The values of all variants are sampled at once in a matrix with one
+     row per variant and one column per parameter (see self.nodes). The
+     meta-model files are compiled once and the variants are written by a
+     pool of processes, each variant in its own directory, along with a
+     manifest.json file giving the sampled values of every variant.
+    """
+
+    maxChunkSize = 2**22
+
+    def __init__(self, projectSetup, nbVariants, ranges=None, sampleLiterature=True,
+                 referenceSpread=False, seed=0):
+        self.projectSetup     = projectSetup
+        self.nbVariants       = nbVariants
+        self.ranges           = {} if ranges is None else ranges
+        self.sampleLiterature = sampleLiterature
+        self.referenceSpread  = referenceSpread
+        self.seed             = seed
+
+        self.nodes   = [(fileName, paramKey) for fileName in sorted(projectSetup.files)
+                                             for paramKey in projectSetup.files[fileName].parameters]
+        self.columns = {node:no for no, node in enumerate(self.nodes)}
+        self.sources = None # "range", "literature", "derived" or "fixed", for each column
+        self.values  = None # Sampled values, of shape (nbVariants, nb columns)
+
+
+    @staticmethod
+    def variantName(noVariant, width=4):
+        return "variant_" + str(noVariant).zfill(width)
+
+
+    def getRange(self, node):
+        for key in [node, node[1][0]]:
+            if key in self.ranges:
+                paramRange = self.ranges[key]
+                if not isinstance(paramRange, ParameterRange):
+                    paramRange = ParameterRange(*paramRange)
+                return paramRange
+        return None
+
+
+    def sample(self):
+        self.projectSetup.evaluate()
+        graph   = self.projectSetup.dependencyGraph
+        derived = set(graph.derivedNodes())
+        rng     = np.random.default_rng(self.seed)
+
+        self.values  = np.full((self.nbVariants, len(self.nodes)), np.nan)
+        self.sources = []
+        literature   = OrderedDict() # Columns sampled from the literature, by transformation code
+        for column, node in enumerate(self.nodes):
+            parameter  = self.projectSetup.getParameter(node)
+            paramRange = self.getRange(node)
+            if not paramRange is None:
+                self.sources.append("range")
+                self.values[:, column] = paramRange.sample(rng, self.nbVariants)
+            elif node in derived:
+                self.sources.append("derived")
+            elif (self.sampleLiterature and isinstance(parameter, ModelParameterInstance)
+                  and len(parameter.references)):
+                self.sources.append("literature")
+                literature.setdefault(parameter.transformation.transformationCode, []).append(column)
+            else:
+                self.sources.append("fixed")
+                if not parameter.value is None and not isinstance(parameter, ArrayParameterInstance):
+                    self.values[:, column] = parameter.value
+
+        for code, columns in literature.items():
+            self.sampleReferences(columns, Transformation(code), rng)
+
+        # Parameters depending on others are computed, in topological
+        # order, from the values of each variant.
+        for node in graph.derivedNodes():
+            column = self.columns[node]
+            if self.sources[column] == "derived":
+                self.values[:, column] = self.computeDerived(node, graph, rng)
+
+        return self.values
+
+
+    def sampleReferences(self, columns, transformation, rng):
+        # Parameters are processed by chunks to bound the size of the
+        # resampled arrays.
+        references = [self.projectSetup.getParameter(self.nodes[column]).references for column in columns]
+        width      = max([len(refs) for refs in references])
+        chunkSize  = max(1, Ensemble.maxChunkSize//(self.nbVariants*width))
+        for start in range(0, len(columns), chunkSize):
+            packed  = PackedReferences(references[start:start+chunkSize])
+            samples = bootstrapReferences(packed, self.nbVariants, rng, self.referenceSpread)
+            self.values[:, columns[start:start+chunkSize]] = transformation.applyPacked(samples).T
+
+
+    def computeDerived(self, node, graph, rng):
+        # As Transformation.apply(): the variables are rescaled to SI base
+        # units and the result to the unit of the parameter in the project.
+        parameter      = self.projectSetup.getParameter(node)
+        transformation = parameter.transformation
+        namespace      = {}
+        units          = {}
+        for name, upstream in graph.bindings[node].items():
+            units[name]     = self.projectSetup.getParameter(upstream).unit
+            namespace[name] = toBaseUnit(self.values[:, self.columns[upstream], None], units[name])
+
+        if len(transformation.compiled.names & Transformation.variables):
+            references = getattr(parameter, "references", [])
+            if len(references) == 0:
+                return np.nan
+            packed = PackedReferences([references])
+            if self.sampleLiterature:
+                values = bootstrapReferences(packed, self.nbVariants, rng, self.referenceSpread)[0]
+            else:
+                values = np.broadcast_to(packed.values, (self.nbVariants, packed.values.shape[1]))
+            namespace["values"] = toBaseUnit(values, packed.units[0])
+            namespace["n"]      = np.sum(~np.isnan(values), axis=-1, keepdims=True).astype(float)
+            units["values"]     = packed.units[0]
+            units["n"]          = None
+
+        values = transformation.compiled(namespace)
+        if len(units) and not parameter.unit is None:
+            values = values*unitFactor(transformation.compiled.unit(units), parameter.unit)
+        return np.broadcast_to(values, (self.nbVariants,))
+
+
+    def write(self, outputDir, nbWorkers=None):
+        """
+         Write the variants in outputDir, using nbWorkers processes (by
+         default, one per CPU). Return the path of the manifest.
+        """
+        if self.values is None:
+            self.sample()
+        if nbWorkers is None:
+            nbWorkers = os.cpu_count() or 1
+
+        constants = [str(self.projectSetup.getParameter(node).value) if source == "fixed" else None
+                     for node, source in zip(self.nodes, self.sources)]
+        templates = []
+        sidecars  = []
+        for fileName in sorted(self.projectSetup.files):
+            template   = ModelTemplate(self.projectSetup.files[fileName].fileName)
+            outputName = fileName.replace(".mm_", ".")
+            try:
+                columns = [self.columns[(fileName, paramKey)] for paramKey in template.keys]
+            except KeyError:
+                raise ValueError("The file " + fileName + " has been modified since the meta-model " +
+                                 "has been loaded. The meta-model must be reloaded.")
+            templates.append((outputName, template, columns))
+
+            for noKey, column in enumerate(columns):
+                parameter = self.projectSetup.getParameter(self.nodes[column])
+                if isinstance(parameter, ArrayParameterInstance):
+                    extension   = ArrayParameterInstance.extensions[parameter.format]
+                    sidecarName = os.path.join(os.path.dirname(outputName),
+                                               os.path.basename(template.sidecarName(noKey, extension)))
+                    stagedName  = os.path.join(outputDir, ".sidecars", sidecarName)
+                    os.makedirs(os.path.dirname(stagedName), exist_ok=True)
+                    parameter.writeSidecar(stagedName)
+                    sidecars.append((os.path.abspath(stagedName), sidecarName))
+                    constants[column] = parameter.loaderReference(outputName, sidecarName)
+
+        varyingColumns = [column for column, source in enumerate(self.sources) if source != "fixed"]
+        nameWidth      = max(4, len(str(self.nbVariants-1)))
+        valuesFileName = os.path.abspath(os.path.join(outputDir, ".sidecars", "values.npy"))
+        os.makedirs(os.path.dirname(valuesFileName), exist_ok=True)
+        np.save(valuesFileName, self.values[:, varyingColumns])
+        initArgs       = (outputDir, templates, constants, varyingColumns, nameWidth, sidecars, valuesFileName)
+
+        try:
+            if nbWorkers == 1:
+                _initWorker(*initArgs)
+                _writeVariants(0, self.nbVariants)
+                _workerState.clear()
+            else:
+                chunkSize = max(1, -(-self.nbVariants//(4*nbWorkers)))
+                with ProcessPoolExecutor(nbWorkers, initializer=_initWorker, initargs=initArgs) as executor:
+                    futures = [executor.submit(_writeVariants, start, min(start+chunkSize, self.nbVariants))
+                               for start in range(0, self.nbVariants, chunkSize)]
+                    for future in futures:
+                        future.result()
+        finally:
+            os.remove(valuesFileName)
+
+        rows = self.values[:, varyingColumns].tolist()
+        return self.writeManifest(outputDir, varyingColumns, rows, nameWidth)
+
+
+    def writeManifest(self, outputDir, varyingColumns, rows, nameWidth):
+        varyingIndexes = {column:no for no, column in enumerate(varyingColumns)}
+        parameters = []
+        for column, (node, source) in enumerate(zip(self.nodes, self.sources)):
+            parameter = self.projectSetup.getParameter(node)
+            unit      = parameter.unit if not parameter.unit is None else parameter.requiredUnit
+            parameters.append({"file"  : node[0],
+                               "name"  : node[1][0],
+                               "args"  : node[1][1],
+                               "unit"  : unit,
+                               "source": source,
+                               "value" : parameter.value if source == "fixed" else None,
+                               "column": varyingIndexes.get(column)})
+
+        # NaN (undefined values) are stored as null to remain valid JSON.
+        manifest = {"project"         : self.projectSetup.path,
+                    "nbVariants"      : self.nbVariants,
+                    "seed"            : self.seed,
+                    "sampleLiterature": self.sampleLiterature,
+                    "referenceSpread" : self.referenceSpread,
+                    "parameters"      : parameters,
+                    "variants"        : [{"directory": Ensemble.variantName(noVariant, nameWidth),
+                                          "values"   : [None if value != value else value for value in row]}
+                                         for noVariant, row in enumerate(rows)]}
+
+        fileName = os.path.join(outputDir, "manifest.json")
+        with open(fileName, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        return fileName
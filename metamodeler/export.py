@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Nov  1 10:04:26 2026
+
+@author: oreilly
+"""
+
+import os
+import sys
+import csv
+import json
+import fnmatch
+import argparse
+from collections import OrderedDict
+
+from .modelParameter import ModelParameterInstance, DerivedParameterInstance, ArrayParameterInstance
+from .projectSetup import ProjectSetup
+
+
+# Streaming export of the parameters of a project, for review and archiving.
+# Records are built and written one parameter at a time, file by file, so
+# that the memory used does not depend on the size of the project (unlike
+# ProjectSetup.toJSON()). Two formats are supported:
+#     jsonl : JSON Lines, a "project" record (path and properties) followed
+#             by one "parameter" record per parameter,
+#     csv   : one row per parameter, with the columns of csvHeader. Lists
+#             (references, annotation and publication IDs) are joined with
+#             ";" and the arguments of the tags are written as JSON.
+
+exportFormats = ["jsonl", "csv"]
+
+csvHeader = ["file", "name", "args", "type", "value", "unit", "requiredUnit", "complete", "justification",
+             "transformation", "referenceIds", "annotationIds", "pubIds"]
+
+
+def parameterType(parameter):
+    if isinstance(parameter, ModelParameterInstance):
+        return "literature"
+    if isinstance(parameter, DerivedParameterInstance):
+        return "derived"
+    if isinstance(parameter, ArrayParameterInstance):
+        return "array"
+    return "custom"
+
+
+def parameterRecord(fileName, paramKey, parameter):
+    """
+     Value and provenance of a parameter: its value and unit, the
+     justification of custom values and, for literature-backed parameters,
+     the summaries of the references (IDs of the annotated instances, of
+     their annotations and publications) saved with the project, which does
+     not require the corpus.
+    """
+    record = OrderedDict([("file"          , fileName),
+                          ("name"          , paramKey[0]),
+                          ("args"          , parameter.args),
+                          ("type"          , parameterType(parameter)),
+                          ("value"         , parameter.value),
+                          ("unit"          , parameter.unit),
+                          ("requiredUnit"  , parameter.requiredUnit),
+                          ("complete"      , parameter.isComplete()),
+                          ("justification" , getattr(parameter, "justification", None)),
+                          ("transformation", None),
+                          ("references"    , [])])
+    if isinstance(parameter, (ModelParameterInstance, DerivedParameterInstance)):
+        record["transformation"] = parameter.transformation.transformationCode
+    if isinstance(parameter, ModelParameterInstance):
+        record["references"] = [OrderedDict([("id"          , ref.id),
+                                             ("value"       , ref.value),
+                                             ("unit"        , ref.unit),
+                                             ("annotationId", ref.annotationId),
+                                             ("pubId"       , ref.pubId)])
+                                for ref in parameter.references]
+    return record
+
+
+def iterRecords(projectSetup, filePatterns=None):
+    """
+     Generate the records of the parameters of projectSetup, file by file
+     (in the order of their names), restricted to the files matching one of
+     the fnmatch patterns of filePatterns if given.
+    """
+    # Values are evaluated in batch, as for the generation of the model.
+    projectSetup.evaluate()
+    for fileName in sorted(projectSetup.files):
+        if not filePatterns is None and not any([fnmatch.fnmatch(fileName, pattern) for pattern in filePatterns]):
+            continue
+        for paramKey, parameter in projectSetup.files[fileName].parameters.items():
+            yield parameterRecord(fileName, paramKey, parameter)
+
+
+def csvRow(record):
+    row = [record[column] for column in csvHeader[:10]]
+    row[2] = json.dumps(record["args"], sort_keys=True)
+    for key in ["id", "annotationId", "pubId"]:
+        row.append(";".join([str(ref[key]) for ref in record["references"] if not ref[key] is None]))
+    return ["" if value is None else value for value in row]
+
+
+def exportProject(projectSetup, f, format="jsonl", filePatterns=None):
+    """
+     Write the records of projectSetup in the opened text file f (opened
+     with newline="" for CSV). Return the number of parameters written.
+    """
+    if not format in exportFormats:
+        raise ValueError("Unknown export format: " + str(format) + ". Supported formats are " +
+                         ", ".join(exportFormats) + ".")
+    nbRecords = 0
+    if format == "jsonl":
+        f.write(json.dumps(OrderedDict([("record"    , "project"),
+                                        ("path"      , projectSetup.path),
+                                        ("properties", projectSetup.properties)]), default=str) + "\n")
+        for record in iterRecords(projectSetup, filePatterns):
+            f.write(json.dumps(OrderedDict([("record", "parameter")] + list(record.items())), default=str) + "\n")
+            nbRecords += 1
+    else:
+        writer = csv.writer(f)
+        writer.writerow(csvHeader)
+        for record in iterRecords(projectSetup, filePatterns):
+            writer.writerow(csvRow(record))
+            nbRecords += 1
+    return nbRecords
+
+
+def formatFromFileName(fileName, default="jsonl"):
+    extension = os.path.splitext(fileName)[1][1:].lower()
+    return extension if extension in exportFormats else default
+
+
+def exportProjectFile(projectSetup, fileName, format=None, filePatterns=None):
+    # As exportProject(), in fileName. The format is guessed from the
+    # extension of fileName if not given.
+    if format is None:
+        format = formatFromFileName(fileName)
+    with open(fileName, "w", newline="") as f:
+        return exportProject(projectSetup, f, format, filePatterns)
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the values, units, justifications and references " +
+                                                 "of the parameters of a project.")
+    parser.add_argument("project", help="Path of the project folder.")
+    parser.add_argument("--output", default=None, help="Output file (default: the standard output).")
+    parser.add_argument("--format", choices=exportFormats, default=None,
+                        help="Export format (default: from the extension of the output file, else jsonl).")
+    parser.add_argument("--files", nargs="*", default=None, help="Only export the meta-model files matching " +
+                                                                 "these patterns (e.g., 'channels/*').")
+    args = parser.parse_args()
+
+    projectSetup = ProjectSetup.load(args.project)
+    if projectSetup is None:
+        projectSetup = ProjectSetup(args.project)
+
+    if args.output is None:
+        format = "jsonl" if args.format is None else args.format
+        exportProject(projectSetup, sys.stdout, format, args.files)
+    else:
+        nbRecords = exportProjectFile(projectSetup, args.output, args.format, args.files)
+        print(str(nbRecords) + " parameters exported to " + args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 09:05:18 2026
+
+@author: oreilly
+"""
+
+import ast
+import operator
+import warnings
+from functools import lru_cache
+
+from .utils import lazyImport
+
+np = lazyImport("numpy")
+pq = lazyImport("quantities")
+
+
+# Small expression language used by transformations. An expression such as
+#
+#     median(values) * 2
+#     (sum(values) - max(values)) / (n - 1)
+#
+# is parsed once and compiled into a tree of Python closures operating on
+# NumPy arrays. Nothing is ever passed to eval() or exec(): only numeric
+# literals, variables, arithmetic operators and the functions listed below
+# are accepted. Since "**" cannot be used in tags, "^" also stands for the
+# power operator.
+#
+# Reference values are given along the last axis of the arrays, padded
+# with NaN when several parameters are evaluated in a single batch.
+# Reductions (mean, median, ...) ignore these NaN and keep the reduced
+# axis so that their results broadcast against other variables.
+#
+# Values are plain numbers. When the variables are in different units,
+# they are given in SI base units and the unit of the result is derived
+# from the syntax tree (see CompiledExpression.unit()).
+
+
+# Functions are given by their name in NumPy, which is only imported when
+# an expression is first evaluated.
+
+def _reduction(name):
+    return lambda x: getattr(np, name)(x, axis=-1, keepdims=True)
+
+def _elementwise(name):
+    return lambda *args: getattr(np, name)(*args)
+
+def _count(x):
+    return np.sum(~np.isnan(x), axis=-1, keepdims=True)
+
+def _first(x):
+    return x[..., :1]
+
+
+functions = {"mean"    : _reduction("nanmean"),
+             "median"  : _reduction("nanmedian"),
+             "min"     : _reduction("nanmin"),
+             "max"     : _reduction("nanmax"),
+             "sum"     : _reduction("nansum"),
+             "std"     : _reduction("nanstd"),
+             "var"     : _reduction("nanvar"),
+             "count"   : _count,
+             "first"   : _first,
+             "sqrt"    : _elementwise("sqrt"),
+             "exp"     : _elementwise("exp"),
+             "log"     : _elementwise("log"),
+             "log10"   : _elementwise("log10"),
+             "abs"     : _elementwise("abs"),
+             "minimum" : _elementwise("fmin"),
+             "maximum" : _elementwise("fmax")}
+
+# Unit of the result of the functions: that of their argument ("same"),
+# its square ("square") or its square root ("sqrt"), or no unit, either
+# always ("dimensionless") or only for dimensionless arguments
+# ("requireDimensionless"). The arguments of minimum() and maximum() must
+# have the same dimensions.
+functionUnits = {"mean"    : "same",
+                 "median"  : "same",
+                 "min"     : "same",
+                 "max"     : "same",
+                 "sum"     : "same",
+                 "std"     : "same",
+                 "var"     : "square",
+                 "count"   : "dimensionless",
+                 "first"   : "same",
+                 "sqrt"    : "sqrt",
+                 "exp"     : "requireDimensionless",
+                 "log"     : "requireDimensionless",
+                 "log10"   : "requireDimensionless",
+                 "abs"     : "same",
+                 "minimum" : "same",
+                 "maximum" : "same"}
+
+binaryOperators = {ast.Add      : operator.add,
+                   ast.Sub      : operator.sub,
+                   ast.Mult     : operator.mul,
+                   ast.Div      : operator.truediv,
+                   ast.FloorDiv : operator.floordiv,
+                   ast.Mod      : operator.mod,
+                   ast.Pow      : operator.pow}
+
+unaryOperators = {ast.USub : operator.neg,
+                  ast.UAdd : operator.pos}
+
+
+
+class CompiledExpression:
+
+    def __init__(self, code):
+        self.code  = code
+        self.names = set()
+
+        try:
+            tree = ast.parse(code.strip().replace("^", "**"), mode="eval")
+        except SyntaxError as e:
+            raise ValueError("Invalid expression '" + code + "': " + str(e.msg))
+        self.tree = tree.body
+        self.fct  = self.__compileNode(tree.body)
+
+
+    def __compileNode(self, node):
+
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+                raise ValueError("Only numerical constants are accepted in expressions. Received '" +
+                                 str(node.value) + "' in '" + self.code + "'.")
+            # Working on floats avoids unbounded integer arithmetic.
+            value = float(node.value)
+            return lambda namespace: value
+
+        if isinstance(node, ast.Name):
+            if node.id in functions:
+                raise ValueError("'" + node.id + "' is a function and must be called in '" + self.code + "'.")
+            name = node.id
+            self.names.add(name)
+            return lambda namespace: namespace[name]
+
+        if isinstance(node, ast.BinOp) and type(node.op) in binaryOperators:
+            op    = binaryOperators[type(node.op)]
+            left  = self.__compileNode(node.left)
+            right = self.__compileNode(node.right)
+            return lambda namespace: op(left(namespace), right(namespace))
+
+        if isinstance(node, ast.UnaryOp) and type(node.op) in unaryOperators:
+            op      = unaryOperators[type(node.op)]
+            operand = self.__compileNode(node.operand)
+            return lambda namespace: op(operand(namespace))
+
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or not node.func.id in functions:
+                raise ValueError("Unknown function in '" + self.code + "'. Available functions are: " +
+                                 ", ".join(sorted(functions)) + ".")
+            if len(node.keywords):
+                raise ValueError("Keyword arguments are not supported in '" + self.code + "'.")
+            fct  = functions[node.func.id]
+            args = [self.__compileNode(arg) for arg in node.args]
+            return lambda namespace: fct(*[arg(namespace) for arg in args])
+
+        raise ValueError("Unsupported syntax (" + type(node).__name__ + ") in expression '" + self.code + "'.")
+
+
+    def __call__(self, namespace):
+        """
+         Evaluate the expression. namespace maps variable names to arrays
+         whose last axis is the reference axis. The returned array has this
+         axis reduced.
+        """
+        # Rows made only of padding legitimately reduce to NaN.
+        with np.errstate(all="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            result = np.asarray(self.fct(namespace), dtype=float)
+        if result.ndim == 0:
+            return result
+        if result.shape[-1] != 1:
+            raise ValueError("The expression '" + self.code + "' must reduce the reference values " +
+                             "to a single value (e.g., using mean(values)).")
+        return result[..., 0]
+
+
+    def unit(self, units):
+        """
+         Unit of the result, in SI base units, when the values of the
+         variables are given in SI base units. units maps the variable names
+         to their units (None for dimensionless values). Raise ValueError if
+         the expression combines incompatible dimensions.
+        """
+        dimensionalities = {name:pq.Quantity(1.0, "dimensionless" if unit is None else unit).simplified.dimensionality
+                            for name, unit in units.items()}
+        return str(self.__unitOf(self.tree, dimensionalities))
+
+
+    def __sameUnit(self, dimensionalities):
+        for dimensionality in dimensionalities[1:]:
+            if dimensionality != dimensionalities[0]:
+                raise ValueError("Incompatible units (" + str(dimensionalities[0]) + " and " +
+                                 str(dimensionality) + ") are combined in '" + self.code + "'.")
+        return dimensionalities[0]
+
+
+    def __unitOf(self, node, dimensionalities):
+        dimensionless = pq.dimensionless.dimensionality
+
+        if isinstance(node, ast.Constant):
+            return dimensionless
+
+        if isinstance(node, ast.Name):
+            return dimensionalities[node.id]
+
+        if isinstance(node, ast.UnaryOp):
+            return self.__unitOf(node.operand, dimensionalities)
+
+        if isinstance(node, ast.BinOp):
+            left  = self.__unitOf(node.left, dimensionalities)
+            right = self.__unitOf(node.right, dimensionalities)
+            if isinstance(node.op, ast.Mult):
+                return left*right
+            if isinstance(node.op, ast.Div):
+                return left/right
+            if isinstance(node.op, ast.Pow):
+                self.__sameUnit([right, dimensionless])
+                if left == dimensionless:
+                    return dimensionless
+                try:
+                    exponent = float(self.__compileNode(node.right)({}))
+                except KeyError:
+                    raise ValueError("Values with units can only be raised to constant powers in '" +
+                                     self.code + "'.")
+                return left**exponent
+            return self.__sameUnit([left, right])
+
+        args = [self.__unitOf(arg, dimensionalities) for arg in node.args]
+        rule = functionUnits[node.func.id]
+        if rule == "square":
+            return args[0]**2
+        if rule == "sqrt":
+            return args[0]**0.5
+        if rule == "dimensionless":
+            return dimensionless
+        if rule == "requireDimensionless":
+            self.__sameUnit(args + [dimensionless])
+            return dimensionless
+        return self.__sameUnit(args)
+
+
+
+@lru_cache(maxsize=1024)
+def compileExpression(code):
+    # Compiled expressions are immutable, so transformations using the
+    # same code share them.
+    return CompiledExpression(code)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 26 09:41:52 2026
+
+@author: oreilly
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+from collections import deque, OrderedDict
+
+
+# Timing of the hot paths of the meta-modeler with named spans and counters.
+# Spans nest: the breakdown of an operation (a top-level span, e.g., the
+# selection of a parameter in the main window) gives the time spent in its
+# direct sub-spans (search, scoring, ...) and the counters incremented while
+# it ran. Recording is disabled by default; span() then returns a shared
+# no-op context manager and count() returns immediately. Setting the
+# environment variable METAMODELER_TRACE to a file name enables the
+# recording and exports a Chrome trace (chrome://tracing) at exit.
+
+
+class Operation:
+    """
+     Breakdown of a top-level span: its duration, the total durations of
+     its direct sub-spans and the counters incremented while it ran.
+    """
+
+    def __init__(self, name, duration, children, counts):
+        self.name     = name
+        self.duration = duration
+        self.children = children
+        self.counts   = counts
+
+    def __str__(self):
+        text = self.name + ": {:.3f} s".format(self.duration)
+        details = [name + " {:.3f} s".format(duration)
+                   for name, duration in sorted(self.children.items(), key=lambda item: -item[1])]
+        details.extend([name + " " + str(count) for name, count in sorted(self.counts.items())])
+        if len(details):
+            text += " (" + ", ".join(details) + ")"
+        return text
+
+
+
+class Span:
+
+    __slots__ = ["name", "args", "start", "children", "counts"]
+
+    def __init__(self, name, args):
+        self.name     = name
+        self.args     = args
+        self.children = {}
+        self.counts   = {}
+
+    def __enter__(self):
+        Instrumentation.stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        duration = time.perf_counter() - self.start
+        stack = Instrumentation.stack()
+        stack.pop()
+        if len(stack):
+            parent = stack[-1]
+            parent.children[self.name] = parent.children.get(self.name, 0.0) + duration
+        Instrumentation.record(self, duration, len(stack))
+        return False
+
+
+
+class NullSpan:
+    # Returned by span() when the recording is disabled.
+
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+nullSpan = NullSpan()
+
+
+
+class Instrumentation:
+
+    enabled       = False
+    maxNbEvents   = 200000  # Oldest events are dropped beyond this number.
+    events        = deque(maxlen=maxNbEvents)
+    counters      = {}
+    lastOperation = None
+    listeners     = []
+    lock          = threading.Lock()
+    local         = threading.local()
+    origin        = time.perf_counter()
+
+    @staticmethod
+    def stack():
+        # Spans currently open in the calling thread.
+        try:
+            return Instrumentation.local.stack
+        except AttributeError:
+            Instrumentation.local.stack = []
+            return Instrumentation.local.stack
+
+    @staticmethod
+    def record(span, duration, depth):
+        event = {"name": span.name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                 "ts"  : (span.start - Instrumentation.origin)*1e6, "dur": duration*1e6}
+        if len(span.args) or len(span.counts):
+            event["args"] = dict(span.args, **span.counts)
+        with Instrumentation.lock:
+            Instrumentation.events.append(event)
+            if depth != 0:
+                return
+            operation = Operation(span.name, duration, span.children, span.counts)
+            Instrumentation.lastOperation = operation
+            listeners = list(Instrumentation.listeners)
+        for listener in listeners:
+            listener(operation)
+
+
+
+def enable():
+    Instrumentation.enabled = True
+
+def disable():
+    Instrumentation.enabled = False
+
+def isEnabled():
+    return Instrumentation.enabled
+
+def reset():
+    with Instrumentation.lock:
+        Instrumentation.events.clear()
+        Instrumentation.counters.clear()
+        Instrumentation.lastOperation = None
+
+
+def span(name, **args):
+    """
+     Context manager timing the enclosed block under name. Keyword arguments
+     are attached to the event of the trace.
+    """
+    if not Instrumentation.enabled:
+        return nullSpan
+    return Span(name, args)
+
+
+def timed(name=None):
+    """
+     Decorator timing every call of the decorated function as a span named
+     name (by default, the qualified name of the function).
+    """
+    def decorator(fct):
+        spanName = fct.__qualname__ if name is None else name
+        @functools.wraps(fct)
+        def wrapper(*args, **kwargs):
+            if not Instrumentation.enabled:
+                return fct(*args, **kwargs)
+            with Span(spanName, {}):
+                return fct(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, increment=1):
+    # Increment a counter, globally and for the current operation (the
+    # top-level span open in the calling thread).
+    if not Instrumentation.enabled:
+        return
+    stack = Instrumentation.stack()
+    if len(stack):
+        stack[0].counts[name] = stack[0].counts.get(name, 0) + increment
+    with Instrumentation.lock:
+        Instrumentation.counters[name] = Instrumentation.counters.get(name, 0) + increment
+
+
+def addListener(listener):
+    # listener(operation) is called, from the thread that ran it, at the
+    # end of every top-level span.
+    with Instrumentation.lock:
+        Instrumentation.listeners.append(listener)
+
+def removeListener(listener):
+    with Instrumentation.lock:
+        if listener in Instrumentation.listeners:
+            Instrumentation.listeners.remove(listener)
+
+
+def summary():
+    """
+     Number of calls, total, mean and maximal durations (in seconds) of
+     every span name, sorted by decreasing total duration.
+    """
+    with Instrumentation.lock:
+        events = list(Instrumentation.events)
+    stats = {}
+    for event in events:
+        nb, total, maximum = stats.get(event["name"], (0, 0.0, 0.0))
+        duration = event["dur"]*1e-6
+        stats[event["name"]] = (nb + 1, total + duration, max(maximum, duration))
+    return OrderedDict([(name, OrderedDict([("calls", nb), ("total", total), ("mean", total/nb), ("max", maximum)]))
+                        for name, (nb, total, maximum) in sorted(stats.items(), key=lambda item: -item[1][1])])
+
+
+def exportTrace(fileName):
+    """
+     Write the recorded spans in the Chrome trace event format (to be opened
+     with chrome://tracing or Perfetto). The counters and the summary of the
+     spans are included as "otherData".
+    """
+    with Instrumentation.lock:
+        events   = list(Instrumentation.events)
+        counters = dict(Instrumentation.counters)
+    with open(fileName, "w") as f:
+        json.dump({"traceEvents"    : events,
+                   "displayTimeUnit": "ms",
+                   "otherData"      : {"counters": counters, "summary": summary()}}, f)
+
+
+if os.environ.get("METAMODELER_TRACE"):
+    enable()
+    atexit.register(exportTrace, os.environ["METAMODELER_TRACE"])
@@ -4,24 +4,32 @@ __author__ = "Christian O'Reilly"
 
 # Standard imports
 import os
-import re
-import numpy as np
 from copy import copy
 
 # Contributed libraries imports
 from PySide import QtGui, QtCore
 
 # Local imports
-from .projectParameterWgt import ProjectParameterModel
+from .projectParameterWgt import ProjectParameterModel, TagCompleterDelegate
 from .proposer import PropositionTableModel
-from .modelParameter import ModelParameterInstance, CustomParameterInstance
+from .paramListModel import ParameterListModel
+from .modelParameter import (ModelParameterInstance, CustomParameterInstance, DerivedParameterInstance,
+                             ArrayParameterInstance)
 from .settingsDlg import getSettings
-from .tagParser import TagParser
 from .projectSetup import ProjectSetup
+from .session import SessionRecorder
+from .export import exportProjectFile
+from .watcher import ProjectWatcher, applyChanges
+from .backgroundJob import BackgroundJob
+from .ontologyIndex import OntologyIndex
+from .corpus import openCorpus
+from .service import (connectService, RemoteSearcher, RemoteReferenceManager, RemoteCorpus,
+                      RemoteOntologyIndex)
+from . import instrumentation
 
 # Import from nat
 from nat.modelingParameter import getParameterTypes
-from nat.annotationSearch import ParameterSearch, ConditionAtom, CompiledCorpus
+from nat.annotationSearch import ConditionAtom
 from nat.gitManager import GitManager
 from nat.tag import Tag
 
@@ -43,13 +51,54 @@ def stripIncomplete(string):
 
 
 
+class SingleShotTimer:
+    # Timer of the autosave (see AutoSaver) calling back from the GUI thread,
+    # so that the project is pickled while it cannot be modified.
+
+    def __init__(self, delay, callback):
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(callback)
+        self.timer.start(int(delay*1000))
+
+    def cancel(self):
+        self.timer.stop()
+
+
+
 class Window(QtGui.QMainWindow):
+
+    # Emitted with the breakdown of every timed operation, possibly from
+    # another thread (e.g., background jobs and autosaves).
+    operationTimed = QtCore.Signal(object)
+
+    # Emitted by the watcher thread with the names of the changed
+    # meta-model files (see watcher.py).
+    metamodelFilesChanged = QtCore.Signal(object)
+
     def __init__(self):
         super(Window, self).__init__()
 
 
         self.interfaceSetup = False
         self.sourceRef = None
+        self.sessionRecorder = None
+        self.job = None
+        self.jobDescription = None
+        self.watcher = None
+        self.pendingChanges = set() # Changes received while a job runs (None: all files)
+
+        # If METAMODELER_SERVICE is set (to 1 for the default socket, else
+        # to the path of its socket), a running service of the user provides
+        # the ontologies and, if it serves the same corpus, the searches and
+        # the publication information (see service.py).
+        self.service = None
+        if os.environ.get("METAMODELER_SERVICE"):
+            socketPath   = os.environ["METAMODELER_SERVICE"]
+            self.service = connectService(None if socketPath == "1" else socketPath)
+        if not self.service is None:
+            OntologyIndex.sharedIndex = RemoteOntologyIndex(self.service)
+
         self.setupMenus()
         self.setupWindowsUI()
         self.dbPath = '/home/oreilly/Dropbox/code/curator/DB/'
@@ -64,9 +113,34 @@ class Window(QtGui.QMainWindow):
         self.gitMng = GitManager(self.settings.config["GIT"])
 
         self.dbPath   = os.path.abspath(self.settings.config["GIT"]["local"])        
-        self.compiledCorpus = CompiledCorpus(os.path.join(self.dbPath, "annotations.bin"))    
-        self.compiledCorpus.compileCorpus(pathDB=self.dbPath)
-        self.searcher = ParameterSearch(pathDB=self.dbPath, compiledCorpus=self.compiledCorpus)
+        if self.service is None or self.service.call("status")["dbPath"] != self.dbPath:
+            self.searcher = openCorpus(self.dbPath)
+        else:
+            self.searcher = RemoteSearcher(self.service)
+            self.propositionTableModel.refMng = RemoteReferenceManager(self.service)
+            ModelParameterInstance.referenceStore.setCorpus(RemoteCorpus(self.service))
+
+        self.operationTimed.connect(self.showOperation)
+        self.metamodelFilesChanged.connect(self.watchedFilesChanged)
+        self.timingListener = self.operationTimed.emit
+        instrumentation.addListener(self.timingListener)
+
+        if os.environ.get("METAMODELER_SESSION"):
+            self.startSessionRecording(os.environ["METAMODELER_SESSION"])
+
+
+    def closeEvent(self, event):
+        self.stopWatching()
+        if not self.job is None:
+            self.job.cancel()
+            self.job.wait()
+        instrumentation.removeListener(self.timingListener)
+        self.stopSessionRecording()
+        if not self.projectSetup is None:
+            self.projectSetup.flush()
+        if not self.service is None:
+            self.service.close()
+        super(Window, self).closeEvent(event)
 
 
     def editPreferences(self):
@@ -87,20 +161,123 @@ class Window(QtGui.QMainWindow):
         exitAction.setStatusTip('Exit application')
         exitAction.triggered.connect(self.close)
 
+        exportValuesAction = QtGui.QAction(QtGui.QIcon(), 'E&xport values...', self)
+        exportValuesAction.setStatusTip('Save the values, units, justifications and references of the parameters')
+        exportValuesAction.triggered.connect(self.exportValues)
+
         openPreferencesAction = QtGui.QAction(QtGui.QIcon(), '&Preferences', self)
         openPreferencesAction.setStatusTip('Edit preferences')
         openPreferencesAction.triggered.connect(self.editPreferences)
 
 
+        self.recordTimingsAction = QtGui.QAction(QtGui.QIcon(), '&Record timings', self)
+        self.recordTimingsAction.setStatusTip('Time the operations and show their breakdown in the status bar')
+        self.recordTimingsAction.setCheckable(True)
+        self.recordTimingsAction.setChecked(instrumentation.isEnabled())
+        self.recordTimingsAction.toggled.connect(self.recordTimingsToggled)
+
+        exportTimingsAction = QtGui.QAction(QtGui.QIcon(), '&Export timings...', self)
+        exportTimingsAction.setStatusTip('Save the recorded timings as a Chrome trace')
+        exportTimingsAction.triggered.connect(self.exportTimings)
+
+        self.recordSessionAction = QtGui.QAction(QtGui.QIcon(), 'Record &session...', self)
+        self.recordSessionAction.setStatusTip('Record the actions of this session so that they can be replayed')
+        self.recordSessionAction.setCheckable(True)
+        self.recordSessionAction.toggled.connect(self.recordSessionToggled)
+
+        self.watchAction = QtGui.QAction(QtGui.QIcon(), '&Watch meta-model files', self)
+        self.watchAction.setStatusTip('Update the project and regenerate the model when the meta-model files change')
+        self.watchAction.setCheckable(True)
+        self.watchAction.toggled.connect(self.watchToggled)
+
         self.statusBar()
 
         menubar = self.menuBar()
         fileMenu = menubar.addMenu('&File')
+        fileMenu.addAction(exportValuesAction)
+        fileMenu.addSeparator()
         fileMenu.addAction(exitAction)
 
         editMenu = menubar.addMenu('&Edit')
         editMenu.addAction(openPreferencesAction)
 
+        toolsMenu = menubar.addMenu('&Tools')
+        toolsMenu.addAction(self.recordTimingsAction)
+        toolsMenu.addAction(exportTimingsAction)
+        toolsMenu.addSeparator()
+        toolsMenu.addAction(self.recordSessionAction)
+        toolsMenu.addSeparator()
+        toolsMenu.addAction(self.watchAction)
+
+
+    def recordTimingsToggled(self, checked):
+        if checked:
+            instrumentation.enable()
+        else:
+            instrumentation.disable()
+
+
+    def exportTimings(self):
+        fileName = QtGui.QFileDialog.getSaveFileName(self, "Export timings", "trace.json", "Chrome trace (*.json)")[0]
+        if fileName != "":
+            instrumentation.exportTrace(fileName)
+
+
+    def exportValues(self):
+        # Not while a background job may modify the project.
+        if self.projectSetup is None or not self.job is None:
+            return
+        fileName = QtGui.QFileDialog.getSaveFileName(self, "Export values", "values.jsonl",
+                                                     "JSON Lines (*.jsonl);;CSV (*.csv)")[0]
+        if fileName != "":
+            nbRecords = exportProjectFile(self.projectSetup, fileName)
+            self.statusBar().showMessage(str(nbRecords) + " parameters exported to " + fileName)
+
+
+    def showOperation(self, operation):
+        # Autosaves are recorded but not shown, so that the status bar keeps
+        # the last operation of the user.
+        if operation.name == "ProjectSetup.autosave":
+            return
+        self.statusBar().showMessage(str(operation))
+
+
+    def recordSessionToggled(self, checked):
+        if checked == (not self.sessionRecorder is None):
+            return
+        if not checked:
+            self.stopSessionRecording()
+            return
+        fileName = QtGui.QFileDialog.getSaveFileName(self, "Record session", "session.jsonl",
+                                                     "Session (*.jsonl)")[0]
+        if fileName == "":
+            self.recordSessionAction.setChecked(False)
+            return
+        self.startSessionRecording(fileName)
+
+
+    def startSessionRecording(self, fileName):
+        self.stopSessionRecording()
+        self.sessionRecorder = SessionRecorder(fileName)
+        # A session replayed from the middle of the work on a project
+        # starts by opening it.
+        if not self.projectSetup is None:
+            self.recordAction("openProject", path=self.projectPath)
+        self.recordSessionAction.setChecked(True)
+
+
+    def stopSessionRecording(self):
+        if not self.sessionRecorder is None:
+            self.sessionRecorder.close()
+            self.sessionRecorder = None
+        self.recordSessionAction.setChecked(False)
+
+
+    def recordAction(self, action, **args):
+        # See session.py for the recorded actions and their arguments.
+        if not self.sessionRecorder is None:
+            self.sessionRecorder.record(action, **args)
+
 
     def setupWindowsUI(self) :
 
@@ -110,6 +287,7 @@ class Window(QtGui.QMainWindow):
         self.setupPropositionsGB()
         self.setupCustomGB()
         self.setupSourceGB()
+        self.setupJobUI()
 
         # Main layout
         self.mainGrid = QtGui.QSplitter(QtCore.Qt.Vertical, self)
@@ -176,6 +354,7 @@ class Window(QtGui.QMainWindow):
         self.projectParamView      = RequiredTagsTableView()
         self.projectParamModel     = ProjectParameterModel(self)
         self.projectParamView.setModel(self.projectParamModel)
+        self.projectParamView.setItemDelegateForColumn(1, TagCompleterDelegate(self))
         self.projectParamView.setEnabled(False)
         self.projectParamModel.dataChanged.connect(self.projectPropertiesChanged)
 
@@ -200,9 +379,11 @@ class Window(QtGui.QMainWindow):
         self.reloadBtn.setDisabled(True)
 
     @QtCore.Slot(object, Tag)
+    @instrumentation.timed("Window.projectPropertiesChanged")
     def projectPropertiesChanged(self, tag):
         self.projectSetup.properties = self.projectParamModel.getParamDict()
-        self.projectSetup.save()
+        self.recordAction("editProperties", properties=self.projectSetup.properties)
+        self.projectSetup.markDirty()
         
         # Refresh the proposition table so that the coloring reflect
         # the project properties.
@@ -212,8 +393,9 @@ class Window(QtGui.QMainWindow):
 
     def setupParamGB(self):
         # Widgets
-        self.paramList        = QtGui.QListWidget()
-        self.paramList.setSortingEnabled(True)
+        self.paramList        = QtGui.QListView()
+        self.paramListModel   = ParameterListModel(self, isKnownType=lambda name: not self.getIDFromName(name) is None)
+        self.paramList.setModel(self.paramListModel)
         self.codeText        = QtGui.QTextEdit()
 
         # Layout
@@ -223,7 +405,7 @@ class Window(QtGui.QMainWindow):
         grid.addWidget(self.codeText, 0, 1)
 
         # Signals
-        self.paramList.currentTextChanged.connect(self.parameterSelected)
+        self.paramList.selectionModel().currentChanged.connect(self.currentParameterChanged)
 
         # Initial behavior
         self.codeText.setWordWrapMode(QtGui.QTextOption.NoWrap)
@@ -238,18 +420,61 @@ class Window(QtGui.QMainWindow):
         self.propositionTblWdg.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
         #self.propositionTblWdg.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
         self.propositionTblWdg.setSelectionMode(QtGui.QAbstractItemView.MultiSelection)
+        self.propositionFilterColumn   = QtGui.QComboBox(self)
+        self.propositionFilterTxt      = QtGui.QLineEdit(self)
 
         # Layout
         self.propositionsGroupBox     = QtGui.QGroupBox("Proposed values from curated literature")
         grid                         = QtGui.QGridLayout(self.propositionsGroupBox)
-        grid.addWidget(self.propositionTblWdg, 0, 0)
+        grid.addWidget(QtGui.QLabel("Filter"), 0, 0)
+        grid.addWidget(self.propositionFilterColumn, 0, 1)
+        grid.addWidget(self.propositionFilterTxt, 0, 2)
+        grid.addWidget(self.propositionTblWdg, 1, 0, 1, 3)
 
 
         # Signals
         selection = self.propositionTblWdg.selectionModel()
         selection.selectionChanged.connect(self.selectedPropositionChanged)
-        self.propositionTblWdg.model().emit(QtCore.SIGNAL("layoutChanged()"))
+        self.propositionFilterTxt.textChanged.connect(self.propositionFilterChanged)
+        self.propositionFilterColumn.currentIndexChanged.connect(self.propositionFilterChanged)
+        self.propositionTableModel.modelReset.connect(self.propositionsReset)
+
         # Initial behavior
+        # No sort indicator: the propositions are initially ranked by score.
+        self.propositionTblWdg.horizontalHeader().setSortIndicator(-1, QtCore.Qt.AscendingOrder)
+        self.propositionTblWdg.setSortingEnabled(True)
+        self.refreshPropositionFilterColumns()
+
+
+    def refreshPropositionFilterColumns(self):
+        header = ["All columns"] + self.propositionTableModel.header
+        if header == [self.propositionFilterColumn.itemText(no) for no in range(self.propositionFilterColumn.count())]:
+            return
+        current = self.propositionFilterColumn.currentText()
+        self.propositionFilterColumn.blockSignals(True)
+        self.propositionFilterColumn.clear()
+        self.propositionFilterColumn.addItems(header)
+        self.propositionFilterColumn.setCurrentIndex(max(0, self.propositionFilterColumn.findText(current)))
+        self.propositionFilterColumn.blockSignals(False)
+
+
+    def propositionFilterChanged(self, *args):
+        model = self.propositionTableModel
+        model.filters.clear()
+        key = None if self.propositionFilterColumn.currentIndex() <= 0 else self.propositionFilterColumn.currentText()
+        model.setFilter(key, self.propositionFilterTxt.text())
+
+
+    def propositionsReset(self):
+        # The propositions have been refreshed, sorted or filtered: the
+        # selection of the references of the parameter must be restored.
+        self.refreshPropositionFilterColumns()
+        if self.projectSetup is None or self.projectFiles.currentItem() is None:
+            return
+        if self.paramListModel.keyAt(self.paramList.currentIndex().row()) is None:
+            return
+        if isinstance(self.selectedParameter, ModelParameterInstance):
+            self.loadParamValues(None)
 
 
 
@@ -289,23 +514,176 @@ class Window(QtGui.QMainWindow):
 
 
     def openProject(self):
-        self.projectPath = QtGui.QFileDialog.getExistingDirectory(self, "Select project folder", options = QtGui.QFileDialog.ShowDirsOnly)
-        self.projectSetup = ProjectSetup.load(self.projectPath)
-
-        if self.projectSetup is None:
-            self.projectSetup = ProjectSetup(self.projectPath)
+        projectPath = QtGui.QFileDialog.getExistingDirectory(self, "Select project folder", options = QtGui.QFileDialog.ShowDirsOnly)
+        if projectPath == "":
+            return
+        self.loadProject(projectPath)
+
+
+    @instrumentation.timed("Window.openProject")
+    def loadProject(self, projectPath):
+        # Timed apart from openProject() so that the dialog is not included.
+        self.recordAction("openProject", path=projectPath)
+        if not self.projectSetup is None:
+            self.projectSetup.flush()
+        projectSetup = ProjectSetup.load(projectPath)
+
+        if projectSetup is None:
+            try:
+                projectSetup = ProjectSetup(projectPath)
+            except ValueError as e:
+                # E.g., unknown, ambiguous or cyclic dependencies between
+                # parameters. The current project, if any, stays open.
+                QtGui.QMessageBox.critical(self, "Invalid meta-model", str(e))
+                return
+        self.projectPath  = projectPath
+        self.projectSetup = projectSetup
+        self.projectSetup.enableAutosave(timerFactory=SingleShotTimer)
 
         self.projectParamView.setEnabled(True)
         self.reloadBtn.setEnabled(True)
         self.projectParamModel.setParamDict(self.projectSetup.properties)
         self.refreshFileList()
+        if self.watchAction.isChecked():
+            self.startWatching()
+
+
+    def watchToggled(self, checked):
+        if checked:
+            self.startWatching()
+        else:
+            self.stopWatching()
+
+
+    def startWatching(self):
+        self.stopWatching()
+        if self.projectSetup is None:
+            return
+        self.watcher = ProjectWatcher(self.projectSetup.path, self.metamodelFilesChanged.emit)
+        self.watcher.start()
+
+
+    def stopWatching(self):
+        if not self.watcher is None:
+            self.watcher.stop()
+            self.watcher = None
+        self.pendingChanges = set()
+
+
+    @instrumentation.timed("Window.filesChanged")
+    def watchedFilesChanged(self, names):
+        # Changes are applied once the running job (e.g., a reload) is done.
+        if not self.job is None:
+            if names is None or self.pendingChanges is None:
+                self.pendingChanges = None
+            else:
+                self.pendingChanges.update(names)
+            return
+        self.recordAction("filesChanged", names=names)
+        try:
+            generated = applyChanges(self.projectSetup, names)
+        except ValueError as e:
+            self.statusBar().showMessage("Invalid meta-model: " + str(e))
+            return
+        self.updateFileItems(names)
+        message = ("Meta-model reloaded" if names is None else "Updated " + ", ".join(names))
+        if len(generated):
+            message += "; regenerated " + ", ".join(generated)
+        self.statusBar().showMessage(message + ".", 5000)
+
+
+    def setupJobUI(self):
+        # Progress of the background jobs, shown in the status bar.
+        self.jobProgressBar = QtGui.QProgressBar(self)
+        self.cancelJobBtn   = QtGui.QPushButton("Cancel", self)
+        self.statusBar().addPermanentWidget(self.jobProgressBar)
+        self.statusBar().addPermanentWidget(self.cancelJobBtn)
+        self.cancelJobBtn.clicked.connect(self.cancelJob)
+        self.jobProgressBar.setVisible(False)
+        self.cancelJobBtn.setVisible(False)
+
+
+    def startJob(self, description, fct, onSuccess):
+        """
+         Run fct(progress, isCancelled) in the background (see BackgroundJob).
+         onSuccess(result) is called from the GUI thread once it is done. The
+         project cannot be modified while the job runs.
+        """
+        if not self.job is None:
+            return
+        self.jobDescription = description
+        self.job = BackgroundJob(fct, self)
+        self.job.progressed.connect(self.jobProgressed)
+        self.job.succeeded.connect(onSuccess)
+        self.job.failed.connect(self.jobFailed)
+        self.job.cancelled.connect(self.jobCancelled)
+        self.job.finished.connect(self.jobFinished)
+        self.setJobRunning(True)
+        self.job.start()
+
+
+    def setJobRunning(self, running):
+        self.jobProgressBar.setRange(0, 0) # Busy until the first progress
+        self.jobProgressBar.setVisible(running)
+        self.cancelJobBtn.setVisible(running)
+        self.cancelJobBtn.setEnabled(running)
+        for widget in [self.openProjectBtn, self.reloadBtn, self.projectFiles, self.projectParamView,
+                       self.paramsGroupBox, self.sourceGroupBox, self.sourceStack]:
+            widget.setEnabled(not running)
+        self.generateBtn.setEnabled(not running and self.projectSetup.isComplete())
+        if running:
+            self.statusBar().showMessage(self.jobDescription + "...")
+
+
+    def cancelJob(self):
+        if not self.job is None:
+            self.job.cancel()
+            self.cancelJobBtn.setEnabled(False)
+
+
+    def jobProgressed(self, done, total, name):
+        self.jobProgressBar.setRange(0, total)
+        self.jobProgressBar.setValue(done)
+        self.statusBar().showMessage(self.jobDescription + ": " + name)
+
+
+    def jobFailed(self, exception, trace):
+        QtGui.QMessageBox.critical(self, "Error", self.jobDescription + " failed: " + str(exception))
+
+
+    def jobCancelled(self):
+        self.statusBar().showMessage(self.jobDescription + " cancelled.", 5000)
+
+
+    def jobFinished(self):
+        self.job.deleteLater()
+        self.job = None
+        self.setJobRunning(False)
+        if self.pendingChanges is None or len(self.pendingChanges):
+            names = None if self.pendingChanges is None else sorted(self.pendingChanges)
+            self.pendingChanges = set()
+            self.watchedFilesChanged(names)
 
 
     def reloadMetamodel(self):
-        self.projectSetup.reloadMM()
+        # The files are parsed in the background and the project is only
+        # updated once they all are, so that a cancelled or failed reload
+        # leaves it unchanged.
+        self.recordAction("reloadMetamodel")
+        self.startJob("Reloading the meta-model", self.projectSetup.scanMM, self.metamodelScanned)
+
+
+    @instrumentation.timed("Window.applyMetamodel")
+    def metamodelScanned(self, files):
+        try:
+            self.projectSetup.applyMM(files)
+        except ValueError as e:
+            # E.g., unknown, ambiguous or cyclic dependencies between parameters.
+            QtGui.QMessageBox.critical(self, "Invalid meta-model", str(e))
+            return
         self.projectParamModel.setParamDict(self.projectSetup.properties)
         self.refreshFileList()
-        self.paramList.clear()
+        self.paramListModel.clear()
 
 
     def refreshFileList(self):
@@ -321,21 +699,72 @@ class Window(QtGui.QMainWindow):
 
 
 
-    def refreshFileStatus(self):
+    def updateFileItems(self, names):
+        # Incremental version of refreshFileList() after the files of names
+        # have been parsed again: their items are added or removed, the
+        # status of all the items is updated (derived parameters can make
+        # other files change status) and the parameter list is refreshed if
+        # the current file is among them.
+        if names is None:
+            self.refreshFileList()
+            self.paramListModel.clear()
+            return
+        items = {}
+        for row in range(self.projectFiles.count()):
+            item = self.projectFiles.item(row)
+            items[stripIncomplete(item.text())] = item
+        current = self.projectFiles.currentItem()
+        currentName = None if current is None else stripIncomplete(current.text())
+
+        for name in names:
+            if name in items and not name in self.projectSetup.files:
+                self.projectFiles.takeItem(self.projectFiles.row(items[name]))
+            elif not name in items and name in self.projectSetup.files:
+                self.projectFiles.addItem(IncompleteItem(name))
+        self.refreshFileStatus()
 
-        row = self.projectFiles.currentRow()
-        fileName = self.projectFiles.item(row).text()
-        fileName = stripIncomplete(fileName)
+        if currentName in names and currentName in self.projectSetup.files:
+            paramKey = self.paramListModel.keyAt(self.paramList.currentIndex().row())
+            self.refreshParamList(currentName)
+            index = self.paramListModel.indexFromKey(paramKey)
+            if index.isValid():
+                self.paramList.setCurrentIndex(index)
+
+
+    def refreshFileStatus(self):
+        # Derived parameters can make other files than the current one
+        # change status.
+        for row in range(self.projectFiles.count()):
+            item = self.projectFiles.item(row)
+            fileName = stripIncomplete(item.text())
 
-        if not self.projectSetup.files[fileName].isComplete():
-            fileName = "* " + fileName
+            if not self.projectSetup.files[fileName].isComplete():
+                fileName = "* " + fileName
 
-        self.projectFiles.item(row).setText(fileName)
+            if item.text() != fileName:
+                item.setText(fileName)
         self.generateBtn.setEnabled(self.projectSetup.isComplete())
 
 
     def generateModel(self):
-        self.projectSetup.generateModel()
+        if not self.job is None:
+            return
+        self.recordAction("generateModel")
+        # Values are evaluated from the GUI thread, so that the job only
+        # reads the project while the views and the autosave access it.
+        try:
+            self.projectSetup.evaluate()
+        except ValueError as e:
+            # E.g., derived parameters with incompatible units.
+            QtGui.QMessageBox.critical(self, "Error", "Generating the model failed: " + str(e))
+            return
+        self.startJob("Generating the model",
+                      lambda progress, isCancelled: self.projectSetup.generateModel(progress, isCancelled, False),
+                      self.modelGenerated)
+
+
+    def modelGenerated(self, result):
+        self.statusBar().showMessage("Model generated.", 5000)
 
     def getIDFromName(self, paramName):
         paramID = None
@@ -349,92 +778,62 @@ class Window(QtGui.QMainWindow):
 
     def fileSelected(self, fileName):
         if fileName != "":
+            self.recordAction("selectFile", fileName=stripIncomplete(fileName))
             self.refreshParamList(fileName)
 
 
 
-    def refreshParamList(self, fileName, resetIndex = True):
-
-        if resetIndex == False:
-            row = self.paramList.currentRow()
-
-        self.paramList.clear()
-
+    def refreshParamList(self, fileName):
         fileName = stripIncomplete(fileName)
+        self.paramListModel.setFileSetup(self.projectSetup.files[fileName])
 
-        for (name, args), param in self.projectSetup.files[fileName].parameters.items():
-            if param.isComplete():
-                item = IncompleteItem(name + "(" + str(args) + ")")
-            else:
-                item = IncompleteItem("* " + name + "(" + str(args) + ")")
 
-            paramID = self.getIDFromName(name)
-            if paramID is None:
-                item.setBackground(QtCore.Qt.lightGray)
-            self.paramList.addItem(item)
-
-        if resetIndex == False:
-            self.paramList.setCurrentRow(row)
+    def currentParameterChanged(self, current, previous):
+        if not current.isValid():
+            return
+        self.parameterSelected(self.paramListModel.data(current, QtCore.Qt.DisplayRole))
 
 
 
-    def updateCodeContext(self, parameterStr):
+    @instrumentation.timed("Window.updateCodeContext")
+    def updateCodeContext(self, paramKey):
         nbLineContext = 3
         fileName = stripIncomplete(self.projectFiles.currentItem().text())
 
-        with open(os.path.join(self.projectPath, fileName), 'r') as f:
-            lines = f.readlines()
-
-
-        
-        reStr = TagParser.getREStr(paramName=parameterStr.split("(")[0])          
-        p = re.compile(reStr)
-        parser = TagParser()
-
-        hits = []
-        for noLine, line in enumerate(lines):
-            if not p.search(line) is None:
-                paramTagStr =  line.split("#|")[1].split("|#")[0]
-                name, args = parser.getParamKey("#|" + paramTagStr + "|#")
-                if name + "(" + str(args) + ")" == parameterStr:
-                    hits.extend(range(max(noLine-nbLineContext, 0), min(noLine+nbLineContext+1, len(lines))))
-
-        hits = np.unique(hits)
-        lastAddedLine = -1
-        codeText = ""
-        for hit in hits:
-            if hit - lastAddedLine > 1 :
-                codeText += "[...]\n"
-            codeText += str(hit+1).ljust(5) + lines[hit]
-            lastAddedLine = hit
-
-        if lastAddedLine < len(lines)-1:
-            codeText += "[...]\n"
+        contextIndex = self.projectSetup.files[fileName].getContextIndex(self.projectPath)
+        codeText, highlights = contextIndex.getContext(paramKey, nbLineContext)
         self.codeText.setText(codeText)
 
-        match = p.search(codeText)
         fmt = QtGui.QTextCharFormat()
         fmt.setBackground(QtCore.Qt.yellow)
         cursor = QtGui.QTextCursor(self.codeText.document())
-        cursor.setPosition(match.start(), QtGui.QTextCursor.MoveAnchor)
-        cursor.setPosition(match.end(), QtGui.QTextCursor.KeepAnchor)
-        cursor.setCharFormat(fmt)
+        for start, end in highlights:
+            cursor.setPosition(start, QtGui.QTextCursor.MoveAnchor)
+            cursor.setPosition(end, QtGui.QTextCursor.KeepAnchor)
+            cursor.setCharFormat(fmt)
 
 
 
 
 
+    @instrumentation.timed("Window.parameterSelected")
     def parameterSelected(self, parameterStr):
-
         if parameterStr == "":
             return
         needLoading = parameterStr[:2] != "* "
 
         parameterStr = stripIncomplete(parameterStr)
+        self.recordAction("selectParameter", paramKey=list(self.__selectedParameter()[1]))
 
-        self.updateCodeContext(parameterStr)
+        self.updateCodeContext(self.__selectedParameter()[1])
         paramName = parameterStr.split("(")[0]
-        if self.getIDFromName(paramName) is None:
+        isDerived = isinstance(self.selectedParameter, DerivedParameterInstance)
+        self.saveCustomBtn.setEnabled(not isDerived)
+        if isinstance(self.selectedParameter, ArrayParameterInstance):
+            self.customValue.setPlaceholderText("Path of a .npy file")
+        else:
+            self.customValue.setPlaceholderText("")
+        if self.getIDFromName(paramName) is None or isDerived:
             self.fromLitRadio.setEnabled(False)
             self.customRadio.setChecked(True)
         else:
@@ -450,9 +849,7 @@ class Window(QtGui.QMainWindow):
 
 
     def __selectedParameter(self):
-        paramKey = stripIncomplete(self.paramList.currentItem().text())
-        paramName = paramKey.split("(")[0]
-        paramKey = (paramName, paramKey[len(paramName)+1:-1])
+        paramKey = self.paramListModel.keyAt(self.paramList.currentIndex().row())
         fileName = stripIncomplete(self.projectFiles.currentItem().text())
         return fileName, paramKey
    
@@ -464,7 +861,19 @@ class Window(QtGui.QMainWindow):
     @selectedParameter.setter
     def selectedParameter(self, param):
         fileName, paramKey = self.__selectedParameter()
-        self.projectSetup.files[fileName].parameters[paramKey] = param
+        self.projectSetup.setParameter(fileName, paramKey, param)
+
+
+    def parameterValueChanged(self):
+        # Refresh the selected parameter along with the parameters
+        # depending on it.
+        fileName, paramKey = self.__selectedParameter()
+        updated = self.projectSetup.parameterChanged(fileName, paramKey)
+        for nodeFileName, nodeParamKey in [(fileName, paramKey)] + updated:
+            if nodeFileName == fileName:
+                self.paramListModel.parameterChanged(nodeParamKey)
+        self.refreshFileStatus()
+        self.projectSetup.markDirty()
         
         
         
@@ -478,18 +887,35 @@ class Window(QtGui.QMainWindow):
             self.customUnit.setText(selectedParameter.unit)
             self.justification.setText(selectedParameter.justification)
 
+        elif isinstance(selectedParameter, DerivedParameterInstance):
+            self.customRadio.setChecked(True)
+            self.customValue.setText(str(selectedParameter.value))
+            self.customUnit.setText(selectedParameter.unit)
+            self.justification.setText("Computed from other parameters: " + 
+                                       selectedParameter.transformation.transformationCode)
+
         elif isinstance(selectedParameter, ModelParameterInstance):
             self.fromLitRadio.setChecked(True)
 
+            # The selection is built at once and applied in a single call,
+            # without emitting a selection signal per row.
+            model      = self.propositionTblWdg.model()
+            rows       = model.rowsOfIds(set(selectedParameter.ids))
+            selection  = QtGui.QItemSelection()
+            lastColumn = max(0, model.columnCount()-1)
+            if len(rows):
+                model.fetchUpTo(rows[-1])
+            for firstRow, lastRow in PropositionTableModel.rowRanges(rows):
+                selection.select(model.index(firstRow, 0), model.index(lastRow, lastColumn))
+
             self.noUpdatePropositionSelection = True
-            self.propositionTblWdg.selectionModel().clearSelection()
-            for noProposition, proposition in enumerate(self.propositionTblWdg.model().propositions):
-                if proposition["obj_parameter"].id in selectedParameter.ids :
-                    #self.propositionTblWdg.selectRow(noProposition)
-                    selected = self.propositionTblWdg.model().index(noProposition, 0)
-                    flags = QtGui.QItemSelectionModel.Select | QtGui.QItemSelectionModel.Rows
-                    self.propositionTblWdg.selectionModel().select(selected, flags)
+            selectionModel = self.propositionTblWdg.selectionModel()
+            selectionModel.blockSignals(True)
+            selectionModel.select(selection, QtGui.QItemSelectionModel.ClearAndSelect |
+                                             QtGui.QItemSelectionModel.Rows)
+            selectionModel.blockSignals(False)
             self.noUpdatePropositionSelection = False
+            self.propositionTblWdg.viewport().update()
 
         else:
             raise TypeError("selectedParameter should be of type CustomParameterInstance or ParameterInstance. Type passed: " + str(type(selectedParameter)))
@@ -501,7 +927,7 @@ class Window(QtGui.QMainWindow):
 
     def proposeValuesFromCuration(self):
 
-        paramName = stripIncomplete(self.paramList.currentItem().text()).split("(")[0]
+        paramName = self.paramListModel.keyAt(self.paramList.currentIndex().row())[0]
         #paramID = None
         #
         #for paramType in self.parameterTypes:
@@ -517,7 +943,8 @@ class Window(QtGui.QMainWindow):
         self.searcher.setSearchConditions(ConditionAtom("Parameter name", paramName))
         self.searcher.expandRequiredTags = True
         self.searcher.onlyCentralTendancy = True
-        resultDF = self.searcher.search()   
+        with instrumentation.span("ParameterSearch.search"):
+            resultDF = self.searcher.search()   
         
         args = copy(self.projectParamModel.getParamDict())
         args.update(self.selectedParameter.args)  
@@ -526,13 +953,14 @@ class Window(QtGui.QMainWindow):
         
 
 
+    @instrumentation.timed("Window.selectedPropositionChanged")
     def selectedPropositionChanged(self, selected, deselected):
 
         if self.noUpdatePropositionSelection:
             return
 
         selectedParameter = self.selectedParameter
-        if isinstance(selectedParameter, CustomParameterInstance):
+        if not isinstance(selectedParameter, ModelParameterInstance):
             return
 
         rows = []
@@ -540,25 +968,43 @@ class Window(QtGui.QMainWindow):
         if selectModel.hasSelection():
             rows = [ind.row() for ind in selectModel.selectedRows()]
 
-        selectedPropositions = [self.propositionTblWdg.model().propositions[row] for row in rows]
-        referenceInstances = [prop["obj_parameter"] for prop in selectedPropositions]
-        if set(referenceInstances) != set(selectedParameter.referenceInstances):
+        model = self.propositionTblWdg.model()
+        selectedPropositions = [model.proposition(row) for row in rows]
+        for prop in selectedPropositions:
+            ModelParameterInstance.referenceStore.register(prop["obj_parameter"], prop["obj_annotation"])
+        # References hidden by the filter of the table remain selected.
+        referenceInstances = [ref for ref in selectedParameter.referenceInstances if not model.isShown(ref.id)]
+        referenceInstances.extend([prop["obj_parameter"] for prop in selectedPropositions])
+        if set([ref.id for ref in referenceInstances]) != set(selectedParameter.ids):
+            self.recordAction("selectPropositions", ids=[ref.id for ref in referenceInstances])
             selectedParameter.referenceInstances = referenceInstances
-            fileName = stripIncomplete(self.projectFiles.currentItem().text())
-            self.refreshParamList(fileName, resetIndex=False)
-            self.refreshFileStatus()
-            self.projectSetup.save()
+            self.parameterValueChanged()
 
 
+    @instrumentation.timed("Window.saveCustom")
     def saveCustom(self):
-        paramName = stripIncomplete(self.paramList.currentItem().text())
-        param = CustomParameterInstance(paramName, self.justification.toPlainText())
-        param.setValue(float(self.customValue.text()), self.customUnit.text())
+        self.recordAction("saveCustom", value=self.customValue.text(), unit=self.customUnit.text(),
+                          justification=self.justification.toPlainText())
+        paramKey = self.__selectedParameter()[1]
+        paramName = ParameterListModel.keyText(paramKey)
+        selectedParameter = self.selectedParameter
+        if isinstance(selectedParameter, ArrayParameterInstance):
+            # The custom value of an array-valued parameter is the path
+            # of the .npy file holding the array.
+            param = ArrayParameterInstance(paramName, selectedParameter.format, 
+                                           justification=self.justification.toPlainText(),
+                                           requiredUnit=selectedParameter.requiredUnit)
+            param.setValue(self.customValue.text(), self.customUnit.text())
+            try:
+                param.array
+            except (IOError, ValueError) as e:
+                QtGui.QMessageBox.critical(self, "Invalid array", str(e))
+                return
+        else:
+            param = CustomParameterInstance(paramName, self.justification.toPlainText())
+            param.setValue(float(self.customValue.text()), self.customUnit.text())
+        param.args = selectedParameter.args
         self.selectedParameter = param
-        
-        fileName = stripIncomplete(self.projectFiles.currentItem().text())        
-        self.refreshParamList(fileName, resetIndex=False) 
-        self.refreshFileStatus()
-        self.projectSetup.save()
+        self.parameterValueChanged()
 
 
@@ -6,9 +6,19 @@ Created on Mon Oct  3 12:33:55 2016
 """
 
 
-import quantities as pq
-import numpy as np
-from nat.modelingParameter import ParameterInstance
+import os
+import shutil
+import warnings
+from collections import OrderedDict
+
+from .referenceStore import ReferenceStore
+from .expression import compileExpression
+from .units import internUnit, unitNames, referenceValues, unitFactor, baseUnit, toBaseUnit
+from .aggregation import PackedReferences, aggregate
+from .utils import lazyImport
+
+pq = lazyImport("quantities")
+np = lazyImport("numpy")
 
 class AbstractParameterInstance:
     # This class represent a parameter instance. It can be used to
@@ -18,17 +28,47 @@ class AbstractParameterInstance:
     # The objects encode the type of parameter, its numerical value,
       # the units in which it is specified, and the annotation and publication
     # ID it refers to.
+    #
+    # Projects can hold tens of thousands of instances, so the value is
+    # stored as a plain number with an interned unit id rather than as a
+    # Quantity, which is built only when requested.
+    #
+    # Subclasses computing their value (e.g., from references) only set
+    # _dirty when their inputs change. The value is then evaluated the first
+    # time it is read and memoized.
+
+    __slots__ = ("_value", "_unitId", "_dirty", "requiredUnit", "args")
 
     def __init__(self, requiredUnit=None):
-        self.__quantity = None
-        self.requiredUnit   = requiredUnit
+        self._value       = None
+        self._unitId      = -1
+        self._dirty       = False
+        self.requiredUnit = requiredUnit
+        self.args         = {}
+
+    def evaluate(self):
+        self._dirty = False
 
     def setValue(self, value, unit):
-        self.__quantity = pq.Quantity(value, unit)
+        if value is None:
+            self._value  = None
+            self._unitId = -1
+            return
+
+        quantity = pq.Quantity(value, unit)
         # A value must always be set along with its unit. Else, it is meaningless.
         if not self.requiredUnit is None:
             if not unit != self.requiredUnit:
-                self.__quantity = self.__quantity.rescale(self.requiredUnit)
+                quantity = quantity.rescale(self.requiredUnit)
+
+        self._value  = quantity.item()
+        self._unitId = internUnit(str(quantity.dimensionality))
+
+    def setNormalizedValue(self, value, unit):
+        # Equivalent to setValue() for a value whose unit has already been
+        # normalized with normalizeUnit(), but without building a Quantity.
+        self._value  = value
+        self._unitId = internUnit(unit)
         
     #def convertUnit(self, unit):
     #    pass
@@ -36,15 +76,23 @@ class AbstractParameterInstance:
 
     @property
     def unit(self):
-        if self.__quantity is None:
+        if self._dirty:
+            self.evaluate()
+        if self._value is None:
             return None        
-        return str(self.__quantity.dimensionality)
+        return unitNames[self._unitId]
 
     @property
     def value(self):
-        if self.__quantity is None:
+        if self._dirty:
+            self.evaluate()
+        return self._value
+
+    @property
+    def quantity(self):
+        if self.value is None:
             return None
-        return self.__quantity.item()
+        return pq.Quantity(self.value, self.unit)
         
 
     def isComplete(self):
@@ -58,57 +106,214 @@ class AbstractParameterInstance:
         return True
 
 
+    def __getstate__(self):
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get("__slots__", ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+        del state["_unitId"]
+        state["_unit"] = None if self._value is None else unitNames[self._unitId]
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        AbstractParameterInstance.__init__(self)
+
+        # Projects saved before the instances used __slots__ stored a
+        # Quantity and name-mangled private attributes.
+        if "_AbstractParameterInstance__quantity" in state:
+            quantity = state.pop("_AbstractParameterInstance__quantity")
+            if not quantity is None:
+                state["_value"] = quantity.item()
+                state["_unit"]  = str(quantity.dimensionality)
+
+        unit = state.pop("_unit", None)
+        for name, value in state.items():
+            if name.startswith("_") and "__" in name[1:]:
+                name = "_" + name.split("__", 1)[1]
+            setattr(self, name, value)
+        self._unitId = internUnit(unit) if not self._value is None else -1
+
+
 class Transformation:
     """
      This class is used to define computationnaly how values of curated 
      parameters are into values that are inserted in models.
+
+     transformationCode is an expression (see expression.py) of the
+     variables "values" (the central tendencies of the reference instances,
+     rescaled to a common unit) and "n" (the number of references). An
+     empty code averages the values. The code is compiled once and the
+     compiled expression is cached.
+
+     Any other name used in the expression refers to another parameter of
+     the project (see dependencies.py). Its value and unit must be given in
+     the inputs of apply(), as a (value, unit) tuple.
     """
 
-    def __init__(self):
-        self.transformationCode = ""    
+    variables = {"values", "n"}
+
+    def __init__(self, transformationCode=""):
+        self.transformationCode = transformationCode    
+        self._compiled          = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_compiled"] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("_compiled", None)
+        self.__dict__.update(state)
     
     def toJSON(self):
         return {"transformationCode": self.transformationCode}
+
+    @property
+    def compiled(self):
+        if self._compiled is None or self._compiled.code != self.transformationCode:
+            self._compiled = compileExpression(self.transformationCode)
+        return self._compiled
+
+    @property
+    def dependencies(self):
+        # Names of the parameters used by the transformation.
+        if self.transformationCode == "":
+            return set()
+        return self.compiled.names - Transformation.variables
         
-    def apply(self, referenceInstances):
-        if len(referenceInstances) == 0 :
+    def apply(self, referenceInstances, inputs=None):
+        """
+         Return the value of the transformation and its unit. Without
+         inputs, the value is in the unit of the references. Otherwise, the
+         variables are rescaled to SI base units and the unit of the value
+         is derived from the expression (see CompiledExpression.unit()),
+         which raises ValueError for incompatible dimensions. The value is
+         then given in SI base units, or in the unit of the references if it
+         has the same dimensions. The unit is None for a value computed
+         from dimensionless constants only.
+        """
+        dependencies = self.dependencies
+        # Inputs saved before they held units are ignored until the
+        # project updates them (see ProjectSetup.updateInputs()).
+        if len(dependencies) and (inputs is None or any([not isinstance(inputs.get(name), tuple) or
+                                                         inputs[name][0] is None for name in dependencies])):
+            # The values of the parameters it depends on are not known yet.
             return None, None
-        
-        if self.transformationCode == "":
-            print([ref.centralTendancy() for ref in referenceInstances])
-            print([type(ref.centralTendancy()) for ref in referenceInstances])
-            quantities = [pq.Quantity(np.mean(ref.centralTendancy()), ref.unit) for ref in referenceInstances]
-
-            # Rescale to a common unit and average
-            unit = str(quantities[0].dimensionality)
-
-            # The following code does not work because of a probable bug
-            # in the Quantity library: https://github.com/python-quantities/python-quantities/issues/123
-            #mean = np.mean([quant.rescale(unit).base  for quant in quantities])
-            # Thus we replace by the more verbose version...
-            mean = np.mean([quant.rescale(unit).base if unit != str(quant.dimensionality) else quant.base for quant in quantities])
-            
-            return mean, unit 
+
+        if len(referenceInstances) == 0 :
+            if self.transformationCode == "" or len(self.compiled.names & Transformation.variables):
+                return None, None
+            if len(dependencies) == 0:
+                # Value computed from constants only. The unit is left to
+                # the caller.
+                return float(self.compiled({})), None
+            namespace, units = {}, {}
         else:
-            raise NotImplemented            
-            
+            values, unit = referenceValues(referenceInstances)
+            if self.transformationCode == "":
+                return float(np.mean(values)), unit 
+            if len(dependencies) == 0:
+                namespace = {"values": values, "n": np.array([len(values)], dtype=float)}
+                return float(self.compiled(namespace)), unit
+            namespace = {"values": toBaseUnit(values, unit), "n": np.array([len(values)], dtype=float)}
+            units     = {"values": unit, "n": None}
+
+        for name in dependencies:
+            value, unit = inputs[name]
+            namespace[name] = np.array([toBaseUnit(value, unit)], dtype=float)
+            units[name]     = unit
+        value, unit = float(self.compiled(namespace)), self.compiled.unit(units)
+        if "values" in units and unit == baseUnit(units["values"]):
+            return value*unitFactor(unit, units["values"]), units["values"]
+        return value, unit
+
+
+    def applyPacked(self, values):
+        """
+         Apply the transformation to a 2D array of reference values (one
+         row per parameter, padded with NaN) and return one value per row.
+        """
+        if self.transformationCode == "":
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                return np.nanmean(values, axis=-1)
+
+        n = np.sum(~np.isnan(values), axis=-1, keepdims=True).astype(float)
+        return np.broadcast_to(self.compiled({"values": values, "n": n}), values.shape[:-1])
+
+
+
+def evaluateParameters(parameters):
+    """
+     Evaluate the dirty ModelParameterInstance objects of parameters. The
+     instances sharing the same transformation code are evaluated together,
+     their reference values being packed in a single array. Instances
+     depending on other parameters are evaluated individually.
+    """
+    groups = OrderedDict()
+    for parameter in parameters:
+        if isinstance(parameter, ModelParameterInstance) and parameter._dirty:
+            if len(parameter.transformation.dependencies):
+                parameter.evaluate()
+            else:
+                groups.setdefault(parameter.transformation.transformationCode, []).append(parameter)
+
+    for group in groups.values():
+        # Instances without references have no value: nothing to compute
+        # (which spares importing NumPy for new projects).
+        for parameter in group:
+            if len(parameter.references) == 0:
+                parameter._dirty = False
+                parameter.setValue(None, None)
+        group = [parameter for parameter in group if parameter._dirty]
+        if len(group) == 0:
+            continue
+
+        rows   = [referenceValues(parameter.references) for parameter in group]
+        width  = max([len(values) for values, unit in rows])
+        packed = np.full((len(group), width), np.nan)
+        for noRow, (values, unit) in enumerate(rows):
+            packed[noRow, :len(values)] = values
+
+        results = group[0].transformation.applyPacked(packed)
+        for parameter, (values, unit), result in zip(group, rows, results):
+            parameter._dirty = False
+            parameter.setNormalizedValue(float(result), unit)
+
+
 
 class ModelParameterInstance (AbstractParameterInstance):
 
+    # Only the IDs of the reference instances and a summary of their values
+    # are saved with the project. The corresponding nat ParameterInstance
+    # objects are resolved on demand through this store.
+    referenceStore = ReferenceStore()
+
+    # The value is not computed when the references or the transformation
+    # change. The instance is only marked as dirty and the value is
+    # evaluated (and memoized) the first time it is read.
+    __slots__ = ("paramID", "_references", "_resolved", "_transformation", "_inputs", "_statistics")
+
     def __init__(self, paramID, referenceInstances=None, transformation=None):
         super(ModelParameterInstance, self).__init__()
-        self.paramID              = paramID
-        self.__referenceInstances = []   
-        self.__transformation     = Transformation()       
+        self.paramID             = paramID
+        self._references         = []
+        self._resolved           = []
+        self._transformation     = Transformation()       
+        self._inputs             = None
+        self._statistics         = None
         
-        if isinstance(referenceInstances, ParameterInstance):
-            self.referenceInstances = [referenceInstances]
-        elif isinstance(referenceInstances, list):
+        if isinstance(referenceInstances, list):
             self.referenceInstances = referenceInstances
         elif referenceInstances is None:
             self.referenceInstances = []
         else:
-            raise TypeError()
+            from nat.modelingParameter import ParameterInstance
+            if not isinstance(referenceInstances, ParameterInstance):
+                raise TypeError()
+            self.referenceInstances = [referenceInstances]
             
         if not transformation is None:
             self.transformation     = transformation
@@ -117,31 +322,111 @@ class ModelParameterInstance (AbstractParameterInstance):
     
     @property
     def ids(self):
-        return [ref.id for ref in self.referenceInstances] 
+        return [ref.id for ref in self._references] 
+
+    @property
+    def references(self):
+        # ReferenceSummary objects of the reference instances.
+        return self._references
     
     @property
     def referenceInstances(self):
-        return self.__referenceInstances
+        if self._resolved is None:
+            self.resolveReferences()
+        return self._resolved
         
     @referenceInstances.setter
     def referenceInstances(self, referenceInstances):
         if not isinstance(referenceInstances, list):
             raise TypeError()
-        self.__referenceInstances = referenceInstances
-        if len(referenceInstances):
-            self.setValue(*self.transformation.apply(self.referenceInstances))
+        self._references = [ModelParameterInstance.referenceStore.summarize(ref) for ref in referenceInstances]
+        self._resolved   = list(referenceInstances)
+        self._statistics = None
+        self._dirty      = True
+
+
+    def resolveReferences(self):
+        # References that cannot be found in the corpus are represented by
+        # their summary.
+        resolved   = []
+        references = []
+        for ref in self._references:
+            instance = ModelParameterInstance.referenceStore.resolve(ref.id)
+            if instance is None:
+                resolved.append(ref)
+                references.append(ref)
+            else:
+                summary = ModelParameterInstance.referenceStore.summarize(instance)
+                if summary.annotationId is None:
+                    summary.annotationId = ref.annotationId
+                    summary.pubId        = ref.pubId
+                resolved.append(instance)
+                references.append(summary)
+        self._resolved = resolved
+
+        # The cached summaries are refreshed in case the corpus has been
+        # updated since the project has been saved.
+        if references != self._references:
+            self._references = references
+            self._statistics = None
+            self._dirty      = True
+
+
+    def evaluate(self):
+        self._dirty = False
+        value, unit = self.transformation.apply(self._references, self._inputs)
+        if value is None:
+            self.setValue(None, None)
+        else:
+            self.setNormalizedValue(value, unit)
+
+    @property
+    def statistics(self):
+        # Statistics of the reference values (see aggregation.aggregate()),
+        # usually computed for the whole project by aggregateParameters().
+        if self._statistics is None and len(self._references):
+            aggregateParameters([self])
+        return self._statistics
+
+    @property
+    def inputs(self):
+        # Values of the parameters the transformation depends on.
+        return self._inputs
+
+    @inputs.setter
+    def inputs(self, inputs):
+        self._inputs = inputs
+        self._dirty  = True
+
         
     @property
     def transformation(self):
-        return self.__transformation
+        return self._transformation
         
     @transformation.setter
     def transformation(self, transformation):
         if not isinstance(transformation, Transformation):
             raise TypeError("The argument 'transformation' must be of type 'Transformation'. Received type '" + str(transformation) + "'")
-        self.__transformation = transformation
-        self.value, self.unit = self.__transformation.apply(self.referenceInstances)
-        
+        self._transformation = transformation
+        self._dirty          = True
+
+
+    def __getstate__(self):
+        state = super(ModelParameterInstance, self).__getstate__()
+        del state["_resolved"]
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        # Projects saved before references were stored by ID hold the
+        # nat ParameterInstance objects themselves.
+        for name in ["_ModelParameterInstance__referenceInstances", "_referenceInstances"]:
+            if name in state:
+                state["_references"] = [ModelParameterInstance.referenceStore.summarize(ref) for ref in state.pop(name)]
+        state.setdefault("_inputs", None)
+        state.setdefault("_statistics", None)
+        super(ModelParameterInstance, self).__setstate__(state)
+        self._resolved = None
         
         
 
@@ -150,12 +435,100 @@ class ModelParameterInstance (AbstractParameterInstance):
                 "value": self.value,
                 "paramID": self.paramID,
                 "referenceInstances": [ref.toJSON() for ref in self.referenceInstances],
+                # Only the cached statistics: computing them here would run one
+                # aggregation per parameter (see ProjectSetup.toJSON()).
+                "statistics": self._statistics,
                 "transformation": self.transformation.toJSON() if not self.transformation is None else None}
 
 
 
+def aggregateParameters(parameters, nBootstrap=500, confidence=0.95, seed=0):
+    """
+     Compute the statistics of the reference values of all the
+     ModelParameterInstance objects of parameters in a single vectorized
+     pass and store them on the instances.
+    """
+    parameters = [parameter for parameter in parameters 
+                  if isinstance(parameter, ModelParameterInstance) and len(parameter.references)]
+    if len(parameters) == 0:
+        return
+
+    packed  = PackedReferences([parameter.references for parameter in parameters])
+    results = aggregate(packed, nBootstrap, confidence, seed)
+    for noRow, parameter in enumerate(parameters):
+        statistics = {"unit": packed.units[noRow], "confidence": confidence}
+        for key, values in results.items():
+            # NaN are stored as None so that the statistics remain valid JSON.
+            value = values[noRow].item()
+            statistics[key] = None if value != value else value
+        parameter._statistics = statistics
+
+
+
+class DerivedParameterInstance (AbstractParameterInstance):
+    """
+     Parameter computed from other parameters of the project, specified by
+     the "expr" argument of its tag, e.g.:
+
+         #|gbar_na(expr="g_total / soma_area", unit="S/cm^2")|#
+    """
+
+    __slots__ = ("name", "_transformation", "_inputs")
+
+    def __init__(self, name, transformation, requiredUnit=None):
+        super(DerivedParameterInstance, self).__init__(requiredUnit)
+        if not isinstance(transformation, Transformation):
+            raise TypeError("The argument 'transformation' must be of type 'Transformation'. Received type '" + str(transformation) + "'")
+        self.name            = name
+        self._transformation = transformation
+        self._inputs         = None
+        self._dirty          = True
+
+    @property
+    def transformation(self):
+        return self._transformation
+
+    @property
+    def inputs(self):
+        return self._inputs
+
+    @inputs.setter
+    def inputs(self, inputs):
+        self._inputs = inputs
+        self._dirty  = True
+
+    def evaluate(self):
+        self._dirty = False
+        value, unit = self.transformation.apply([], self._inputs)
+        if value is None:
+            self.setValue(None, None)
+            return
+        if unit is None:
+            unit = "dimensionless" if self.requiredUnit is None else self.requiredUnit
+        elif not self.requiredUnit is None:
+            # The value is given in SI base units.
+            try:
+                value *= unitFactor(unit, self.requiredUnit)
+            except ValueError:
+                raise ValueError("The expression '" + self.transformation.transformationCode + "' of " +
+                                 self.name + " gives values in " + unit + ", which cannot be converted " +
+                                 "to " + self.requiredUnit + ".")
+            unit = self.requiredUnit
+        self.setValue(value, unit)
+
+    def toJSON(self):
+        return {"unit": self.unit, 
+                "value": self.value,
+                "name": self.name,
+                "transformation": self.transformation.toJSON(),
+                "inputs": self.inputs}
+
+
+
 class CustomParameterInstance (AbstractParameterInstance):
 
+    __slots__ = ("name", "justification")
+
     def __init__(self, name, justification = None):
         super(CustomParameterInstance, self).__init__()
         self.name            = name
@@ -181,4 +554,84 @@ class CustomParameterInstance (AbstractParameterInstance):
 
 
 
+class ArrayParameterInstance (CustomParameterInstance):
+    """
+     Array-valued parameter (e.g., a distance-dependent conductance profile
+     or a kinetic lookup table), specified by a tag with an "array" argument
+     giving the format of the file written along with the generated model:
+
+         #|gbar_profile(array="npy", source="profiles/gbar.npy", unit="S/cm^2")|#
+
+     The value of the instance is the path of a .npy file holding the array
+     (given by the "source" argument, relative to the meta-model file, or
+     chosen as a custom value). The array is memory-mapped rather than
+     loaded and it is never rescaled: its unit is only recorded.
+
+     When a model is generated, the array is written in a sidecar file
+     next to the generated file, either as a .npy file or as raw binary
+     data (.bin), and the tag is replaced by a reference to this file: a
+     self-contained expression loading it through memory mapping for Python
+     files and its quoted path for other files. Paths are relative to the
+     directory of the generated file; in Python files, they are resolved
+     against the directory of __file__ rather than the working directory.
+    """
+
+    __slots__ = ("format",)
+
+    extensions = {"npy": ".npy",
+                  "raw": ".bin"}
+
+    # Text replacing the tag, by format, for the extensions of the
+    # generated files listed here. Tags are replaced within expressions, so
+    # the modules are imported with __import__() rather than by statements.
+    loaders = {".py": {"npy": '__import__("numpy").load({path}, mmap_mode="r")',
+                       "raw": '__import__("numpy").memmap({path}, dtype="{dtype}", mode="r", shape={shape})'}}
+    pathLoaders = {".py": '__import__("os").path.join(__import__("os").path.dirname(__file__), "{path}")'}
+
+    def __init__(self, name, format="npy", source=None, justification=None, requiredUnit=None):
+        if not format in ArrayParameterInstance.extensions:
+            raise ValueError("Unknown array format '" + str(format) + "'. Supported formats are: " +
+                             ", ".join(sorted(ArrayParameterInstance.extensions)) + ".")
+        super(ArrayParameterInstance, self).__init__(name, justification)
+        self.format       = format
+        self.requiredUnit = requiredUnit
+        if not source is None:
+            self.setValue(source, requiredUnit)
+
+    def setValue(self, source, unit):
+        if source is None:
+            self._value  = None
+            self._unitId = -1
+            return
+        self._value  = source
+        self._unitId = internUnit("dimensionless" if unit is None or unit == "" else unit)
 
+    @property
+    def array(self):
+        if self.value is None:
+            return None
+        return np.load(self.value, mmap_mode="r")
+
+    def writeSidecar(self, path):
+        if self.format == "npy":
+            # The source already is a .npy file.
+            shutil.copyfile(self.value, path)
+        else:
+            np.ascontiguousarray(self.array).tofile(path)
+
+    def loaderReference(self, outputName, sidecarName):
+        # Text replacing the tag in outputName, the sidecar file being 
+        # written next to it.
+        path      = os.path.basename(sidecarName)
+        extension = os.path.splitext(outputName)[1]
+        loaders   = ArrayParameterInstance.loaders.get(extension, {})
+        if not self.format in loaders:
+            return '"' + path + '"'
+        path  = ArrayParameterInstance.pathLoaders[extension].format(path=path)
+        array = self.array
+        return loaders[self.format].format(path=path, dtype=array.dtype.str, shape=tuple(array.shape))
+
+    def toJSON(self):
+        json = super(ArrayParameterInstance, self).toJSON()
+        json["format"] = self.format
+        return json
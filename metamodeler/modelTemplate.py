@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 09:48:03 2026
+
+@author: oreilly
+"""
+
+import os
+
+from .tagParser import TagParser
+
+
+class ModelTemplate:
+    """
+     Meta-model file compiled for generation: its text is split once on its
+     tags so that a model can be generated by joining the literal segments
+     with the values of the parameters, without searching the tags again.
+
+     keys     : parameter keys, in order of first appearance
+     slots    : for each tag occurrence, the index of its key in keys
+     segments : literal text around the tags (len(slots)+1 strings)
+    """
+
+    def __init__(self, fileName, text=None):
+        self.fileName   = fileName
+        self.outputName = fileName.replace(".mm_", ".")
+        if text is None:
+            with open(fileName, 'r') as f:
+                text = f.read()
+
+        self.keys     = []
+        self.slots    = []
+        self.segments = []
+
+        keyIndexes = {}
+        parser     = TagParser()
+        position   = 0
+        for match in TagParser.p.finditer(text):
+            paramKey = parser.getParamKey(match.group(0))
+            if not paramKey in keyIndexes:
+                keyIndexes[paramKey] = len(self.keys)
+                self.keys.append(paramKey)
+            self.slots.append(keyIndexes[paramKey])
+            self.segments.append(text[position:match.start()])
+            position = match.end()
+        self.segments.append(text[position:])
+
+
+    def render(self, valueStrs):
+        """
+         Return the text of the model. valueStrs gives the text replacing
+         the tags of each key, in the order of self.keys.
+        """
+        parts = [None]*(2*len(self.slots)+1)
+        parts[::2]  = self.segments
+        parts[1::2] = [valueStrs[noKey] for noKey in self.slots]
+        return "".join(parts)
+
+
+    def sidecarName(self, noKey, extension):
+        # File holding the array value of a key (see ArrayParameterInstance),
+        # next to the generated file. Keys sharing the same parameter name
+        # are told apart by their index.
+        name = self.keys[noKey][0]
+        if len([key for key in self.keys if key[0] == name]) > 1:
+            name += "_" + str(noKey)
+        return os.path.splitext(self.outputName)[0] + "." + name + extension
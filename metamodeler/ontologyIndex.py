@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24 10:22:16 2026
+
+@author: oreilly
+"""
+
+import threading
+from collections import deque
+
+from .utils import lazyImport
+
+treeData    = lazyImport("nat.treeData")
+ontoManager = lazyImport("nat.ontoManager")
+
+
+class OntologyIndex:
+    """
+     Index of the ontology terms (as loaded by nat OntoManager) shared by
+     the property editor and the ranking of propositions:
+         - names of the term IDs and IDs of the term names (the first ID
+           in the ontology order when several terms share the same name),
+         - for every root of the trees, the map of the names of its terms
+           to their IDs, so that checking that a name belongs to a root is
+           a single lookup,
+         - descendants (subclasses) of the terms, cached,
+         - a case-insensitive prefix trie of the term names of each root
+           (built on first use) for autocompletion.
+    """
+
+    sharedIndex = None
+    sharedLock  = threading.Lock()
+
+    def __init__(self, trees=None, dics=None, childrenFct=None):
+        if trees is None or dics is None:
+            ontoMng = ontoManager.OntoManager()
+            trees   = ontoMng.trees if trees is None else trees
+            dics    = ontoMng.dics  if dics  is None else dics
+
+        self.trees       = trees
+        self.dics        = dics
+        self.childrenFct = treeData.getChildrens if childrenFct is None else childrenFct
+
+        self.nameToId = {}
+        for id, name in dics.items():
+            self.nameToId.setdefault(name, id)
+
+        self.rootNameToId = {}
+        for rootId, terms in trees.items():
+            rootNames = {}
+            for id, name in terms.items():
+                rootNames.setdefault(name, id)
+            self.rootNameToId[rootId] = rootNames
+
+        self.descendantCache = {}
+        self.tries           = {}
+
+
+    @staticmethod
+    def shared():
+        # Loading the ontologies is slow: a single index is built per process.
+        with OntologyIndex.sharedLock:
+            if OntologyIndex.sharedIndex is None:
+                OntologyIndex.sharedIndex = OntologyIndex()
+            return OntologyIndex.sharedIndex
+
+
+    def nameFromId(self, id):
+        return self.dics[id]
+
+    def idFromName(self, name, rootId=None):
+        if rootId is None:
+            return self.nameToId[name]
+        return self.rootNameToId[rootId][name]
+
+    def hasRoot(self, rootId):
+        return rootId in self.rootNameToId
+
+    def isInRoot(self, name, rootId):
+        return name in self.rootNameToId[rootId]
+
+    def descendants(self, id):
+        if not id in self.descendantCache:
+            self.descendantCache[id] = set(self.childrenFct(id).keys())
+        return self.descendantCache[id]
+
+    def isA(self, id, ancestorId):
+        # True if id is ancestorId or one of its subclasses.
+        return id == ancestorId or id in self.descendants(ancestorId)
+
+
+    def trie(self, rootId):
+        # Nodes are dictionaries mapping characters to child nodes. The
+        # names ending at a node are listed under the "" key.
+        if not rootId in self.tries:
+            trie = {}
+            for name in sorted(self.rootNameToId[rootId]):
+                node = trie
+                for char in name.lower():
+                    node = node.setdefault(char, {})
+                node.setdefault("", []).append(name)
+            self.tries[rootId] = trie
+        return self.tries[rootId]
+
+
+    def complete(self, prefix, rootId, maxNbCompletions=50):
+        """
+         Return up to maxNbCompletions names of the terms of rootId starting
+         with prefix (case-insensitive). The trie is traversed breadth-first
+         so that shorter names come first, ties being sorted alphabetically.
+        """
+        node = self.trie(rootId)
+        for char in prefix.lower():
+            if not char in node:
+                return []
+            node = node[char]
+
+        completions = []
+        queue = deque([node])
+        while len(queue) and len(completions) < maxNbCompletions:
+            node = queue.popleft()
+            completions.extend(node.get("", []))
+            queue.extend([node[char] for char in sorted(node) if char != ""])
+        return completions[:maxNbCompletions]
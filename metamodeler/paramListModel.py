@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:44 2026
+
+@author: oreilly
+"""
+
+from PySide import QtCore, QtGui
+
+
+class ParameterListModel(QtCore.QAbstractListModel):
+    """
+     List model exposing the parameters (ParamDic) of a FileSetup. Rows are
+     kept sorted by their displayed text. The completion marker and the
+     "unknown parameter type" background are computed only when a row is
+     painted, and editing a parameter only invalidates its own row.
+    """
+
+    def __init__(self, parent=None, isKnownType=None):
+        super(ParameterListModel, self).__init__(parent)
+        self.fileSetup    = None
+        self.keys         = []
+        self.rows         = {}
+
+        # Callable taking a parameter name and returning whether it is
+        # a parameter type known by NAT. Results are cached by name.
+        self.isKnownType  = isKnownType
+        self.knownTypes   = {}
+
+
+    @staticmethod
+    def keyText(key):
+        name, args = key
+        return name + "(" + str(args) + ")"
+
+
+    def setFileSetup(self, fileSetup):
+        self.beginResetModel()
+        self.fileSetup = fileSetup
+        if fileSetup is None:
+            self.keys = []
+        else:
+            self.keys = sorted(fileSetup.parameters.keys(), key=ParameterListModel.keyText)
+        self.rows = {key:row for row, key in enumerate(self.keys)}
+        self.endResetModel()
+
+
+    def clear(self):
+        self.setFileSetup(None)
+
+
+    def keyAt(self, row):
+        if row < 0 or row >= len(self.keys):
+            return None
+        return self.keys[row]
+
+
+    def indexFromKey(self, key):
+        if not key in self.rows:
+            return QtCore.QModelIndex()
+        return self.index(self.rows[key], 0)
+
+
+    def parameterChanged(self, key):
+        # Only the row of the edited parameter needs to be repainted.
+        index = self.indexFromKey(key)
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+
+
+    def knownType(self, name):
+        if self.isKnownType is None:
+            return True
+        if not name in self.knownTypes:
+            self.knownTypes[name] = self.isKnownType(name)
+        return self.knownTypes[name]
+
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.keys)
+
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        key = self.keys[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            text = ParameterListModel.keyText(key)
+            if not self.fileSetup.parameters[key].isComplete():
+                text = "* " + text
+            return text
+
+        if role == QtCore.Qt.BackgroundRole:
+            if not self.knownType(key[0]):
+                return QtGui.QBrush(QtCore.Qt.lightGray)
+            return None
+
+        if role == QtCore.Qt.UserRole:
+            return key
+
+        return None
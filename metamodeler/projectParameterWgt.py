@@ -5,14 +5,15 @@ Created on Wed Oct 26 10:01:05 2016
 @author: oreilly
 """
 
-from PySide import QtCore
+from PySide import QtCore, QtGui
 
 
-from nat.ontoManager import OntoManager  
 from nat.tag import Tag
 
 from collections import OrderedDict
 
+from .ontologyIndex import OntologyIndex
+
 class ProjectParameterModel(QtCore.QAbstractTableModel):
 
     dataChanged = QtCore.Signal(Tag)
@@ -31,9 +32,9 @@ class ProjectParameterModel(QtCore.QAbstractTableModel):
         self.colHeader             = colHeader
         self.nbCol                 = len(colHeader)
 
-        ontoMng = OntoManager()
-        self.treeData                  = ontoMng.trees 
-        self.dicData                   = ontoMng.dics
+        self.ontologyIndex             = OntologyIndex.shared()
+        self.treeData                  = self.ontologyIndex.trees 
+        self.dicData                   = self.ontologyIndex.dics
     
         self.projectParamDict    = {"species": None, 
                                     "brain_region": None,
@@ -79,16 +80,26 @@ class ProjectParameterModel(QtCore.QAbstractTableModel):
         if index.column() == 1:
             if self.checkTagValidity(index.row(), value):
                 rootName = list(ProjectParameterModel.projectParamRootIDs.keys())[index.row()]                
-                tagId = list(self.dicData.keys())[list(self.dicData.values()).index(value)]                    
+                tagId = self.ontologyIndex.idFromName(value, self.rootIdAt(index.row()))
                 self.projectParamDict[rootName] = Tag(tagId, value)
                 self.dataChanged.emit(self.projectParamDict[rootName])
 
 
+    @staticmethod
+    def rootIdAt(row):
+        return list(ProjectParameterModel.projectParamRootIDs.values())[row]
+
+
     def checkTagValidity(self, row, tagName):
-        rootId = list(ProjectParameterModel.projectParamRootIDs.values())[row]
-        if not rootId in self.treeData:  
+        rootId = self.rootIdAt(row)
+        if not self.ontologyIndex.hasRoot(rootId):  
             raise ValueError("Tag '" + rootId + "' is not a treeData root. TreeData roots are the following:" + str(list(self.treeData.keys())))
-        return tagName in list(self.treeData[rootId].values())
+        return self.ontologyIndex.isInRoot(tagName, rootId)
+
+
+    def completions(self, row, prefix, maxNbCompletions=50):
+        # Names of the terms of the root of the property at row starting with prefix.
+        return self.ontologyIndex.complete(prefix, self.rootIdAt(row), maxNbCompletions)
 
 
     def flags(self, index):
@@ -115,4 +126,37 @@ class ProjectParameterModel(QtCore.QAbstractTableModel):
     def setParamDict(self, paramDic):
         for key in self.projectParamDict:
             if key in paramDic:
-                self.projectParamDict[key] = Tag(paramDic[key], self.dicData[paramDic[key]])
\ No newline at end of file
+                self.projectParamDict[key] = Tag(paramDic[key], self.dicData[paramDic[key]])
+
+
+
+class TagCompleterDelegate(QtGui.QStyledItemDelegate):
+    """
+     Editor of the values of a ProjectParameterModel: a line edit proposing,
+     as the user types, the names of the terms of the root of the edited
+     property starting with the typed text (see OntologyIndex.complete()).
+    """
+
+    maxNbCompletions = 50
+
+    def createEditor(self, parent, option, index):
+        editor      = QtGui.QLineEdit(parent)
+        completions = QtGui.QStringListModel(editor)
+        completer   = QtGui.QCompleter(completions, editor)
+        completer.setCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        completer.setCompletionMode(QtGui.QCompleter.UnfilteredPopupCompletion)
+        editor.setCompleter(completer)
+
+        model = index.model()
+        row   = index.row()
+        def updateCompletions(text):
+            completions.setStringList(model.completions(row, text, TagCompleterDelegate.maxNbCompletions))
+            completer.complete()
+        editor.textEdited.connect(updateCompletions)
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.setText(index.model().data(index, QtCore.Qt.DisplayRole))
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.text())
@@ -5,16 +5,28 @@ Created on Wed Oct 26 09:19:25 2016
 @author: oreilly
 """
 
-from copy import deepcopy
+from copy import deepcopy, copy
 import os
 import pickle
 import fnmatch
 from collections import OrderedDict
 
-from nat.modelingParameter import getParameterTypes
-
-from .modelParameter import AbstractParameterInstance, CustomParameterInstance, ModelParameterInstance
+from .modelParameter import (AbstractParameterInstance, CustomParameterInstance, ModelParameterInstance,
+                             DerivedParameterInstance, ArrayParameterInstance, Transformation, evaluateParameters,
+                             aggregateParameters)
 from .tagParser import TagParser
+from .contextIndex import FileContextIndex
+from .autosave import AutoSaver
+from .dependencies import DependencyGraph
+from .modelTemplate import ModelTemplate
+from .ensemble import Ensemble
+from .instrumentation import timed, count
+
+class OperationCancelled(Exception):
+    # Raised by the long operations of a project when they are cancelled.
+    pass
+
+
 
 class ParamDic(OrderedDict):
     def __setitem__(self, key, value):
@@ -32,28 +44,111 @@ class ProjectSetup:
         self.path = path
         self.files = {} # Indexed by file name
         self.properties = {}
+        self.autoSaver = None
+        self._dependencyGraph = None
 
 
         self.reloadMM()
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["autoSaver"] = None
+        state["_dependencyGraph"] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("autoSaver", None)
+        state["_dependencyGraph"] = None
+        self.__dict__.update(state)
 
+
+    @timed()
     def reloadMM(self):
+        self.applyMM(self.scanMM())
 
-        for root, dirnames, filenames in os.walk(self.path):
-            for filename in fnmatch.filter(filenames, '*.mm_*'):
-                ignore=False
-                for ignore_pattern in ProjectSetup.ignore_patterns:
-                    if fnmatch.fnmatch(filename, ignore_pattern):
-                        ignore=True
+    @staticmethod
+    def isMetaModelFile(filename):
+        if not fnmatch.fnmatch(filename, '*.mm_*'):
+            return False
+        for ignore_pattern in ProjectSetup.ignore_patterns:
+            if fnmatch.fnmatch(filename, ignore_pattern):
+                return False
+        return True
 
-                if not ignore:
+    def metaModelFiles(self):
+        # Names (relative to the project path) and paths of the meta-model files.
+        files = []
+        for root, dirnames, filenames in os.walk(self.path):
+            for filename in filenames:
+                if ProjectSetup.isMetaModelFile(filename):
                     name = (os.path.join(root, filename).split(self.path)[1])[1:]
-                    if name in self.files:
-                        self.files[name].reprocessFile(os.path.join(root, filename), self.path)
-                    else:
-                        self.files[name] = FileSetup(os.path.join(root, filename))
-                        self.files[name].preprocessFile(os.path.join(root, filename), self.path)
-        self.save()
+                    files.append((name, os.path.join(root, filename)))
+        return files
+
+    @timed()
+    def scanMM(self, progress=None, isCancelled=None):
+        """
+         Parse the meta-model files and return the resulting file setups,
+         indexed by file name, without modifying the project (see
+         applyMM()). It can therefore run in a background thread, provided
+         that the project is not modified meanwhile. progress(noFile,
+         nbFiles, name) is called after each file; OperationCancelled is
+         raised as soon as isCancelled() returns True.
+        """
+        files   = dict(self.files)
+        mmFiles = self.metaModelFiles()
+        for noFile, (name, path) in enumerate(mmFiles):
+            if not isCancelled is None and isCancelled():
+                raise OperationCancelled()
+            count("files parsed")
+            if name in files:
+                # The file setup of the project is left untouched.
+                files[name] = copy(files[name])
+                files[name].reprocessFile(path, self.path)
+            else:
+                files[name] = FileSetup(path)
+                files[name].preprocessFile(path, self.path)
+            if not progress is None:
+                progress(noFile+1, len(mmFiles), name)
+        return files
+
+    @timed()
+    def scanFiles(self, names):
+        """
+         As scanMM(), but only the meta-model files of names (relative to
+         the project path, e.g., as reported by watcher.ProjectWatcher) are
+         parsed; the other file setups are kept. Files of names that no
+         longer exist are left out of the returned file setups.
+        """
+        files = dict(self.files)
+        for name in names:
+            path = os.path.join(self.path, name)
+            if not os.path.isfile(path) or not ProjectSetup.isMetaModelFile(os.path.basename(name)):
+                files.pop(name, None)
+                continue
+            count("files parsed")
+            if name in files:
+                files[name] = copy(files[name])
+                files[name].reprocessFile(path, self.path)
+            else:
+                files[name] = FileSetup(path)
+                files[name].preprocessFile(path, self.path)
+        return files
+
+    def applyMM(self, files):
+        # Replace the file setups by those returned by scanMM(). The project
+        # is left unchanged if the dependencies of the new parameters are
+        # invalid (ValueError).
+        oldFiles = self.files
+        self.files = files
+        self._dependencyGraph = None
+        try:
+            self.recomputeDerived()
+        except ValueError:
+            self.files = oldFiles
+            self._dependencyGraph = None
+            raise
+        self.markDirty()
 
     def isComplete(self):
         for f in self.files:
@@ -61,9 +156,39 @@ class ProjectSetup:
                 return False
         return True
 
+    @timed()
     def save(self):
-        with open(os.path.join(self.path, ".mmproject.pck"), 'wb') as f:
-            pickle.dump(self, f)
+        self.writeSnapshot(self.snapshot())
+
+    def snapshot(self):
+        # Pickled project, to be taken from the thread modifying it.
+        return pickle.dumps(self)
+
+    def writeSnapshot(self, data):
+        # Write to a temporary file first so that an interrupted save
+        # never leaves a truncated project file behind.
+        fileName = os.path.join(self.path, ".mmproject.pck")
+        with open(fileName + ".tmp", 'wb') as f:
+            f.write(data)
+        os.replace(fileName + ".tmp", fileName)
+
+    def enableAutosave(self, delay=None, timerFactory=None):
+        # Once enabled, markDirty() coalesces the save requests. The project
+        # is pickled from the thread running the timers (see AutoSaver) and
+        # written from a background thread, timed as "ProjectSetup.autosave".
+        if self.autoSaver is None:
+            self.autoSaver = AutoSaver(self.snapshot, timed("ProjectSetup.autosave")(self.writeSnapshot),
+                                       delay, timerFactory=timerFactory)
+
+    def markDirty(self):
+        if self.autoSaver is None:
+            self.save()
+        else:
+            self.autoSaver.markDirty()
+
+    def flush(self):
+        if not self.autoSaver is None:
+            self.autoSaver.flush()
 
     @staticmethod
     def load(path):
@@ -73,17 +198,115 @@ class ProjectSetup:
         except:
             return None
 
-    def generateModel(self):
-        for f in self.files:
+    def getParameter(self, node):
+        fileName, paramKey = node
+        return self.files[fileName].parameters[paramKey]
+
+    def setParameter(self, fileName, paramKey, parameter):
+        self.files[fileName].parameters[paramKey] = parameter
+        # The new parameter may not have the same dependencies.
+        self._dependencyGraph = None
+
+    @property
+    def dependencyGraph(self):
+        if self._dependencyGraph is None:
+            self._dependencyGraph = DependencyGraph(self)
+        return self._dependencyGraph
+
+    def updateInputs(self, node):
+        # Upstream values are read in topological order, so that they are
+        # evaluated before their dependents. They are given with their
+        # units since parameters can be specified in different units.
+        bindings = self.dependencyGraph.bindings[node]
+        self.getParameter(node).inputs = {name:(self.getParameter(upstream).value, self.getParameter(upstream).unit)
+                                          for name, upstream in bindings.items()}
+
+    def parameterChanged(self, fileName, paramKey):
+        """
+         Update the parameters depending on the given parameter. Only its
+         downstream dependents are recomputed. Return their nodes, as
+         (fileName, paramKey) tuples.
+        """
+        updated = self.dependencyGraph.downstream([(fileName, paramKey)])
+        for node in updated:
+            self.updateInputs(node)
+        return updated
+
+    def recomputeDerived(self):
+        for node in self.dependencyGraph.derivedNodes():
+            self.updateInputs(node)
+
+    @timed()
+    def evaluate(self):
+        # Evaluate in batch the values that have not been computed yet.
+        # Reading them afterwards does not modify the project.
+        evaluateParameters([parameter for fileSetup in self.files.values() 
+                                      for parameter in fileSetup.parameters.values()])
+        self.recomputeDerived()
+        for node in self.dependencyGraph.derivedNodes():
+            self.getParameter(node).value
+
+    def aggregate(self, nBootstrap=500, confidence=0.95, seed=0):
+        # Statistics of the reference values of every literature-backed 
+        # parameter, computed in a single pass.
+        aggregateParameters([parameter for fileSetup in self.files.values() 
+                                       for parameter in fileSetup.parameters.values()],
+                            nBootstrap, confidence, seed)
+
+    @timed()
+    def generateModel(self, progress=None, isCancelled=None, evaluate=True):
+        # progress and isCancelled: see scanMM(). Files generated before a
+        # cancellation are kept. With evaluate False, the project must have
+        # been evaluated beforehand (see evaluate()) and it is only read,
+        # e.g., from a background thread.
+        if evaluate:
+            self.evaluate()
+        for noFile, f in enumerate(self.files):
+            if not isCancelled is None and isCancelled():
+                raise OperationCancelled()
             self.files[f].generateModel()
-
+            count("files generated")
+            if not progress is None:
+                progress(noFile+1, len(self.files), f)
+
+    def affectedFiles(self, names):
+        # Files whose generated model depends on the files of names: these
+        # files and those holding parameters derived from their parameters.
+        names = [name for name in names if name in self.files]
+        nodes = [(name, paramKey) for name in names for paramKey in self.files[name].parameters]
+        return sorted(set(names) | set([node[0] for node in self.dependencyGraph.downstream(nodes)]))
+
+    @timed()
+    def generateFiles(self, names):
+        # As generateModel(), for the files of names only.
+        self.evaluate()
+        for name in names:
+            self.files[name].generateModel()
+            count("files generated")
+
+    def generateEnsemble(self, outputDir, nbVariants, ranges=None, sampleLiterature=True,
+                         referenceSpread=False, seed=0, nbWorkers=None):
+        # Write nbVariants variants of the model in outputDir (see 
+        # ensemble.Ensemble). Return the path of the manifest.
+        ensemble = Ensemble(self, nbVariants, ranges, sampleLiterature, referenceSpread, seed)
+        return ensemble.write(outputDir, nbWorkers)
+
+    # Short descriptions: the complete content of a project is given by
+    # toJSON() or, for large projects, written by export.exportProject().
     def __str__(self):
-        return str(self.toJSON())
+        return ("ProjectSetup(" + repr(self.path) + ", " + str(len(self.files)) + " files, " +
+                str(sum([len(fileSetup.parameters) for fileSetup in self.files.values()])) + " parameters)")
 
     def __repr__(self):
-        return str(self.toJSON())
+        return str(self)
 
     def toJSON(self):
+        # Missing reference statistics are computed for the whole project in
+        # a single pass before the parameters are exported.
+        if any([parameter._statistics is None for fileSetup in self.files.values()
+                for parameter in fileSetup.parameters.values()
+                if isinstance(parameter, ModelParameterInstance) and len(parameter.references)]):
+            self.aggregate()
         return {"path": self.path,
                 "files": {fName:f.toJSON() for fName, f in self.files.items()},
                 "properties":self.properties}
@@ -91,11 +314,19 @@ class ProjectSetup:
 
 class FileSetup:
 
-    parameterTypes = getParameterTypes()
-    
+    # Parameter types known by NAT, loaded on first use (see getParameterTypes()).
+    parameterTypes = None
+
+    @staticmethod
+    def getParameterTypes():
+        if FileSetup.parameterTypes is None:
+            from nat.modelingParameter import getParameterTypes
+            FileSetup.parameterTypes = getParameterTypes()
+        return FileSetup.parameterTypes
+
     def getIDFromName(paramName):
         paramID = None
-        for paramType in FileSetup.parameterTypes:
+        for paramType in FileSetup.getParameterTypes():
             if paramType.name == paramName:
                 paramID = paramType.ID
                 break
@@ -104,6 +335,24 @@ class FileSetup:
     def __init__(self, fileName):
         self.fileName = fileName
         self.parameters = ParamDic() # Indexed by parameter name
+        self.contextIndex = None
+
+    def __getstate__(self):
+        # The context index holds the lines of the file. It is rebuilt
+        # on demand rather than being saved with the project.
+        state = self.__dict__.copy()
+        state["contextIndex"] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("contextIndex", None)
+        self.__dict__.update(state)
+
+    def getContextIndex(self, projectPath):
+        path = os.path.join(projectPath, self.fileName)
+        if self.contextIndex is None or self.contextIndex.path != path or self.contextIndex.isStale():
+            self.contextIndex = FileContextIndex(path)
+        return self.contextIndex
 
     def isComplete(self):
         for key in self.parameters:
@@ -144,23 +393,31 @@ class FileSetup:
     def reprocessFile(self, fileName, projectPath):
         parser = TagParser()
 
-        with open(os.path.join(projectPath, fileName), 'r') as f:
-            fileText = f.read()
+        # Tags are tokenized once while building the context index
+        # used by the code viewer.
+        self.contextIndex = FileContextIndex(os.path.join(projectPath, fileName))
 
         oldDic = deepcopy(self.parameters)
         self.parameters = ParamDic()
-        for paramStr in parser.getParamStr(fileText):
+        for paramKey, paramStr in self.contextIndex.tags.items():
         
-            parser.getArgs(paramStr)            
             paramName = parser.getParamName(paramStr)   
             args      = parser.getArgs(paramStr)  
-            paramKey  = parser.getParamKey(paramStr)
 
             if paramKey in oldDic:
                 self.parameters[paramKey] = oldDic[paramKey]
             else:
                 paramID = FileSetup.getIDFromName(paramName)
-                if paramID is None:
+                if "expr" in args:
+                    parameter = DerivedParameterInstance(paramName, Transformation(args["expr"]))
+                elif "array" in args:
+                    parameter = ArrayParameterInstance(paramName, args["array"], requiredUnit=args.get("unit"))
+                    if "source" in args:
+                        # Paths in tags are relative to the meta-model file.
+                        parameter.setValue(os.path.normpath(os.path.join(os.path.dirname(fileName), args["source"])),
+                                           args.get("unit"))
+                        parameter.justification = "Array read from " + args["source"] + " (specified in the meta-model)."
+                elif paramID is None:
                     parameter = CustomParameterInstance(paramName)
                 else:
                     parameter = ModelParameterInstance(paramID)
@@ -175,24 +432,27 @@ class FileSetup:
 
 
     def generateModel(self):
-        with open(self.fileName, 'r') as f:
-            text = f.read()
-
-        for name, parameter in self.parameters.items():
-            parser = TagParser()
-            tagStr = parser.getParamTagStr(name, text)            
-            
-            text = text.replace(tagStr, str(parameter.value))
+        template  = ModelTemplate(self.fileName)
+        valueStrs = []
+        for noKey, paramKey in enumerate(template.keys):
+            parameter = self.parameters[paramKey]
+            if isinstance(parameter, ArrayParameterInstance):
+                sidecarName = template.sidecarName(noKey, ArrayParameterInstance.extensions[parameter.format])
+                parameter.writeSidecar(sidecarName)
+                valueStrs.append(parameter.loaderReference(template.outputName, sidecarName))
+            else:
+                valueStrs.append(str(parameter.value))
 
-        with open(self.fileName.replace(".mm_", "."), 'w') as f:
+        text = template.render(valueStrs)
+        with open(template.outputName, 'w') as f:
             f.write(text)
 
 
     def __str__(self):
-        return str(self.toJSON())
+        return "FileSetup(" + repr(self.fileName) + ", " + str(len(self.parameters)) + " parameters)"
 
     def __repr__(self):
-        return str(self.toJSON())
+        return str(self)
 
     def toJSON(self):
         return {"fileName": self.fileName,
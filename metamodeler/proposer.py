@@ -3,144 +3,193 @@
 __author__ = "Christian O'Reilly"
 
 
-import quantities as pq
 from copy import copy
 
+import numpy as np
 from PySide import QtCore, QtGui
 
-from nat.treeData import getChildrens
-from nat.ontoManager import OntoManager  
-
 from .referenceManager import ReferenceManager
+from . import ranking
 
 class PropositionTableModel(QtCore.QAbstractTableModel):
-
-    ontoMng = OntoManager()
-    treeData = ontoMng.trees 
-    dicData  = ontoMng.dics
-    invDicData  = {value:key for key, value in dicData.items()}
-    
-    baseHeader = ["value", "unit", "authors", "year", "journal", "species", "cell type"]
+    """
+     Table of the propositions ranked by ranking.rankPropositions().
+
+     The model is virtualized: rows are exposed to the view by batches of
+     batchSize (see canFetchMore()/fetchMore()) and their display text is
+     only computed when they are painted. Sorting and filtering are done in
+     the model, on arrays of sort keys and of lower-case display strings
+     built (once per column) only when a column is sorted or filtered.
+     self.order holds the indexes in self.propositions of the rows of the
+     view; propositions must be accessed through proposition(row).
+    """
+
+    baseHeader = ranking.baseHeader
+    batchSize  = 200
     
     def __init__(self, *args):
         super(PropositionTableModel, self).__init__(*args)
 
-        self.header = copy(PropositionTableModel.baseHeader)
+        self.header       = copy(PropositionTableModel.baseHeader)
         self.propositions = []
-        self.refMng = ReferenceManager()
+        self.refMng       = ReferenceManager()
 
-    def refreshData(self, parameterDF, attributes={}):
-        self.propositions = []
-        for index, row in parameterDF.iterrows():
-            pubData = self.refMng.getInfoFromID(row["obj_annotation"].pubId)
-            proposition = {}
-            proposition["value"]     = row["Values"]
-            proposition["unit"]      = row["Unit"]
-            proposition["species"]    = "; ".join([spec.name + " (" + spec.id + ")" for spec in row["Species"]])
-            proposition["speciesTag"]  = row["Species"]
-            proposition["cell type"] = row["Cell"]
-            proposition["authors"]  = pubData["authors"]
-            proposition["year"]     = pubData["year"]
-            proposition["journal"]  = pubData["journal"]
-            proposition["obj_annotation"] = row["obj_annotation"]
-            proposition["obj_parameter"]  = row["obj_parameter"]
-            
-            self.header = copy(PropositionTableModel.baseHeader)
-            for reqTag in row["obj_parameter"].requiredTags:
-                rootName = PropositionTableModel.dicData[reqTag.rootId]
-                if rootName != "Cell":
-                    self.header.append(rootName)
-                    proposition[rootName] = reqTag.name
-                        
-            proposition["score"]          = 0.0
-            proposition["color"]          = []
-            self.propositions.append(proposition)
-          
-    
-        self.computeScores(attributes)
-        self.propositions = sorted(self.propositions, key=lambda prop: prop["score"], reverse=True)
-        self.refresh()
+        self.order        = np.arange(0)
+        self.shownIds     = None
+        self.nbFetched    = 0
+        self.sortKey      = None   # Header name of the sorted column (None: by score)
+        self.sortOrder    = QtCore.Qt.AscendingOrder
+        self.filters      = {}     # Header name (None: any column) -> filtered text
+        self.sortKeys     = {}     # Cache of the sort keys of the columns
+        self.texts        = {}     # Cache of the lower-case display strings of the columns
 
 
+    def refreshData(self, parameterDF, attributes={}):
+        self.beginResetModel()
+        self.propositions, self.header = ranking.rankPropositions(parameterDF, attributes, self.refMng)
+        self.sortKeys = {}
+        self.texts    = {}
+        if not self.sortKey in self.header:
+            self.sortKey = None
+        self.filters  = {key:text for key, text in self.filters.items() if key is None or key in self.header}
+        self.updateOrder()
+        self.endResetModel()
+
 
     def computeScores(self, attributes):
-        
-        for proposition in self.propositions:        
-            
-            if "unit" in attributes:
-                #weight -10            
-                quant = pq.Quantity(proposition["value"], proposition["unit"])
-                try:
-                    quant = quant.rescale(attributes["unit"])
-                    proposition["value"] = quant.item() 
-                    proposition["unit"]  = str(quant.dimensionality)
-                except:
-                    proposition["score"] -= 10
-                    proposition["color"].append("unit")
-                            
-            if "species" in attributes:
-                # weight +/- 1  for right or wrong species... 
-                # but would idealy consider the "distance" between species
-
-                speciesHit = False
-                if len(proposition["speciesTag"]) != 0:                         
-                    # The requested species (e.g., Rat id)...                    
-                    acceptableSpecies = [attributes["species"]]
-                    # The sublases of the resquested species (e.g., Wistar rat id...)
-                    acceptableSpecies.extend(getChildrens(attributes["species"]).keys())                
-                    for species in proposition["speciesTag"]:
-                        if species.id in acceptableSpecies:
-                            speciesHit = True
-                            break
-                        
-                if speciesHit:
-                    proposition["score"] += 1                     
-                else:
-                    proposition["score"] -= 1
-                    proposition["color"].append("species")
-
-
-            if "cell_type" in attributes:
-                hit = False
-                for reqTag in proposition["obj_parameter"].requiredTags:
-                    if reqTag.rootId in ["NIFCELL:sao1813327414", "sao1813327414"]:
-                        acceptable = [attributes["cell_type"]]
-                        # The sublases of the resquested species (e.g., Wistar rat id...)
-                        acceptable.extend(getChildrens(attributes["cell_type"]).keys())  
-                        if reqTag.id in acceptable:
-                            hit = True
-                            break
-                if hit:
-                    proposition["score"] += 2                     
-                else:                        
-                    proposition["score"] -= 2
-                    proposition["color"].append("cell type")
-
-
-            for reqTag in proposition["obj_parameter"].requiredTags:
-                rootName = PropositionTableModel.dicData[reqTag.rootId] 
-                if rootName in attributes:
-                    attributeKey = PropositionTableModel.invDicData[attributes[rootName]] 
-                    acceptable = [attributeKey]
-                    acceptable.extend(getChildrens(attributeKey).keys())  
-                    if reqTag.id in acceptable:
-                        proposition["score"] += 1
-                    else:
-                        proposition["score"] -= 1
-                        proposition["color"].append(rootName)
-                            
-
-                        
-            #"brain_region"
-  
-    
-            #if "cell_type" in attributes:
-            #    #weight -2
-            #    ...
-            
+        ranking.computeScores(self.propositions, attributes)
+
+
+    @staticmethod
+    def displayText(value):
+        if value is None:
+            return None
+        if isinstance(value, float):
+            return "{:g}".format(value)
+        return str(value)
+
+
+    def columnTexts(self, key):
+        if not key in self.texts:
+            texts = [PropositionTableModel.displayText(proposition.get(key)) for proposition in self.propositions]
+            self.texts[key] = np.array(["" if text is None else text.lower() for text in texts], dtype=str)
+        return self.texts[key]
+
+
+    def columnSortKeys(self, key):
+        # Integer ranks of the values of the column. Columns whose values
+        # are all numbers are sorted numerically, the others by text.
+        if not key in self.sortKeys:
+            values = [proposition.get(key) for proposition in self.propositions]
+            try:
+                keys = np.array([np.nan if value is None else float(value) for value in values])
+            except (TypeError, ValueError):
+                keys = self.columnTexts(key)
+            self.sortKeys[key] = np.unique(keys, return_inverse=True)[1].ravel()
+        return self.sortKeys[key]
+
+
+    def updateOrder(self):
+        # Must be called between begin/endResetModel().
+        order = np.arange(len(self.propositions))
+        for key, text in self.filters.items():
+            text = text.lower()
+            columns = self.header if key is None else [key]
+            hit     = np.zeros(len(self.propositions), dtype=bool)
+            for column in columns:
+                hit |= np.char.find(self.columnTexts(column), text) >= 0
+            order = order[hit[order]]
+
+        if not self.sortKey is None:
+            ranks = self.columnSortKeys(self.sortKey)[order]
+            if self.sortOrder == QtCore.Qt.DescendingOrder:
+                ranks = -ranks
+            order = order[np.argsort(ranks, kind="stable")]
+
+        self.order     = order
+        self.shownIds  = None
+        self.nbFetched = min(len(order), PropositionTableModel.batchSize)
+
+
+    def setFilter(self, key, text):
+        # Show only the rows whose column key (any column if key is None)
+        # contains text (case-insensitive). An empty text removes the filter.
+        self.beginResetModel()
+        if text == "":
+            self.filters.pop(key, None)
+        else:
+            self.filters[key] = text
+        self.updateOrder()
+        self.endResetModel()
+
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        # Sorting on an invalid column restores the ranking by score. Rows
+        # are not all fetched, so the model is reset rather than laid out
+        # again.
+        self.beginResetModel()
+        self.sortKey   = self.header[column] if 0 <= column < len(self.header) else None
+        self.sortOrder = order
+        self.updateOrder()
+        self.endResetModel()
+
+
+    def proposition(self, row):
+        return self.propositions[self.order[row]]
+
+
+    def rowsOfIds(self, ids):
+        # Rows (sorted) of the view showing the parameter instances of the set ids.
+        return [row for row, no in enumerate(self.order) if self.propositions[no]["obj_parameter"].id in ids]
+
+
+    @staticmethod
+    def rowRanges(rows):
+        # Group sorted rows into (first, last) ranges of contiguous rows.
+        ranges = []
+        for row in rows:
+            if len(ranges) and ranges[-1][1] == row-1:
+                ranges[-1][1] = row
+            else:
+                ranges.append([row, row])
+        return [tuple(rowRange) for rowRange in ranges]
+
+
+    def isShown(self, id):
+        # Whether the proposition of the parameter instance id passes the filters.
+        if self.shownIds is None:
+            self.shownIds = set([self.propositions[no]["obj_parameter"].id for no in self.order])
+        return id in self.shownIds
+
+
+    @property
+    def nbRows(self):
+        # Number of rows of the view, fetched or not.
+        return len(self.order)
+
+
+    def fetchUpTo(self, row):
+        # Make sure that row is fetched (e.g., to select it).
+        if row >= self.nbFetched:
+            self.beginInsertRows(QtCore.QModelIndex(), self.nbFetched, row)
+            self.nbFetched = row+1
+            self.endInsertRows()
+
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and self.nbFetched < len(self.order)
+
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return
+        self.fetchUpTo(min(len(self.order), self.nbFetched + PropositionTableModel.batchSize)-1)
+
 
     def rowCount(self, parent = None):
-        return len(self.propositions)
+        if not parent is None and parent.isValid():
+            return 0
+        return self.nbFetched
 
     def columnCount(self, parent = None):
         return len(self.header)
@@ -151,16 +200,8 @@ class PropositionTableModel(QtCore.QAbstractTableModel):
         if not index.isValid():
             return None
 
-
-        #if role == QtCore.Qt.BackgroundRole:
-        #    if self.checkIdFct(self.getID(index.row())):
-        #        return QtGui.QBrush(QtGui.QColor(215, 214, 213), QtCore.Qt.SolidPattern)
-        #    else:
-        #        return None
-
-
         if role == QtCore.Qt.BackgroundRole:
-            colorDic = self.propositions[index.row()]["color"]
+            colorDic = self.proposition(index.row())["color"]
             if self.header[index.column()] in colorDic:
                 color = QtGui.QColor(255, 255, 0)
                 return QtGui.QBrush(color, QtCore.Qt.SolidPattern)
@@ -168,10 +209,8 @@ class PropositionTableModel(QtCore.QAbstractTableModel):
 
 
         if role == QtCore.Qt.DisplayRole:
-            try:
-                return self.propositions[index.row()][self.header[index.column()]]
-            except KeyError:
-                return None
+            proposition = self.proposition(index.row())
+            return PropositionTableModel.displayText(proposition.get(self.header[index.column()]))
         return None
 
 
@@ -180,15 +219,7 @@ class PropositionTableModel(QtCore.QAbstractTableModel):
             return self.header[col]
         return None
 
-    #def sort(self, col, order):
-    #    #sort table by given column number col
-    #    self.emit(QtCore.SIGNAL("layoutAboutToBeChanged()"))
-    #    reverse = (order == QtCore.Qt.DescendingOrder)
-    #    self.refList = sorted(self.refList, key=lambda x: self.getByIndex(x, col), reverse = reverse)
-    #    self.emit(QtCore.SIGNAL("layoutChanged()"))
-
     def refresh(self):
-        self.emit(QtCore.SIGNAL("layoutChanged()"))
-
-
-
+        self.beginResetModel()
+        self.updateOrder()
+        self.endResetModel()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 14:05:31 2026
+
+@author: oreilly
+"""
+
+import numpy as np
+import quantities as pq
+
+from .referenceManager import ReferenceManager
+from .ontologyIndex import OntologyIndex
+from .instrumentation import timed, count
+
+
+# Ranking of the annotated parameter instances returned by a search of the
+# corpus (a DataFrame as returned by nat ParameterSearch.search()) against
+# a dictionary of attributes (project properties and tag arguments). This
+# module does not depend on Qt so that the ranking can be used by batch
+# jobs and worker processes. PropositionTableModel (proposer.py) displays
+# its results. The ontology terms are looked up in an OntologyIndex (by
+# default, the index shared by the process).
+
+
+baseHeader = ["value", "unit", "authors", "year", "journal", "species", "cell type"]
+
+# Roots of the cell type tags.
+cellRootIds = ["NIFCELL:sao1813327414", "sao1813327414"]
+
+
+@timed()
+def buildPropositions(parameterDF, refMng=None, ontology=None):
+    """
+     Build the propositions (dictionaries with the displayed fields and
+     the nat objects of the annotated instance) of the rows of parameterDF.
+     Return the propositions and the header of their table: the base
+     header followed by the roots of their required tags.
+    """
+    if refMng is None:
+        refMng = ReferenceManager()
+    if ontology is None:
+        ontology = OntologyIndex.shared()
+
+    header       = list(baseHeader)
+    propositions = []
+    pubInfos     = {} # Publications often have several annotated instances.
+    for index, row in parameterDF.iterrows():
+        pubId = row["obj_annotation"].pubId
+        if not pubId in pubInfos:
+            pubInfos[pubId] = refMng.getInfoFromID(pubId)
+        pubData = pubInfos[pubId]
+
+        proposition = {}
+        proposition["value"]          = row["Values"]
+        proposition["unit"]           = row["Unit"]
+        proposition["species"]        = "; ".join([spec.name + " (" + spec.id + ")" for spec in row["Species"]])
+        proposition["speciesTag"]     = row["Species"]
+        proposition["cell type"]      = row["Cell"]
+        proposition["authors"]        = pubData["authors"]
+        proposition["year"]           = pubData["year"]
+        proposition["journal"]        = pubData["journal"]
+        proposition["obj_annotation"] = row["obj_annotation"]
+        proposition["obj_parameter"]  = row["obj_parameter"]
+
+        for reqTag in row["obj_parameter"].requiredTags:
+            rootName = ontology.nameFromId(reqTag.rootId)
+            if rootName != "Cell":
+                if not rootName in header:
+                    header.append(rootName)
+                proposition[rootName] = reqTag.name
+
+        proposition["score"] = 0.0
+        proposition["color"] = []
+        propositions.append(proposition)
+
+    count("propositions", len(propositions))
+    return propositions, header
+
+
+
+def rescaleFactor(unit, requiredUnit):
+    # Factor and unit string of the rescaling of unit into requiredUnit,
+    # or None if the units are not compatible.
+    try:
+        quant = pq.Quantity(1.0, unit).rescale(requiredUnit)
+    except Exception:
+        return None
+    return float(np.array(quant)), str(quant.dimensionality)
+
+
+@timed()
+def computeScores(propositions, attributes, ontology=None):
+    """
+     Score the propositions against attributes. Each mismatching attribute
+     lowers the score and is added to the "color" list of the proposition
+     (to be highlighted); matches raise it:
+         unit      : -10 if the value cannot be expressed in this unit (the
+                     value is otherwise rescaled),
+         species   : +/-1 depending on whether one of the species of the
+                     proposition is this species or one of its subclasses,
+         cell_type : +/-2, likewise for the cell type tags,
+         any other attribute named after the root of a required tag of the
+         proposition: +/-1, likewise.
+    """
+    if ontology is None:
+        ontology = OntologyIndex.shared()
+
+    if "unit" in attributes:
+        # The units are rescaled once for each distinct unit.
+        factors = {}
+        for proposition in propositions:
+            unit = proposition["unit"]
+            if not unit in factors:
+                factors[unit] = rescaleFactor(unit, attributes["unit"])
+            if factors[unit] is None or np.size(proposition["value"]) != 1:
+                proposition["score"] -= 10
+                proposition["color"].append("unit")
+            else:
+                factor, unitStr = factors[unit]
+                proposition["value"] = float(np.asarray(proposition["value"], dtype=float).item())*factor
+                proposition["unit"]  = unitStr
+
+    for proposition in propositions:
+
+        if "species" in attributes:
+            # Would ideally consider the "distance" between species.
+            speciesHit = any([ontology.isA(species.id, attributes["species"])
+                              for species in proposition["speciesTag"]])
+            if speciesHit:
+                proposition["score"] += 1
+            else:
+                proposition["score"] -= 1
+                proposition["color"].append("species")
+
+        if "cell_type" in attributes:
+            hit = any([ontology.isA(reqTag.id, attributes["cell_type"])
+                       for reqTag in proposition["obj_parameter"].requiredTags
+                       if reqTag.rootId in cellRootIds])
+            if hit:
+                proposition["score"] += 2
+            else:
+                proposition["score"] -= 2
+                proposition["color"].append("cell type")
+
+        for reqTag in proposition["obj_parameter"].requiredTags:
+            rootName = ontology.nameFromId(reqTag.rootId)
+            if rootName in attributes:
+                if ontology.isA(reqTag.id, ontology.idFromName(attributes[rootName])):
+                    proposition["score"] += 1
+                else:
+                    proposition["score"] -= 1
+                    proposition["color"].append(rootName)
+
+
+
+def rankPropositions(parameterDF, attributes={}, refMng=None, ontology=None):
+    """
+     Build, score and sort (by decreasing score) the propositions of
+     parameterDF. Return the propositions and the header of their table.
+    """
+    propositions, header = buildPropositions(parameterDF, refMng, ontology)
+    computeScores(propositions, attributes, ontology)
+    scores = np.array([proposition["score"] for proposition in propositions])
+    # Stable sort, so that propositions with equal scores keep their order.
+    order  = np.argsort(-scores, kind="stable")
+    return [propositions[no] for no in order], header
@@ -5,12 +5,21 @@ Created on Tue Oct 25 18:16:16 2016
 @author: oreilly
 """
 
-
-from nat.id import getInfoFromID
 import pickle
+import threading
+
+from .instrumentation import span, count
+from .utils import lazyImport
+
+natId = lazyImport("nat.id")
 
 class ReferenceManager:
     
+    # The cache file is shared by all the instances, which may be used
+    # from several threads (e.g., for automatic curation). The lock is only
+    # held while the file is read or written, so that publications are
+    # fetched concurrently.
+    lock = threading.RLock()
         
     def getInfoFromID(self, pubId, alwaysFetch=False):
         """
@@ -18,30 +27,40 @@ class ReferenceManager:
          information in a pickle file and query the services only if the info
          has not already been cached. 
         """
-    
-        if not alwaysFetch:
+        with span("ReferenceManager.getInfoFromID"):
+            if not alwaysFetch:
+                infoPub = self.__loadCache()
+                if pubId in infoPub:
+                    return infoPub[pubId]
+            info = self.__fetch(pubId)
+            if info is None:
+                return None
+            with ReferenceManager.lock:
+                # Publications may have been added by other threads
+                # since the cache has been read.
+                infoPub = self.__loadCache()
+                infoPub[pubId] = info
+                try:
+                    with open("pubInfo.bin", "wb") as infoFile:
+                        pickle.dump(infoPub, infoFile)
+                except:
+                    pass        
+            return info
+
+    def __loadCache(self):
+        with ReferenceManager.lock:
             try:
                 with open("pubInfo.bin", "rb") as infoFile:
-                    infoPub = pickle.load(infoFile)
-                    
-                if pubId in infoPub:
-                    return infoPub[pubId]                
+                    return pickle.load(infoFile)
             except:
-                infoPub = {}
-        
+                return {}
+
+    def __fetch(self, pubId):
+        count("publication fetches")
         NB_TRY_MAX = 3
         for tryNo in range(NB_TRY_MAX):
             try:
-                infoPub[pubId] = getInfoFromID(pubId)
-                break
+                return natId.getInfoFromID(pubId)
             except ConnectionResetError:
                 if tryNo == NB_TRY_MAX-1:
                     return None
-    
-        try:
-            with open("pubInfo.bin", "wb") as infoFile:
-                pickle.dump(infoPub, infoFile)
-        except:
-            pass        
-    
-        return infoPub[pubId]   
\ No newline at end of file
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 13:41:52 2026
+
+@author: oreilly
+"""
+
+import threading
+
+from .utils import lazyImport
+
+np = lazyImport("numpy")
+
+
+class ReferenceSummary:
+    """
+     What a project keeps of an annotated parameter instance of the corpus:
+     its ID, the annotation and publication it comes from and a cached
+     value/unit summary, along with the spread (standard deviation) and
+     sample size of the value when the annotation reports them. It provides
+     the same centralTendancy()/unit/toJSON interface as nat
+     ParameterInstance objects so that it can stand in for them when the
+     corpus is not available.
+    """
+
+    __slots__ = ("id", "value", "unit", "annotationId", "pubId", "spread", "size")
+
+    def __init__(self, id, value, unit, annotationId=None, pubId=None, spread=None, size=None):
+        self.id           = id
+        self.value        = value
+        self.unit         = unit
+        self.annotationId = annotationId
+        self.pubId        = pubId
+        self.spread       = spread
+        self.size         = size
+
+    def __getstate__(self):
+        return {name:getattr(self, name) for name in ReferenceSummary.__slots__}
+
+    def __setstate__(self, state):
+        # Summaries saved by older versions may lack some of the fields.
+        if isinstance(state, tuple):
+            state = state[1]
+        for name in ReferenceSummary.__slots__:
+            setattr(self, name, state.get(name))
+
+    def centralTendancy(self):
+        return self.value
+
+    def __eq__(self, other):
+        if not isinstance(other, ReferenceSummary):
+            return NotImplemented
+        return all([getattr(self, name) == getattr(other, name) for name in ReferenceSummary.__slots__])
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def toJSON(self):
+        return {"id": self.id,
+                "value": self.value,
+                "unit": self.unit,
+                "annotationId": self.annotationId,
+                "pubId": self.pubId,
+                "spread": self.spread,
+                "size": self.size}
+
+
+
+def positiveStatistic(value):
+    # Degenerate (non-finite or non-positive) statistics are returned as None.
+    value = float(value)
+    if not np.isfinite(value) or value <= 0:
+        return None
+    return value
+
+
+def referenceStatistics(reference):
+    """
+     Spread (standard deviation) and sample size of the values of a nat
+     ParameterInstance, as reported by the statistics of its dependent
+     variable (description.depVar.values): "sd", "deviation", "var" or
+     "sem" (converted using "N") and "N" for compound values, or the
+     standard deviation and number of the values themselves for raw
+     values. Statistics that are not reported are returned as None. With
+     several samples, the spread is their mean and the sample size is
+     their sum (their mean for traces, whose samples are points of the
+     same recordings). These statistics are optional: references without
+     these fields (e.g., analytical variables or objects of other nat
+     versions) have none.
+    """
+    try:
+        description = reference.description
+        values      = description.depVar.values
+        valueLst    = getattr(values, "valueLst", [values])
+        stats       = {value.statistic: np.asarray(value.values, dtype=float) for value in valueLst}
+        combine     = np.sum if description.aggregationDefaultType == "across" else np.mean
+    except (AttributeError, TypeError, ValueError):
+        return None, None
+
+    size    = positiveStatistic(combine(stats["N"])) if "N" in stats else None
+
+    if "sd" in stats:
+        spreads = stats["sd"]
+    elif "deviation" in stats:
+        spreads = stats["deviation"]
+    elif "var" in stats:
+        spreads = np.sqrt(stats["var"])
+    elif "sem" in stats:
+        # Without the sample size, the standard error stands for the spread
+        # (see aggregation.aggregate()).
+        spreads = stats["sem"]*np.sqrt(stats["N"]) if "N" in stats else stats["sem"]
+    elif "raw" in stats and stats["raw"].size > 1:
+        return positiveStatistic(np.std(stats["raw"], ddof=1)), float(stats["raw"].size)
+    else:
+        return None, size
+    return positiveStatistic(np.mean(spreads)), size
+
+
+
+class ReferenceStore:
+    """
+     Resolve the IDs of annotated parameter instances to the nat
+     ParameterInstance objects. Instances are either registered explicitly
+     (e.g., from search results) or looked up in the compiled corpus, which
+     is indexed on first use.
+    """
+
+    def __init__(self, compiledCorpus=None):
+        self.instances   = {} # Indexed by parameter instance ID
+        self.annotations = {} # Annotation of each parameter instance
+        self.lock        = threading.Lock()
+        self.setCorpus(compiledCorpus)
+
+
+    def setCorpus(self, compiledCorpus):
+        # The instances of the previous corpus, indexed or registered, are
+        # dropped so that they are resolved again from the new one.
+        with self.lock:
+            self.compiledCorpus = compiledCorpus
+            self.corpusIndexed  = False
+            self.instances.clear()
+            self.annotations.clear()
+
+
+    def indexCorpus(self):
+        # Must be called with self.lock acquired.
+        if self.corpusIndexed or self.compiledCorpus is None:
+            return
+        for annotation in self.compiledCorpus.annotations:
+            for parameter in annotation.parameters:
+                self.instances[parameter.id]   = parameter
+                self.annotations[parameter.id] = annotation
+        self.corpusIndexed = True
+
+
+    def register(self, parameter, annotation=None):
+        with self.lock:
+            self.instances[parameter.id] = parameter
+            if not annotation is None:
+                self.annotations[parameter.id] = annotation
+
+
+    def resolve(self, id):
+        with self.lock:
+            if not id in self.instances:
+                self.indexCorpus()
+            return self.instances.get(id)
+
+
+    def summarize(self, reference):
+        if isinstance(reference, ReferenceSummary):
+            return reference
+
+        with self.lock:
+            annotation = self.annotations.get(reference.id)
+        if annotation is None:
+            annotationId = pubId = None
+        else:
+            annotationId = annotation.ID
+            pubId        = annotation.pubId
+
+        value = float(np.mean(reference.centralTendancy()))
+        spread, size = referenceStatistics(reference)
+        return ReferenceSummary(reference.id, value, reference.unit, annotationId, pubId, spread, size)
@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 29 09:27:40 2026
+
+@author: oreilly
+"""
+
+import os
+import sys
+import stat
+import time
+import pickle
+import socket
+import struct
+import argparse
+import tempfile
+import threading
+import traceback
+import socketserver
+from collections import OrderedDict
+
+from nat.annotationSearch import ParameterSearch
+
+from .modelParameter import ModelParameterInstance
+from .referenceManager import ReferenceManager
+from .ontologyIndex import OntologyIndex
+from .projectSetup import ProjectSetup
+from .ranking import rankPropositions
+from .corpus import compileCorpus, openCorpus, defaultDBPath
+from . import instrumentation
+
+
+# Local service holding, in a single process, the compiled corpus, its
+# searcher, the ontology index and the publication information, so that
+# several windows and headless tools share them instead of each loading
+# them. Clients connect to a Unix socket; requests and responses are pickled
+# objects prefixed by their length (8 bytes, big-endian):
+#     request : (method, args, kwargs)
+#     response: ("ok", result) or ("error", exception, traceback)
+# Unpickling runs code chosen by the sender, so pickles are only exchanged
+# between processes of the same user: the socket is created in a directory
+# only accessible to its owner (see socketDirectory()) and both ends check
+# the user of their peer (SO_PEERCRED) before reading anything.
+
+headerFormat = "!Q"
+headerSize   = struct.calcsize(headerFormat)
+
+
+def socketDirectory():
+    """
+     Directory of the socket of the service of the user, created if needed:
+     $XDG_RUNTIME_DIR/metamodeler or, if XDG_RUNTIME_DIR is not set,
+     metamodeler-<uid> in the temporary directory. Raise PermissionError if
+     it is not a directory owned by the user and only accessible to them
+     (e.g., created beforehand by another user).
+    """
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        directory = os.path.join(os.environ["XDG_RUNTIME_DIR"], "metamodeler")
+    else:
+        directory = os.path.join(tempfile.gettempdir(), "metamodeler-" + str(os.getuid()))
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(directory + " must be a directory owned by the user and only accessible to them.")
+    return directory
+
+
+def defaultSocketPath():
+    return os.path.join(socketDirectory(), "service.sock")
+
+
+def checkPeer(sock):
+    # Raise PermissionError if the process at the other end of sock does not
+    # belong to the user.
+    if not hasattr(socket, "SO_PEERCRED"):
+        raise PermissionError("The user of the peer cannot be checked on this platform.")
+    credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    pid, uid, gid = struct.unpack("3i", credentials)
+    if uid != os.getuid():
+        raise PermissionError("The peer (pid " + str(pid) + ") belongs to another user (uid " + str(uid) + ").")
+
+
+def sendMessage(sock, obj):
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(struct.pack(headerFormat, len(data)))
+    sock.sendall(data)
+
+
+def receiveExactly(sock, size):
+    # Return None if the connection is closed before the first byte.
+    buffer = bytearray(size)
+    view   = memoryview(buffer)
+    nbRead = 0
+    while nbRead < size:
+        nb = sock.recv_into(view[nbRead:])
+        if nb == 0:
+            if nbRead == 0:
+                return None
+            raise ConnectionError("Connection closed in the middle of a message.")
+        nbRead += nb
+    return buffer
+
+
+def receiveMessage(sock):
+    header = receiveExactly(sock, headerSize)
+    if header is None:
+        return None
+    data = receiveExactly(sock, struct.unpack(headerFormat, header)[0])
+    if data is None:
+        raise ConnectionError("Connection closed in the middle of a message.")
+    return pickle.loads(data)
+
+
+
+class Service:
+    """
+     Requests served to the clients. Requests are processed concurrently,
+     except for the searches (the searcher is not thread-safe), whose
+     results are cached.
+    """
+
+    methods = ["ping", "status", "search", "rank", "getInfoFromID", "annotations", "ontologyData",
+               "nameFromId", "idFromName", "hasRoot", "isInRoot", "descendants", "complete",
+               "generateModel", "shutdown"]
+
+    maxNbCachedSearches = 256
+
+    def __init__(self, dbPath, ontology=None):
+        self.dbPath         = os.path.abspath(dbPath)
+        self.compiledCorpus = compileCorpus(self.dbPath)
+        self.searcher       = ParameterSearch(pathDB=self.dbPath, compiledCorpus=self.compiledCorpus)
+        self.ontology       = OntologyIndex.shared() if ontology is None else ontology
+        self.refMng         = ReferenceManager()
+        ModelParameterInstance.referenceStore.setCorpus(self.compiledCorpus)
+
+        self.searchLock     = threading.Lock()
+        self.searchCache    = OrderedDict()
+        self.pubInfos       = {}
+        self.pubLock        = threading.Lock()
+        self.startTime      = time.time()
+        self.nbRequests     = 0
+        self.server         = None
+
+
+    def dispatch(self, method, args, kwargs):
+        if not method in Service.methods:
+            raise ValueError("Unknown method: " + str(method) + ".")
+        self.nbRequests += 1
+        with instrumentation.span("Service." + method):
+            return getattr(self, method)(*args, **kwargs)
+
+
+    def ping(self):
+        return True
+
+    def status(self):
+        return OrderedDict([("dbPath"          , self.dbPath),
+                            ("pid"             , os.getpid()),
+                            ("uptime"          , time.time() - self.startTime),
+                            ("nbRequests"      , self.nbRequests),
+                            ("nbCachedSearches", len(self.searchCache)),
+                            ("nbPublications"  , len(self.pubInfos))])
+
+
+    def search(self, conditions, expandRequiredTags=True, onlyCentralTendancy=True):
+        key = pickle.dumps((conditions, expandRequiredTags, onlyCentralTendancy))
+        with self.searchLock:
+            if key in self.searchCache:
+                self.searchCache.move_to_end(key)
+                return self.searchCache[key]
+            self.searcher.setSearchConditions(conditions)
+            self.searcher.expandRequiredTags = expandRequiredTags
+            self.searcher.onlyCentralTendancy = onlyCentralTendancy
+            resultDF = self.searcher.search()
+            self.searchCache[key] = resultDF
+            if len(self.searchCache) > Service.maxNbCachedSearches:
+                self.searchCache.popitem(last=False)
+            return resultDF
+
+
+    def rank(self, conditions, attributes, expandRequiredTags=True, onlyCentralTendancy=True):
+        # Search and rank the propositions (see ranking.rankPropositions).
+        resultDF = self.search(conditions, expandRequiredTags, onlyCentralTendancy)
+        return rankPropositions(resultDF, attributes, self, self.ontology)
+
+
+    def getInfoFromID(self, pubId, alwaysFetch=False):
+        # Publication information, kept in memory.
+        with self.pubLock:
+            if not alwaysFetch and pubId in self.pubInfos:
+                return self.pubInfos[pubId]
+        info = self.refMng.getInfoFromID(pubId, alwaysFetch)
+        with self.pubLock:
+            self.pubInfos[pubId] = info
+        return info
+
+
+    def annotations(self):
+        return self.compiledCorpus.annotations
+
+    def ontologyData(self):
+        return self.ontology.trees, self.ontology.dics
+
+    def nameFromId(self, id):
+        return self.ontology.nameFromId(id)
+
+    def idFromName(self, name, rootId=None):
+        return self.ontology.idFromName(name, rootId)
+
+    def hasRoot(self, rootId):
+        return self.ontology.hasRoot(rootId)
+
+    def isInRoot(self, name, rootId):
+        return self.ontology.isInRoot(name, rootId)
+
+    def descendants(self, id):
+        return self.ontology.descendants(id)
+
+    def complete(self, prefix, rootId, maxNbCompletions=50):
+        return self.ontology.complete(prefix, rootId, maxNbCompletions)
+
+
+    def generateModel(self, projectPath):
+        # Generate the model of a saved project. Return the number of files.
+        projectSetup = ProjectSetup.load(projectPath)
+        if projectSetup is None:
+            raise ValueError("No project saved in " + projectPath + ".")
+        projectSetup.generateModel()
+        return len(projectSetup.files)
+
+
+    def shutdown(self):
+        # Called from a request handler: the server cannot be stopped from
+        # its own thread.
+        threading.Thread(target=self.server.shutdown).start()
+        return True
+
+
+
+class ServiceRequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        service = self.server.service
+        try:
+            checkPeer(self.request)
+        except PermissionError as e:
+            print(str(e), file=sys.stderr)
+            return
+        while True:
+            try:
+                request = receiveMessage(self.request)
+            except (ConnectionError, OSError):
+                return
+            if request is None:
+                return
+            method, args, kwargs = request
+            try:
+                response = ("ok", service.dispatch(method, args, kwargs))
+            except Exception as e:
+                response = ("error", e, traceback.format_exc())
+            try:
+                sendMessage(self.request, response)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                sendMessage(self.request, ("error", RuntimeError(repr(e)), traceback.format_exc()))
+            except (ConnectionError, OSError):
+                return
+
+
+
+class ServiceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+
+def serve(service, socketPath=None):
+    """
+     Serve the requests of the clients of the user until a shutdown
+     request.
+    """
+    socketPath = defaultSocketPath() if socketPath is None else socketPath
+    if os.path.exists(socketPath):
+        if not connectService(socketPath) is None:
+            raise OSError("A service is already listening on " + socketPath + ".")
+        os.remove(socketPath) # Left by a crashed service
+
+    server = ServiceServer(socketPath, ServiceRequestHandler)
+    server.service  = service
+    service.server  = server
+    try:
+        os.chmod(socketPath, 0o600)
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+
+
+
+class ServiceClient:
+    """
+     Connection to a service. Calls are serialized: threads needing
+     concurrent requests should use their own clients.
+    """
+
+    def __init__(self, socketPath=None, timeout=None):
+        self.socketPath = defaultSocketPath() if socketPath is None else socketPath
+        self.lock       = threading.Lock()
+        self.sock       = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(self.socketPath)
+            checkPeer(self.sock)
+        except OSError:
+            self.sock.close()
+            raise
+
+    def call(self, method, *args, **kwargs):
+        with self.lock:
+            sendMessage(self.sock, (method, args, kwargs))
+            response = receiveMessage(self.sock)
+        if response is None:
+            raise ConnectionError("The service closed the connection.")
+        if response[0] == "error":
+            raise response[1]
+        return response[1]
+
+    def close(self):
+        self.sock.close()
+
+
+
+def connectService(socketPath=None, dbPath=None):
+    """
+     Return a ServiceClient if a service answers on socketPath (by default,
+     the socket of the service of the user) and, if dbPath is given, serves
+     this corpus. Return None otherwise, including if the process listening
+     on socketPath belongs to another user.
+    """
+    try:
+        client = ServiceClient(socketPath, timeout=5.0)
+        status = client.call("status")
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    client.sock.settimeout(None)
+    if not dbPath is None and os.path.abspath(dbPath) != status["dbPath"]:
+        client.close()
+        return None
+    return client
+
+
+
+class RemoteSearcher:
+    # Same interface as nat ParameterSearch, as used by the meta-modeler.
+
+    def __init__(self, client):
+        self.client              = client
+        self.conditions          = None
+        self.expandRequiredTags  = False
+        self.onlyCentralTendancy = False
+
+    def setSearchConditions(self, conditions):
+        self.conditions = conditions
+
+    def search(self):
+        return self.client.call("search", self.conditions, self.expandRequiredTags, self.onlyCentralTendancy)
+
+
+
+class RemoteReferenceManager:
+
+    def __init__(self, client):
+        self.client   = client
+        self.pubInfos = {}
+
+    def getInfoFromID(self, pubId, alwaysFetch=False):
+        if alwaysFetch or not pubId in self.pubInfos:
+            self.pubInfos[pubId] = self.client.call("getInfoFromID", pubId, alwaysFetch)
+        return self.pubInfos[pubId]
+
+
+
+class RemoteCorpus:
+    # Stands for the compiled corpus in the ReferenceStore. The annotations
+    # are only transferred if a reference cannot be resolved otherwise.
+
+    def __init__(self, client):
+        self.client       = client
+        self._annotations = None
+
+    @property
+    def annotations(self):
+        if self._annotations is None:
+            self._annotations = self.client.call("annotations")
+        return self._annotations
+
+
+
+class RemoteOntologyIndex:
+    """
+     Same interface as OntologyIndex, backed by the index of the service.
+     Answers are cached; the trees and dictionaries of the ontologies are
+     only transferred when accessed.
+    """
+
+    def __init__(self, client):
+        self.client   = client
+        self.data     = None
+        self.cache    = {}
+        self.cacheLock = threading.Lock()
+
+    def cached(self, method, *args):
+        key = (method,) + args
+        with self.cacheLock:
+            if key in self.cache:
+                return self.cache[key]
+        value = self.client.call(method, *args)
+        with self.cacheLock:
+            self.cache[key] = value
+        return value
+
+    @property
+    def trees(self):
+        if self.data is None:
+            self.data = self.client.call("ontologyData")
+        return self.data[0]
+
+    @property
+    def dics(self):
+        if self.data is None:
+            self.data = self.client.call("ontologyData")
+        return self.data[1]
+
+    def nameFromId(self, id):
+        return self.cached("nameFromId", id)
+
+    def idFromName(self, name, rootId=None):
+        return self.cached("idFromName", name, rootId)
+
+    def hasRoot(self, rootId):
+        return self.cached("hasRoot", rootId)
+
+    def isInRoot(self, name, rootId):
+        return self.cached("isInRoot", name, rootId)
+
+    def descendants(self, id):
+        return self.cached("descendants", id)
+
+    def isA(self, id, ancestorId):
+        return id == ancestorId or id in self.descendants(ancestorId)
+
+    def complete(self, prefix, rootId, maxNbCompletions=50):
+        return self.client.call("complete", prefix, rootId, maxNbCompletions)
+
+
+
+def useService(client):
+    """
+     Use the service for the ontology index and the resolution of the
+     references of this process. Return a searcher and a reference manager
+     querying the service.
+    """
+    OntologyIndex.sharedIndex = RemoteOntologyIndex(client)
+    ModelParameterInstance.referenceStore.setCorpus(RemoteCorpus(client))
+    return RemoteSearcher(client), RemoteReferenceManager(client)
+
+
+def openSearcher(dbPath, socketPath=None, local=False):
+    """
+     Return a searcher of the corpus of dbPath and the reference manager to
+     use with it: those of the service listening on socketPath (by default,
+     the socket of the service of the user) if it serves this corpus,
+     otherwise a local searcher and None (the default reference manager).
+    """
+    client = None if local else connectService(socketPath, dbPath)
+    if client is None:
+        return openCorpus(dbPath), None
+    return useService(client)
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local service sharing the corpus of annotations, its " +
+                                                 "searches, the ontologies and the publication information " +
+                                                 "between the meta-modeler processes.")
+    parser.add_argument("command", choices=["serve", "status", "stop"])
+    parser.add_argument("--socket", default=None, help="Path of the Unix socket (default: service.sock in " +
+                                                       "$XDG_RUNTIME_DIR/metamodeler).")
+    parser.add_argument("--db", default=None, help="Path of the local annotation corpus " +
+                                                   "(default: as configured in settings.ini).")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        service = Service(defaultDBPath() if args.db is None else args.db)
+        print("Serving " + service.dbPath + " on " + (defaultSocketPath() if args.socket is None else args.socket))
+        serve(service, args.socket)
+        return 0
+
+    client = connectService(args.socket)
+    if client is None:
+        print("No service is running.")
+        return 1
+    if args.command == "status":
+        for key, value in client.call("status").items():
+            print(key + ": " + str(value))
+    else:
+        client.call("shutdown")
+    client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 27 10:15:48 2026
+
+@author: oreilly
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import traceback
+from copy import copy
+from collections import OrderedDict
+
+import numpy as np
+
+from nat.annotationSearch import ConditionAtom
+
+from .modelParameter import ModelParameterInstance, CustomParameterInstance, ArrayParameterInstance
+from .ranking import rankPropositions
+from .projectSetup import ProjectSetup
+from .corpus import defaultDBPath
+from .service import openSearcher
+from .watcher import applyChanges
+from . import instrumentation
+
+
+# Recording of the actions of a modeler in the main window and their replay
+# without GUI. A session is a JSON Lines file: a header line followed by one
+# line per action, {"step", "time", "action", "args"}, "time" being the
+# number of seconds since the beginning of the recording. Actions are:
+#     openProject(path), reloadMetamodel(), generateModel(),
+#     filesChanged(names), selectFile(fileName), selectParameter(paramKey),
+#     editProperties(properties), selectPropositions(ids),
+#     saveCustom(value, unit, justification)
+# filesChanged is recorded by the watch mode (names being None when all the
+# files have been parsed again).
+# Parameter keys are recorded as [name, arguments] lists.
+
+sessionFormat  = "metamodeler session"
+sessionVersion = 1
+
+
+class SessionRecorder:
+    """
+     Append the recorded actions to fileName. Every line is flushed so that
+     the session of a crashed or frozen application can still be replayed.
+    """
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.start    = time.perf_counter()
+        self.nbSteps  = 0
+        self.lock     = threading.Lock()
+        self.file     = open(fileName, "w")
+        self.writeLine(OrderedDict([("format" , sessionFormat),
+                                    ("version", sessionVersion),
+                                    ("date"   , time.strftime("%Y-%m-%dT%H:%M:%S"))]))
+
+    def writeLine(self, obj):
+        self.file.write(json.dumps(obj) + "\n")
+        self.file.flush()
+
+    def record(self, action, **args):
+        with self.lock:
+            if self.file is None:
+                return
+            self.writeLine(OrderedDict([("step"  , self.nbSteps),
+                                        ("time"  , time.perf_counter() - self.start),
+                                        ("action", action),
+                                        ("args"  , args)]))
+            self.nbSteps += 1
+
+    def close(self):
+        with self.lock:
+            if not self.file is None:
+                self.file.close()
+                self.file = None
+
+
+
+def loadSession(fileName):
+    # Return the list of the recorded actions.
+    with open(fileName) as f:
+        lines = [json.loads(line) for line in f if line.strip() != ""]
+    if len(lines) == 0 or lines[0].get("format") != sessionFormat:
+        raise ValueError(fileName + " is not a recorded session.")
+    if lines[0]["version"] > sessionVersion:
+        raise ValueError("Unsupported session version: " + str(lines[0]["version"]) + ".")
+    return lines[1:]
+
+
+
+class ReplayReport:
+
+    def __init__(self, sessionFileName):
+        self.sessionFileName = sessionFileName
+        self.steps           = []
+
+    def add(self, event, duration, status="ok", message=None):
+        self.steps.append(OrderedDict([("step"    , event["step"]),
+                                       ("action"  , event["action"]),
+                                       ("duration", duration),
+                                       ("status"  , status),
+                                       ("message" , message)]))
+
+    def statistics(self):
+        # Number of steps, total, median and maximal durations per action.
+        durations = OrderedDict()
+        for step in self.steps:
+            durations.setdefault(step["action"], []).append(step["duration"])
+        return OrderedDict([(action, OrderedDict([("steps" , len(values)),
+                                                  ("total" , float(np.sum(values))),
+                                                  ("median", float(np.median(values))),
+                                                  ("max"   , float(np.max(values)))]))
+                            for action, values in durations.items()])
+
+    @property
+    def nbErrors(self):
+        return len([step for step in self.steps if step["status"] == "error"])
+
+    def toJSON(self):
+        return OrderedDict([("session"   , self.sessionFileName),
+                            ("total"     , sum([step["duration"] for step in self.steps])),
+                            ("nbErrors"  , self.nbErrors),
+                            ("statistics", self.statistics()),
+                            ("steps"     , self.steps)])
+
+    def save(self, fileName):
+        with open(fileName, 'w') as f:
+            json.dump(self.toJSON(), f, indent=4)
+
+    def __str__(self):
+        lines = []
+        for step in self.steps:
+            lines.append(str(step["step"]).rjust(5) + "  " + step["action"].ljust(20) +
+                         "{:10.4f} s".format(step["duration"]) +
+                         ("" if step["status"] == "ok" else "  " + step["status"].upper()))
+        return "\n".join(lines)
+
+
+
+class SessionReplayer:
+    """
+     Replay a recorded session without GUI, doing what the main window does
+     for each action: loading and reloading the project, extracting the
+     code context of the selected parameter, searching the corpus, ranking
+     the propositions, updating the references or the custom values, and
+     the dependent parameters. The duration of every step is reported.
+
+     The project is replayed from projectPath if given, otherwise from the
+     recorded path. Unless copyProject is False, a temporary copy of the
+     project is used so that the replay does not modify it.
+    """
+
+    nbLineContext = 3
+
+    def __init__(self, searcher, refMng=None, projectPath=None, copyProject=True):
+        self.searcher     = searcher
+        self.refMng       = refMng
+        self.projectPath  = projectPath
+        self.copyProject  = copyProject
+
+        self.workDir      = None
+        self.projectSetup = None
+        self.fileName     = None
+        self.paramKey     = None
+        self.paramKeys    = []
+        self.propositions = []
+
+        self.actions = {"openProject"       : self.openProject,
+                        "reloadMetamodel"   : self.reloadMetamodel,
+                        "generateModel"     : self.generateModel,
+                        "filesChanged"      : self.filesChanged,
+                        "selectFile"        : self.selectFile,
+                        "selectParameter"   : self.selectParameter,
+                        "editProperties"    : self.editProperties,
+                        "selectPropositions": self.selectPropositions,
+                        "saveCustom"        : self.saveCustom}
+
+
+    @property
+    def selectedParameter(self):
+        return self.projectSetup.files[self.fileName].parameters[self.paramKey]
+
+
+    def openProject(self, path):
+        if not self.projectSetup is None:
+            self.projectSetup.flush()
+        path = path if self.projectPath is None else self.projectPath
+        if self.copyProject:
+            if self.workDir is None:
+                self.workDir = tempfile.mkdtemp(prefix="mmreplay_")
+            copyPath = os.path.join(self.workDir, "project" + str(len(os.listdir(self.workDir))))
+            shutil.copytree(path, copyPath)
+            path = copyPath
+        self.projectSetup = ProjectSetup.load(path)
+        if self.projectSetup is None:
+            self.projectSetup = ProjectSetup(path)
+        # Pickled projects keep the paths where they have been created.
+        self.projectSetup.path = path
+        for name, fileSetup in self.projectSetup.files.items():
+            fileSetup.fileName = os.path.join(path, name)
+        self.fileName = self.paramKey = None
+
+
+    def reloadMetamodel(self):
+        self.projectSetup.reloadMM()
+        self.fileName = self.paramKey = None
+
+
+    def generateModel(self):
+        self.projectSetup.generateModel()
+
+
+    def filesChanged(self, names):
+        applyChanges(self.projectSetup, names)
+        if not self.fileName is None and not self.fileName in self.projectSetup.files:
+            self.fileName = self.paramKey = None
+        elif not self.paramKey is None and not self.paramKey in self.projectSetup.files[self.fileName].parameters:
+            self.paramKey = None
+
+
+    def selectFile(self, fileName):
+        # As listed by the parameter list model.
+        fileSetup      = self.projectSetup.files[fileName]
+        self.fileName  = fileName
+        self.paramKey  = None
+        self.paramKeys = [(paramKey, parameter.isComplete()) for paramKey, parameter in fileSetup.parameters.items()]
+
+
+    def selectParameter(self, paramKey):
+        self.paramKey = tuple(paramKey)
+        contextIndex  = self.projectSetup.files[self.fileName].getContextIndex(self.projectSetup.path)
+        contextIndex.getContext(self.paramKey, SessionReplayer.nbLineContext)
+        if isinstance(self.selectedParameter, ModelParameterInstance):
+            self.proposeValues()
+
+
+    def proposeValues(self):
+        self.searcher.setSearchConditions(ConditionAtom("Parameter name", self.paramKey[0]))
+        self.searcher.expandRequiredTags = True
+        self.searcher.onlyCentralTendancy = True
+        with instrumentation.span("ParameterSearch.search"):
+            resultDF = self.searcher.search()
+
+        attributes = copy(self.projectSetup.properties)
+        attributes.update(self.selectedParameter.args)
+        self.propositions = rankPropositions(resultDF, attributes, self.refMng)[0]
+
+
+    def editProperties(self, properties):
+        self.projectSetup.properties = properties
+        self.projectSetup.markDirty()
+        if not self.paramKey is None and isinstance(self.selectedParameter, ModelParameterInstance):
+            self.proposeValues()
+
+
+    def parameterValueChanged(self):
+        self.projectSetup.parameterChanged(self.fileName, self.paramKey)
+        self.projectSetup.isComplete()
+        self.projectSetup.markDirty()
+
+
+    def selectPropositions(self, ids):
+        parameter    = self.selectedParameter
+        propositions = {prop["obj_parameter"].id:prop for prop in self.propositions}
+        current      = {ref.id:ref for ref in parameter.referenceInstances}
+        referenceInstances = []
+        for id in ids:
+            if id in propositions:
+                ModelParameterInstance.referenceStore.register(propositions[id]["obj_parameter"],
+                                                               propositions[id]["obj_annotation"])
+                referenceInstances.append(propositions[id]["obj_parameter"])
+            elif id in current:
+                referenceInstances.append(current[id])
+            else:
+                raise ValueError("Reference " + id + " is not among the propositions.")
+        parameter.referenceInstances = referenceInstances
+        self.parameterValueChanged()
+
+
+    def saveCustom(self, value, unit, justification):
+        parameter = self.selectedParameter
+        paramName = self.paramKey[0]
+        if isinstance(parameter, ArrayParameterInstance):
+            param = ArrayParameterInstance(paramName, parameter.format, justification=justification,
+                                           requiredUnit=parameter.requiredUnit)
+            param.setValue(value, unit)
+        else:
+            param = CustomParameterInstance(paramName, justification)
+            param.setValue(float(value), unit)
+        param.args = parameter.args
+        self.projectSetup.setParameter(self.fileName, self.paramKey, param)
+        self.parameterValueChanged()
+
+
+    def replay(self, events, sessionFileName=None):
+        """
+         Replay the recorded actions in order and return a ReplayReport.
+         Steps that fail are reported as errors and the replay continues.
+        """
+        report = ReplayReport(sessionFileName)
+        try:
+            for event in events:
+                if not event["action"] in self.actions:
+                    report.add(event, 0.0, "skipped", "Unknown action.")
+                    continue
+                start = time.perf_counter()
+                try:
+                    with instrumentation.span("replay." + event["action"], step=event["step"]):
+                        self.actions[event["action"]](**event["args"])
+                except Exception:
+                    report.add(event, time.perf_counter() - start, "error", traceback.format_exc())
+                else:
+                    report.add(event, time.perf_counter() - start)
+        finally:
+            if not self.projectSetup is None:
+                self.projectSetup.flush()
+            if not self.workDir is None:
+                shutil.rmtree(self.workDir, ignore_errors=True)
+                self.workDir = None
+        return report
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session without GUI and report " +
+                                                 "the duration of every step.")
+    parser.add_argument("session", help="Recorded session (JSON Lines).")
+    parser.add_argument("--project", default=None, help="Path of the project (default: the recorded path).")
+    parser.add_argument("--db", default=None, help="Path of the local annotation corpus " +
+                                                   "(default: as configured in settings.ini).")
+    parser.add_argument("--in-place", action="store_true", help="Modify the project instead of a temporary copy.")
+    parser.add_argument("--report", default=None, help="JSON file receiving the durations of the steps.")
+    parser.add_argument("--trace", default=None, help="File name of a Chrome trace of the replay.")
+    parser.add_argument("--service", default=None, help="Socket of the service to use if it serves the " +
+                                                        "same corpus (default: the service of the user).")
+    parser.add_argument("--local", action="store_true", help="Load the corpus even if a service is running.")
+    parser.add_argument("--max-step", type=float, default=None, help="Exit with an error status if a step " +
+                                                                      "takes longer (in seconds).")
+    args = parser.parse_args()
+
+    if not args.trace is None:
+        instrumentation.enable()
+
+    events   = loadSession(args.session)
+    dbPath   = os.path.abspath(defaultDBPath() if args.db is None else args.db)
+    searcher, refMng = openSearcher(dbPath, args.service, args.local)
+    replayer = SessionReplayer(searcher, refMng, args.project, not args.in_place)
+    report   = replayer.replay(events, args.session)
+
+    print(report)
+    if not args.report is None:
+        report.save(args.report)
+    if not args.trace is None:
+        instrumentation.exportTrace(args.trace)
+
+    tooSlow = [step for step in report.steps
+               if not args.max_step is None and step["duration"] > args.max_step]
+    return 1 if report.nbErrors or len(tooSlow) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
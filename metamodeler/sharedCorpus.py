@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 30 09:48:03 2026
+
+@author: oreilly
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from nat.annotationSearch import ConditionAtom
+
+from .ontologyIndex import OntologyIndex
+from .referenceManager import ReferenceManager
+from .modelParameter import ModelParameterInstance
+from .ranking import rankPropositions
+from .projectSetup import ProjectSetup
+from .corpus import defaultDBPath
+from .service import openSearcher
+from . import instrumentation
+
+
+# Read-only columnar export of the search results of a set of parameter
+# names, of the publication information of their annotations and of the
+# part of the ontologies needed to score them. The export is a directory of
+# .npy files that worker processes memory-map: attaching to it involves no
+# deserialization and the pages are shared between the processes through
+# the page cache, so that adding workers does not add copies of the corpus.
+#
+# Strings are stored once in a UTF-8 blob ("stringBlob", "stringOffsets")
+# and referred to by their index (-1 for None). Lists attached to every row
+# (values, species, required tags) are stored as flat arrays delimited by
+# offset arrays ("...Offsets", with one more element than the rows). Keys
+# looked up (term IDs, term names, publication IDs) are sorted fixed-width
+# byte arrays, searched with numpy.searchsorted.
+#
+# Lookups outside of the export raise KeyError rather than falling back on
+# the complete ontology index or on the publication web services, which
+# would load them in every worker process.
+
+formatVersion = 2
+
+# Separates the root IDs from the names in the keys of the names of the
+# terms of a root.
+rootSeparator = "\n"
+
+
+class SharedTag:
+    # Stands for the nat Tag objects of the search results.
+    __slots__ = ["id", "name", "rootId"]
+
+    def __init__(self, id, name, rootId=None):
+        self.id     = id
+        self.name   = name
+        self.rootId = rootId
+
+
+class SharedInstance:
+    # Stands for the nat ParameterInstance objects of the search results.
+    __slots__ = ["id", "requiredTags"]
+
+    def __init__(self, id, requiredTags):
+        self.id           = id
+        self.requiredTags = requiredTags
+
+
+class SharedAnnotation:
+    __slots__ = ["ID", "pubId"]
+
+    def __init__(self, ID, pubId):
+        self.ID    = ID
+        self.pubId = pubId
+
+
+
+class StringTableBuilder:
+
+    def __init__(self):
+        self.indexes = {}
+        self.strings = []
+
+    def add(self, string):
+        if string is None:
+            return -1
+        string = str(string)
+        if not string in self.indexes:
+            self.indexes[string] = len(self.strings)
+            self.strings.append(string)
+        return self.indexes[string]
+
+    def arrays(self):
+        encoded = [string.encode("utf-8") for string in self.strings]
+        offsets = np.zeros(len(encoded)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(string) for string in encoded])
+        return {"stringBlob"   : np.frombuffer(b"".join(encoded), dtype=np.uint8),
+                "stringOffsets": offsets}
+
+
+
+def sortedKeys(keys):
+    # Sorted fixed-width byte array of keys and the order of the keys.
+    encoded = np.array([key.encode("utf-8") for key in keys], dtype=bytes)
+    if len(encoded) == 0:
+        encoded = np.array([], dtype="S1")
+    order = np.argsort(encoded, kind="stable")
+    return encoded[order], order
+
+
+def flatten(lists, dtype=np.int64):
+    # Offsets and concatenation of lists.
+    offsets = np.zeros(len(lists)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(items) for items in lists])
+    if len(lists) and isinstance(lists[0], np.ndarray):
+        return offsets, np.concatenate(lists).astype(dtype)
+    return offsets, np.array([item for items in lists for item in items], dtype=dtype)
+
+
+def ontologyTerms(ontology, values):
+    # Ancestors that may be passed to isA() when scoring against values:
+    # the string values themselves (IDs or names of terms) and the IDs of
+    # the names of terms.
+    terms = set()
+    for value in values:
+        if not isinstance(value, str):
+            continue
+        terms.add(value)
+        if value in ontology.nameToId:
+            terms.add(ontology.nameToId[value])
+    return terms
+
+
+def descendantsOf(ontology, term):
+    # As ontology.descendants(), for terms given by their names as well.
+    try:
+        return ontology.descendants(term)
+    except KeyError:
+        return set()
+
+
+@instrumentation.timed()
+def exportCorpus(path, searcher, paramNames, ancestorIds=(), refMng=None, ontology=None):
+    """
+     Search the corpus for every parameter name of paramNames and export the
+     results in the directory path (replaced if it exists). ancestorIds are
+     the ontology terms (IDs or names) against which the propositions are
+     scored (e.g., the values of the project properties): their descendants
+     are exported.
+    """
+    if refMng is None:
+        refMng = ReferenceManager()
+    if ontology is None:
+        ontology = OntologyIndex.shared()
+
+    strings = StringTableBuilder()
+    columns = {name:[] for name in ["unit", "cell", "instanceId", "annotationId", "publication"]}
+    values, species, speciesNames, tags, tagNames, tagRoots = [], [], [], [], [], []
+    paramOffsets = [0]
+    pubIds       = {}
+    paramNames   = sorted(set(paramNames))
+    for paramName in paramNames:
+        searcher.setSearchConditions(ConditionAtom("Parameter name", paramName))
+        searcher.expandRequiredTags = True
+        searcher.onlyCentralTendancy = True
+        resultDF = searcher.search()
+        for index, row in resultDF.iterrows():
+            values.append(np.atleast_1d(np.asarray(row["Values"], dtype=float)).ravel())
+            species.append([strings.add(spec.id) for spec in row["Species"]])
+            speciesNames.append([strings.add(spec.name) for spec in row["Species"]])
+            requiredTags = row["obj_parameter"].requiredTags
+            tags.append([strings.add(tag.id) for tag in requiredTags])
+            tagNames.append([strings.add(tag.name) for tag in requiredTags])
+            tagRoots.append([strings.add(tag.rootId) for tag in requiredTags])
+            columns["unit"].append(strings.add(row["Unit"]))
+            columns["cell"].append(strings.add(row["Cell"]))
+            columns["instanceId"].append(strings.add(row["obj_parameter"].id))
+            columns["annotationId"].append(strings.add(row["obj_annotation"].ID))
+            columns["publication"].append(pubIds.setdefault(row["obj_annotation"].pubId, len(pubIds)))
+        paramOffsets.append(len(values))
+
+    arrays = {"paramOffsets": np.array(paramOffsets, dtype=np.int64)}
+    for name, column in columns.items():
+        arrays[name] = np.array(column, dtype=np.int64)
+    arrays["valueOffsets"], arrays["values"] = flatten(values, np.float64)
+    arrays["speciesOffsets"], arrays["species"] = flatten(species)
+    arrays["speciesNames"] = flatten(speciesNames)[1]
+    arrays["tagOffsets"], arrays["tags"] = flatten(tags)
+    arrays["tagNames"] = flatten(tagNames)[1]
+    arrays["tagRoots"] = flatten(tagRoots)[1]
+
+    # Publications, in the order of their index in "publication".
+    pubInfos = [refMng.getInfoFromID(pubId) or {} for pubId in pubIds]
+    arrays["pubIds"], arrays["pubOrder"] = sortedKeys(list(pubIds))
+    arrays["pubAuthors"] = np.array([strings.add(info.get("authors")) for info in pubInfos], dtype=np.int64)
+    arrays["pubJournals"] = np.array([strings.add(info.get("journal")) for info in pubInfos], dtype=np.int64)
+    arrays["pubYears"] = np.array([int(info["year"]) if str(info.get("year", "")).isdigit() else -1
+                                   for info in pubInfos], dtype=np.int64)
+
+    # Ontology: names of the terms, IDs of the names (the first ID when
+    # several terms share a name, as in OntologyIndex), globally and by
+    # root, and descendants of the ancestors.
+    termIds = list(ontology.dics)
+    arrays["termIds"], order = sortedKeys(termIds)
+    arrays["termNames"] = np.array([strings.add(ontology.dics[termIds[no]]) for no in order], dtype=np.int64)
+    names = list(ontology.nameToId)
+    arrays["nameKeys"], order = sortedKeys(names)
+    arrays["nameIds"] = np.array([strings.add(ontology.nameToId[names[no]]) for no in order], dtype=np.int64)
+    rootNames = [(rootId, name, id) for rootId, nameToId in ontology.rootNameToId.items()
+                                    for name, id in nameToId.items()]
+    arrays["rootNameKeys"], order = sortedKeys([rootId + rootSeparator + name for rootId, name, id in rootNames])
+    arrays["rootNameIds"] = np.array([strings.add(rootNames[no][2]) for no in order], dtype=np.int64)
+    arrays["rootIds"] = sortedKeys(list(ontology.rootNameToId))[0]
+    ancestorIds = sorted(set(ancestorIds))
+    arrays["ancestorIds"] = sortedKeys(ancestorIds)[0]
+    descendants = [sorted([id.encode("utf-8") for id in descendantsOf(ontology, id)]) for id in ancestorIds]
+    arrays["descendantOffsets"], arrays["descendants"] = flatten(descendants, "S" if len(descendants) else "S1")
+    arrays.update(strings.arrays())
+
+    # Written next to path and renamed, so that workers never attach to a
+    # partial export.
+    tmpPath = path.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmpPath, ignore_errors=True)
+    os.makedirs(tmpPath)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmpPath, name + ".npy"), array)
+    with open(os.path.join(tmpPath, "meta.json"), "w") as f:
+        json.dump({"version": formatVersion, "paramNames": paramNames}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmpPath, path)
+    return path
+
+
+
+def exportProjectCorpus(path, projectSetup, searcher, refMng=None, ontology=None):
+    """
+     Export the search results of the parameter names of the literature-
+     backed parameters of projectSetup, scored against the project
+     properties and the arguments of the tags.
+    """
+    paramNames, ancestorIds = projectCorpusContent(projectSetup, ontology)
+    return exportCorpus(path, searcher, paramNames, ancestorIds, refMng, ontology)
+
+
+def projectCorpusContent(projectSetup, ontology=None):
+    # Parameter names and ancestors that an export must include for the
+    # literature-backed parameters of projectSetup to be curated from it.
+    if ontology is None:
+        ontology = OntologyIndex.shared()
+    paramNames = set()
+    values     = list(projectSetup.properties.values())
+    for fileSetup in projectSetup.files.values():
+        for paramKey, parameter in fileSetup.parameters.items():
+            if isinstance(parameter, ModelParameterInstance):
+                paramNames.add(paramKey[0])
+                values.extend(parameter.args.values())
+    return paramNames, ontologyTerms(ontology, values)
+
+
+def isExportComplete(path, paramNames, ancestorIds):
+    """
+     Whether the export in the directory path exists, is in the current
+     format and includes the search results of paramNames and the
+     descendants of ancestorIds (e.g., as returned by
+     projectCorpusContent()).
+    """
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return False
+    try:
+        corpus = SharedCorpus(path)
+    except ValueError:
+        return False
+    if not set(paramNames) <= set(corpus.paramIndexes):
+        return False
+    return all([not lookup(corpus.arrays["ancestorIds"], id) is None for id in ancestorIds])
+
+
+
+class SharedCorpus:
+    """
+     Read-only view of an export of exportCorpus(). The search results are
+     returned as DataFrames with the columns used by ranking.py, holding
+     light stand-ins of the nat objects (SharedInstance, SharedAnnotation,
+     SharedTag), so that propositions are ranked as usual, with
+     self.ontology and self.publications.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["version"] != formatVersion:
+            raise ValueError("Unsupported version of the shared corpus: " + str(meta["version"]) + ".")
+        self.paramIndexes = {paramName:no for no, paramName in enumerate(meta["paramNames"])}
+        self.arrays = {}
+        for fileName in os.listdir(path):
+            if fileName.endswith(".npy"):
+                self.arrays[fileName[:-4]] = np.load(os.path.join(path, fileName), mmap_mode="r")
+        self.ontology     = SharedOntology(self)
+        self.publications = SharedPublications(self)
+
+
+    def string(self, index):
+        if index < 0:
+            return None
+        offsets = self.arrays["stringOffsets"]
+        return bytes(self.arrays["stringBlob"][offsets[index]:offsets[index+1]]).decode("utf-8")
+
+    def strings(self, offsets, flat, noRow):
+        return [self.string(index) for index in flat[offsets[noRow]:offsets[noRow+1]]]
+
+    @property
+    def paramNames(self):
+        return list(self.paramIndexes)
+
+
+    def searchResult(self, paramName):
+        # Equivalent of the DataFrame returned by the search of paramName.
+        a       = self.arrays
+        noParam = self.paramIndexes[paramName]
+        rows    = []
+        for noRow in range(a["paramOffsets"][noParam], a["paramOffsets"][noParam+1]):
+            values = np.array(a["values"][a["valueOffsets"][noRow]:a["valueOffsets"][noRow+1]])
+            tags   = [SharedTag(id, name, rootId) for id, name, rootId in
+                      zip(self.strings(a["tagOffsets"], a["tags"], noRow),
+                          self.strings(a["tagOffsets"], a["tagNames"], noRow),
+                          self.strings(a["tagOffsets"], a["tagRoots"], noRow))]
+            rows.append({"Values"        : float(values[0]) if len(values) == 1 else values,
+                         "Unit"          : self.string(a["unit"][noRow]),
+                         "Species"       : [SharedTag(id, name) for id, name in
+                                            zip(self.strings(a["speciesOffsets"], a["species"], noRow),
+                                                self.strings(a["speciesOffsets"], a["speciesNames"], noRow))],
+                         "Cell"          : self.string(a["cell"][noRow]),
+                         "obj_annotation": SharedAnnotation(self.string(a["annotationId"][noRow]),
+                                                            self.publications.pubId(a["publication"][noRow])),
+                         "obj_parameter" : SharedInstance(self.string(a["instanceId"][noRow]), tags)})
+        return pd.DataFrame(rows, columns=["Values", "Unit", "Species", "Cell", "obj_annotation", "obj_parameter"])
+
+
+    def rank(self, paramName, attributes):
+        return rankPropositions(self.searchResult(paramName), attributes, self.publications, self.ontology)
+
+
+
+def lookup(keys, key):
+    # Index of key in the sorted byte array keys, or None.
+    encoded = key.encode("utf-8")
+    no = int(np.searchsorted(keys, encoded))
+    if no < len(keys) and keys[no] == encoded:
+        return no
+    return None
+
+
+
+class SharedPublications:
+    # Same interface as ReferenceManager.
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        order = np.asarray(corpus.arrays["pubOrder"])
+        # Publication index -> position in the sorted pubIds
+        self.positions = np.empty_like(order)
+        self.positions[order] = np.arange(len(order))
+
+    def pubId(self, noPub):
+        return self.corpus.arrays["pubIds"][self.positions[noPub]].decode("utf-8")
+
+    def getInfoFromID(self, pubId, alwaysFetch=False):
+        a  = self.corpus.arrays
+        no = lookup(a["pubIds"], pubId)
+        if no is None:
+            raise KeyError("The publication " + pubId + " is not in the shared corpus.")
+        noPub = a["pubOrder"][no]
+        year  = int(a["pubYears"][noPub])
+        return {"authors": self.corpus.string(a["pubAuthors"][noPub]),
+                "year"   : None if year < 0 else year,
+                "journal": self.corpus.string(a["pubJournals"][noPub])}
+
+
+
+class SharedOntology:
+    """
+     Subset of the interface of OntologyIndex used to score propositions.
+     Queries outside of the export (e.g., descendants of terms that were
+     not given as ancestors) raise KeyError.
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def nameFromId(self, id):
+        no = lookup(self.corpus.arrays["termIds"], id)
+        if no is None:
+            raise KeyError(id)
+        return self.corpus.string(self.corpus.arrays["termNames"][no])
+
+    def idFromName(self, name, rootId=None):
+        a = self.corpus.arrays
+        if rootId is None:
+            no = lookup(a["nameKeys"], name)
+            ids = a["nameIds"]
+        else:
+            no = lookup(a["rootNameKeys"], rootId + rootSeparator + name)
+            ids = a["rootNameIds"]
+        if no is None:
+            raise KeyError(name)
+        return self.corpus.string(ids[no])
+
+    def hasRoot(self, rootId):
+        return not lookup(self.corpus.arrays["rootIds"], rootId) is None
+
+    def isInRoot(self, name, rootId):
+        if not self.hasRoot(rootId):
+            raise KeyError(rootId)
+        return not lookup(self.corpus.arrays["rootNameKeys"], rootId + rootSeparator + name) is None
+
+    def isA(self, id, ancestorId):
+        if id == ancestorId:
+            return True
+        a  = self.corpus.arrays
+        no = lookup(a["ancestorIds"], ancestorId)
+        if no is None:
+            raise KeyError("The descendants of " + ancestorId + " are not in the shared corpus.")
+        descendants = a["descendants"][a["descendantOffsets"][no]:a["descendantOffsets"][no+1]]
+        return not lookup(descendants, id) is None
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the search results of the parameters of a project, " +
+                                                 "for worker processes (see AutoCurator).")
+    parser.add_argument("project", help="Path of the project folder.")
+    parser.add_argument("output", help="Directory of the export (replaced if it exists).")
+    parser.add_argument("--db", default=None, help="Path of the local annotation corpus " +
+                                                   "(default: as configured in settings.ini).")
+    parser.add_argument("--service", default=None, help="Socket of the service to use if it serves the " +
+                                                        "same corpus (default: the service of the user).")
+    parser.add_argument("--local", action="store_true", help="Load the corpus even if a service is running.")
+    args = parser.parse_args()
+
+    projectSetup = ProjectSetup.load(args.project)
+    if projectSetup is None:
+        projectSetup = ProjectSetup(args.project)
+    dbPath = os.path.abspath(defaultDBPath() if args.db is None else args.db)
+    searcher, refMng = openSearcher(dbPath, args.service, args.local)
+    exportProjectCorpus(args.output, projectSetup, searcher, refMng)
+    print("Exported to " + args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,7 +10,7 @@ from collections import OrderedDict
 
 class TagParser:
     
-    acceptedCharQuote   = '"[0-9a-zA-Z_\(\)\-\+*^/\s]+"'
+    acceptedCharQuote   = '"[0-9a-zA-Z_\(\)\-\+*^/\s.,]+"'
     acceptedCharNoQuote = '[0-9a-zA-Z_]+'
     attributeKeyVal     =  "(?:" + acceptedCharQuote + "|" + acceptedCharNoQuote + ")"
     
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 09:31:12 2026
+
+@author: oreilly
+"""
+
+import threading
+from functools import lru_cache
+
+from .utils import lazyImport
+
+pq = lazyImport("quantities")
+np = lazyImport("numpy")
+
+
+# Unit strings are interned: parameter instances only keep the index of
+# their unit in this table. The indexes are only valid within the current
+# process, so the unit strings are what gets pickled.
+unitIds   = {}
+unitNames = []
+unitLock  = threading.Lock()
+
+def internUnit(unit):
+    if unit is None:
+        return -1
+    try:
+        return unitIds[unit]
+    except KeyError:
+        with unitLock:
+            if not unit in unitIds:
+                unitIds[unit] = len(unitNames)
+                unitNames.append(unit)
+            return unitIds[unit]
+
+
+@lru_cache(maxsize=None)
+def normalizeUnit(unit):
+    return str(pq.Quantity(1.0, unit).dimensionality)
+
+@lru_cache(maxsize=None)
+def unitFactor(fromUnit, toUnit):
+    if fromUnit == toUnit:
+        return 1.0
+    # The rescaled Quantity is converted explicitly because of a probable
+    # bug in the Quantity library: https://github.com/python-quantities/python-quantities/issues/123
+    return float(np.array(pq.Quantity(1.0, fromUnit).rescale(toUnit)))
+
+
+@lru_cache(maxsize=None)
+def baseUnit(unit):
+    # Unit expressed in SI base units (e.g., "kg*m**2/(s**3*A)" for "mV").
+    # None stands for dimensionless values.
+    return str(pq.Quantity(1.0, "dimensionless" if unit is None else unit).simplified.dimensionality)
+
+def toBaseUnit(value, unit):
+    # value, in unit, rescaled to baseUnit(unit).
+    if unit is None:
+        return value
+    return value*unitFactor(unit, baseUnit(unit))
+
+
+def referenceValues(referenceInstances, unit=None):
+    # Central tendencies of the references, rescaled to a common unit
+    # (by default, the unit of the first reference).
+    if unit is None:
+        unit = normalizeUnit(referenceInstances[0].unit)
+    values = np.array([np.mean(ref.centralTendancy())*unitFactor(normalizeUnit(ref.unit), unit)
+                       for ref in referenceInstances], dtype=float)
+    return values, unit
@@ -6,6 +6,40 @@ Created on Mon Oct 10 14:37:01 2016
 """
 
 import json
+import importlib
+
+
+class LazyModule:
+    """
+     Stand-in for a module that is only imported on the first access to one
+     of its attributes. The attributes of the module are then copied in the
+     stand-in, so that later accesses cost as much as with the module.
+     Attributes that are not in the namespace of the module (e.g., the
+     submodules that NumPy imports through its module __getattr__) are
+     looked up on the module and copied on first access.
+    """
+
+    def __init__(self, name):
+        self.__dict__["_lazyName"] = name
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self._lazyName)
+        self.__dict__.update(module.__dict__)
+        if not attribute in self.__dict__:
+            self.__dict__[attribute] = getattr(module, attribute)
+        return self.__dict__[attribute]
+
+    def __repr__(self):
+        return "<lazy module '" + self._lazyName + "'>"
+
+
+def lazyImport(name):
+    # Heavy dependencies (NumPy, quantities, ...) are imported with
+    # np = lazyImport("numpy") so that importing the core of the package
+    # only imports the standard library.
+    return LazyModule(name)
+
+
 def prettyPrintJSON(jsonRepr):
     if isinstance(jsonRepr, list):
         return "[\n" + "\n".join([json.dumps(s, sort_keys=True, indent=4, separators=(',', ': ')) for s in jsonRepr])  + "\n]"
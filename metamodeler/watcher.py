@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Nov  2 09:27:51 2026
+
+@author: oreilly
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import argparse
+import threading
+import traceback
+
+from .projectSetup import ProjectSetup
+from . import instrumentation
+
+
+# Watch mode: the meta-model files of a project are watched and, when some
+# of them change, only these files are parsed again and, if the project is
+# complete, only the generated files depending on them are regenerated (see
+# applyChanges()). Changes are detected with inotify (Linux) or, where it is
+# not available, by polling the modification times of the files. They are
+# debounced: editors often write a file in several steps (e.g., truncate,
+# write, rename), which are reported together once no event has occurred
+# for a short delay.
+
+
+# Constants of <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF   = 0x00000800
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ISDIR       = 0x40000000
+IN_NONBLOCK    = 0o4000
+IN_CLOEXEC     = 0o2000000
+
+watchMask = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+             IN_DELETE_SELF | IN_MOVE_SELF)
+eventHeader = struct.Struct("iIII") # wd, mask, cookie, len
+
+
+class InotifyBackend:
+    """
+     Report the changes of the meta-model files below path with inotify,
+     called through ctypes. Every directory is watched; directories created
+     later are watched as soon as they are reported. Raise OSError if
+     inotify is not available.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        try:
+            self.addWatch = libc.inotify_add_watch
+        except AttributeError:
+            raise OSError(errno.ENOSYS, "inotify is not available.")
+        self.addWatch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.addWatch.restype  = ctypes.c_int
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed: " + os.strerror(ctypes.get_errno()))
+        self.directories = {} # Watch descriptor -> directory
+        try:
+            self.watchTree(path)
+        except OSError:
+            self.close()
+            raise
+
+    def watchTree(self, directory):
+        # Return the names of the meta-model files found in the tree.
+        names = []
+        for root, dirnames, filenames in os.walk(directory):
+            wd = self.addWatch(self.fd, os.fsencode(root), watchMask)
+            if wd < 0:
+                # E.g., ENOSPC when the limit of watches is reached.
+                raise OSError(ctypes.get_errno(), "Cannot watch " + root + ": " + os.strerror(ctypes.get_errno()))
+            self.directories[wd] = root
+            names.extend([os.path.relpath(os.path.join(root, filename), self.path)
+                          for filename in filenames if ProjectSetup.isMetaModelFile(filename)])
+        return names
+
+    def wait(self, timeout):
+        """
+         Wait at most timeout seconds for changes and return the names
+         (relative to the project path) of the changed meta-model files, or
+         None if events have been lost and every file may have changed.
+        """
+        if len(select.select([self.fd], [], [], timeout)[0]) == 0:
+            return set()
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return set()
+
+        names  = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = eventHeader.unpack_from(data, offset)
+            name   = os.fsdecode(data[offset+eventHeader.size:offset+eventHeader.size+length].rstrip(b"\0"))
+            offset += eventHeader.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            if not wd in self.directories or name == "":
+                continue
+            fileName = os.path.join(self.directories[wd], name)
+            if mask & IN_ISDIR:
+                # A directory created or moved in the tree may already hold
+                # meta-model files.
+                if mask & (IN_CREATE | IN_MOVED_TO) and os.path.isdir(fileName):
+                    names.update(self.watchTree(fileName))
+                elif mask & IN_MOVED_FROM:
+                    return None
+            elif ProjectSetup.isMetaModelFile(name) and not mask & IN_CREATE:
+                # Creations are followed by IN_CLOSE_WRITE.
+                names.add(os.path.relpath(fileName, self.path))
+        return names
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+
+class PollingBackend:
+    # Same interface as InotifyBackend, comparing the modification times
+    # and sizes of the meta-model files every interval seconds.
+
+    def __init__(self, path, interval=1.0):
+        self.path     = path
+        self.interval = interval
+        self.snapshot = self.scan()
+        self.nextPoll = time.monotonic() + interval
+
+    def scan(self):
+        snapshot = {}
+        for root, dirnames, filenames in os.walk(self.path):
+            for filename in filenames:
+                if ProjectSetup.isMetaModelFile(filename):
+                    fileName = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(fileName)
+                    except OSError:
+                        continue
+                    snapshot[os.path.relpath(fileName, self.path)] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        delay = self.nextPoll - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0.0, delay))
+        self.nextPoll = time.monotonic() + self.interval
+        snapshot, self.snapshot = self.snapshot, self.scan()
+        return set([name for name in set(snapshot) | set(self.snapshot) if snapshot.get(name) != self.snapshot.get(name)])
+
+    def close(self):
+        pass
+
+
+
+def openBackend(path, polling=False, pollInterval=1.0):
+    # inotify if available, unless polling is True.
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyBackend(path)
+        except OSError:
+            pass
+    return PollingBackend(path, pollInterval)
+
+
+
+class ProjectWatcher(threading.Thread):
+    """
+     Thread watching the meta-model files below path. Once no change has
+     been detected for debounce seconds, callback(names) is called from this
+     thread with the sorted names of the changed files, relative to path (or
+     with None if every file may have changed, e.g., events were lost).
+    """
+
+    def __init__(self, path, callback, debounce=0.3, polling=False, pollInterval=1.0):
+        super(ProjectWatcher, self).__init__(daemon=True)
+        self.path      = path
+        self.callback  = callback
+        self.debounce  = debounce
+        self.backend   = openBackend(path, polling, pollInterval)
+        self.stopEvent = threading.Event()
+
+    @property
+    def usesInotify(self):
+        return isinstance(self.backend, InotifyBackend)
+
+    def run(self):
+        pending   = set()
+        rescan    = False
+        lastEvent = None
+        try:
+            while not self.stopEvent.is_set():
+                timeout = 0.2 if lastEvent is None else min(0.2, max(0.0, lastEvent + self.debounce - time.monotonic()))
+                changes = self.backend.wait(timeout)
+                if changes is None:
+                    rescan = True
+                if changes is None or len(changes):
+                    pending.update(changes or [])
+                    lastEvent = time.monotonic()
+                elif not lastEvent is None and time.monotonic() - lastEvent >= self.debounce:
+                    names = None if rescan else sorted(pending)
+                    pending, rescan, lastEvent = set(), False, None
+                    try:
+                        self.callback(names)
+                    except Exception:
+                        traceback.print_exc()
+        finally:
+            self.backend.close()
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.is_alive() and not threading.current_thread() is self:
+            self.join()
+
+
+
+def applyChanges(projectSetup, names, generate=True):
+    """
+     Parse again the meta-model files of names (all of them if names is
+     None) and, if generate is True and the project is complete, regenerate
+     the files depending on them. Return the names of the regenerated files.
+     The project is left unchanged if its dependencies become invalid
+     (ValueError).
+    """
+    if names is None:
+        names = set([name for name, path in projectSetup.metaModelFiles()]) | set(projectSetup.files)
+    with instrumentation.span("applyChanges", nbFiles=len(names)):
+        projectSetup.applyMM(projectSetup.scanFiles(names))
+        if not generate or not projectSetup.isComplete():
+            return []
+        generated = projectSetup.affectedFiles(names)
+        projectSetup.generateFiles(generated)
+        return generated
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch the meta-model files of a project, parse again those " +
+                                                 "that change and regenerate the affected files of the model.")
+    parser.add_argument("project", help="Path of the project folder.")
+    parser.add_argument("--no-generate", action="store_true", help="Only update the project.")
+    parser.add_argument("--polling", action="store_true", help="Poll the files instead of using inotify.")
+    parser.add_argument("--interval", type=float, default=1.0, help="Polling interval (in seconds).")
+    parser.add_argument("--debounce", type=float, default=0.3, help="Delay without change before the files " +
+                                                                   "are processed (in seconds).")
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.project)
+    projectSetup = ProjectSetup.load(path)
+    if projectSetup is None:
+        projectSetup = ProjectSetup(path)
+
+    def filesChanged(names):
+        start = time.perf_counter()
+        try:
+            generated = applyChanges(projectSetup, names, not args.no_generate)
+        except ValueError as e:
+            print("Invalid meta-model: " + str(e))
+            return
+        print("Updated " + ("all files" if names is None else ", ".join(names)) +
+              ("" if len(generated) == 0 else "; regenerated " + ", ".join(generated)) +
+              " ({:.3f} s)".format(time.perf_counter() - start))
+        sys.stdout.flush()
+
+    watcher = ProjectWatcher(path, filesChanged, args.debounce, args.polling, args.interval)
+    print("Watching " + path + (" (inotify)" if watcher.usesInotify else " (polling)") + ". Press Ctrl+C to stop.")
+    sys.stdout.flush()
+    watcher.start()
+    try:
+        while watcher.is_alive():
+            watcher.join(0.5)
+    except KeyboardInterrupt:
+        pass
+    watcher.stop()
+    projectSetup.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 10:41:19 2026
+
+@author: oreilly
+"""
+
+import threading
+
+from metamodeler.autosave import AutoSaver
+
+
+class ManualTimer:
+    # Timer fired by the tests themselves (see AutoSaver's timerFactory).
+
+    def __init__(self, delay, callback):
+        self.callback  = callback
+        self.cancelled = False
+        ManualTimer.last = self
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        if not self.cancelled:
+            self.callback()
+
+
+
+class Writes(list):
+    # writeFct recording the written data and the writing threads.
+
+    def __init__(self):
+        super(Writes, self).__init__()
+        self.threads = []
+        self.written = threading.Event()
+
+    def __call__(self, data):
+        self.append(data)
+        self.threads.append(threading.current_thread())
+        self.written.set()
+
+
+
+def test_snapshotOnTimerThread():
+    # Changes are coalesced, the snapshot is taken from the thread of the
+    # timer callbacks and only the bytes are written in the background.
+    state     = {"value": 0}
+    snapshots = []
+    writes    = Writes()
+    def snapshot():
+        snapshots.append(threading.current_thread())
+        return str(state["value"])
+    autoSaver = AutoSaver(snapshot, writes, timerFactory=ManualTimer)
+    for value in range(10):
+        state["value"] = value
+        autoSaver.markDirty()
+    ManualTimer.last.fire()
+    assert writes.written.wait(5)
+    autoSaver.flush()
+    assert writes == ["9"]
+    assert snapshots == [threading.main_thread()]
+    assert not writes.threads[0] is threading.main_thread()
+
+    state["value"] = 10
+    autoSaver.markDirty()
+    autoSaver.flush()
+    assert writes == ["9", "10"]
+    assert writes.threads[-1] is threading.main_thread()
+    assert not autoSaver.isDirty
+
+
+def test_flushWaitsForBackgroundWrite(monkeypatch):
+    # The timer has taken the snapshot but the background write has not
+    # started yet: flush() must wait for it rather than report a clean
+    # state with nothing written.
+    writes  = Writes()
+    release = threading.Event()
+    write   = AutoSaver._AutoSaver__write
+    def delayedWrite(self, noSnapshot, data):
+        if not threading.current_thread() is threading.main_thread():
+            release.wait()
+        write(self, noSnapshot, data)
+    monkeypatch.setattr(AutoSaver, "_AutoSaver__write", delayedWrite)
+
+    autoSaver = AutoSaver(lambda: "1", writes, timerFactory=ManualTimer)
+    autoSaver.markDirty()
+    ManualTimer.last.fire()
+    assert autoSaver.isDirty
+
+    flushThread = threading.Thread(target=autoSaver.flush)
+    flushThread.start()
+    flushThread.join(0.1)
+    assert flushThread.is_alive()
+    release.set()
+    flushThread.join(5)
+    assert not flushThread.is_alive()
+    assert writes == ["1"]
+    assert not autoSaver.isDirty
+
+
+def test_failedWriteRetried():
+    writes   = Writes()
+    attempts = []
+    def writeFct(data):
+        attempts.append(data)
+        if len(attempts) == 1:
+            raise IOError("Disk full")
+        writes(data)
+    autoSaver = AutoSaver(lambda: "1", writeFct, delay=0.01, timerFactory=ManualTimer)
+    autoSaver.markDirty()
+    ManualTimer.last.fire()
+    # Retried without any new change.
+    assert writes.written.wait(5)
+    autoSaver.flush()
+    assert attempts == ["1", "1"]
+    assert writes == ["1"]
+    assert not autoSaver.isDirty
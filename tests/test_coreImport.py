@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 09:31:08 2026
+
+@author: oreilly
+"""
+
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from benchmarks.run import BenchmarkSuite, checkThresholds, defaultThresholdFile
+from metamodeler.projectSetup import FileSetup
+
+
+def test_coreImport(tmp_path, monkeypatch):
+    # Importing the core, then loading, saving and generating a project,
+    # must not import the heavy modules (see benchmarks/run.py) and must
+    # stay within the import-time budget. The parameter types set by the
+    # suite are restored afterward.
+    monkeypatch.setattr(FileSetup, "parameterTypes", FileSetup.parameterTypes)
+    results = BenchmarkSuite(str(tmp_path), "quick").run(["CoreImport"])
+    with open(defaultThresholdFile) as f:
+        thresholds = json.load(f)
+    passed = checkThresholds(results, thresholds)
+    assert results["CoreImport"]["unexpectedModules"] == []
+    assert passed, results
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 10:02:45 2026
+
+@author: oreilly
+"""
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("quantities")
+
+from types import SimpleNamespace
+
+from metamodeler import modelParameter
+from metamodeler.projectSetup import ProjectSetup, FileSetup
+from metamodeler.ensemble import Ensemble
+from metamodeler.referenceStore import ReferenceSummary
+
+
+def makeProject(path, monkeypatch, lines):
+    (path / "model.mm_py").write_text("\n".join(lines) + "\n")
+    monkeypatch.setattr(FileSetup, "parameterTypes", []) # Only custom and derived parameters
+    projectSetup = ProjectSetup(str(path))
+    parameters   = {paramKey[0]:(paramKey, parameter)
+                    for paramKey, parameter in projectSetup.files["model.mm_py"].parameters.items()}
+    return projectSetup, parameters
+
+
+def setValue(projectSetup, parameters, name, value, unit):
+    paramKey, parameter = parameters[name]
+    parameter.setValue(value, unit)
+    projectSetup.parameterChanged("model.mm_py", paramKey)
+
+
+def test_derivedUnits(tmp_path, monkeypatch):
+    # 10 nS over 1000 um^2 is 1e-3 S/cm^2.
+    projectSetup, parameters = makeProject(tmp_path, monkeypatch, ['g_total = #|g_total|#',
+                                                      'soma_area = #|soma_area|#',
+                                                      'gbar = #|gbar(expr="g_total / soma_area", unit="S/cm^2")|#'])
+    setValue(projectSetup, parameters, "g_total", 10.0, "nS")
+    setValue(projectSetup, parameters, "soma_area", 1000.0, "um**2")
+    gbar = parameters["gbar"][1]
+    assert gbar.value == pytest.approx(1e-3)
+    assert gbar.unit == "S/cm**2"
+
+    ensemble = Ensemble(projectSetup, 4)
+    values   = ensemble.sample()
+    assert values[:, ensemble.columns[("model.mm_py", parameters["gbar"][0])]] == pytest.approx([1e-3]*4)
+
+
+def test_incompatibleUnits(tmp_path, monkeypatch):
+    projectSetup, parameters = makeProject(tmp_path, monkeypatch, ['v = #|v|#',
+                                                      'area = #|area|#',
+                                                      'bad = #|bad(expr="v + area")|#',
+                                                      'wrong = #|wrong(expr="v * 2", unit="ms")|#'])
+    setValue(projectSetup, parameters, "v", -65.0, "mV")
+    setValue(projectSetup, parameters, "area", 1.0, "um**2")
+    with pytest.raises(ValueError):
+        parameters["bad"][1].value
+    with pytest.raises(ValueError):
+        parameters["wrong"][1].value
+
+
+def test_statisticsAggregatedOnce(tmp_path, monkeypatch):
+    # Exporting the project computes the statistics of all its
+    # literature-backed parameters in a single pass.
+    monkeypatch.setattr(FileSetup, "parameterTypes", [SimpleNamespace(name="v_rest", ID="id_v_rest"),
+                                                      SimpleNamespace(name="tau", ID="id_tau")])
+    (tmp_path / "model.mm_py").write_text("v = #|v_rest|#\ntau = #|tau|#\n")
+    projectSetup = ProjectSetup(str(tmp_path))
+    parameters   = list(projectSetup.files["model.mm_py"].parameters.values())
+    for noParam, parameter in enumerate(parameters):
+        parameter.referenceInstances = [ReferenceSummary("ref" + str(noParam) + str(noRef), float(noRef), "mV")
+                                        for noRef in range(3)]
+
+    calls     = []
+    aggregate = modelParameter.aggregate
+    monkeypatch.setattr(modelParameter, "aggregate", lambda *args: calls.append(args) or aggregate(*args))
+    projectSetup.toJSON()
+    json = projectSetup.toJSON()
+    assert len(calls) == 1
+    for parameter in json["files"]["model.mm_py"]["parameters"].values():
+        assert parameter["statistics"]["mean"] == pytest.approx(1.0)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 14:12:08 2026
+
+@author: oreilly
+"""
+
+from types import SimpleNamespace
+
+from metamodeler.referenceStore import ReferenceStore
+
+
+def makeCorpus(value):
+    parameter  = SimpleNamespace(id="param_1", value=value)
+    annotation = SimpleNamespace(ID="annot_1", pubId="pub_1", parameters=[parameter])
+    return SimpleNamespace(annotations=[annotation])
+
+
+def test_corpusSwitch():
+    # Instances of the previous corpus are not resolved after a switch.
+    store = ReferenceStore(makeCorpus(1.0))
+    assert store.resolve("param_1").value == 1.0
+    store.setCorpus(makeCorpus(2.0))
+    assert store.resolve("param_1").value == 2.0
+    store.setCorpus(None)
+    assert store.resolve("param_1") is None
+
+
+def makeReference(values, aggregation="across"):
+    # Stand-in for a nat ParameterInstance, with the fields of its
+    # description (ParamDescPoint) and of its ValuesSimple/ValuesCompound.
+    valueLst = values if isinstance(values, list) else [values]
+    return SimpleNamespace(id="param_1", unit="mV", centralTendancy=lambda: valueLst[0].values,
+                           description=SimpleNamespace(aggregationDefaultType=aggregation,
+                                                       depVar=SimpleNamespace(values=SimpleNamespace(valueLst=valueLst)
+                                                                              if isinstance(values, list) else values)))
+
+def makeValues(values, statistic):
+    return SimpleNamespace(values=values, statistic=statistic)
+
+
+def test_referenceStatistics():
+    store = ReferenceStore()
+    summary = store.summarize(makeReference([makeValues([-65.0], "mean"), makeValues([4.0], "sd"),
+                                             makeValues([10], "N")]))
+    assert (summary.value, summary.spread, summary.size) == (-65.0, 4.0, 10.0)
+
+    # The standard error is converted to a standard deviation.
+    summary = store.summarize(makeReference([makeValues([-65.0], "mean"), makeValues([2.0], "sem"),
+                                             makeValues([16], "N")]))
+    assert (summary.spread, summary.size) == (8.0, 16.0)
+
+    summary = store.summarize(makeReference(makeValues([-60.0, -64.0, -68.0], "raw")))
+    assert (summary.spread, summary.size) == (4.0, 3.0)
+
+    summary = store.summarize(makeReference(makeValues([-60.0], "mean")))
+    assert (summary.spread, summary.size) == (None, None)
+
+
+def test_referenceStatisticsMissingFields():
+    # The statistics are optional: references without them are still summarized.
+    summary = ReferenceStore().summarize(SimpleNamespace(id="param_1", unit="mV", centralTendancy=lambda: 1.0))
+    assert (summary.value, summary.spread, summary.size) == (1.0, None, None)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 09:14:52 2026
+
+@author: oreilly
+"""
+
+import sys
+
+import pytest
+
+from metamodeler.utils import lazyImport
+
+
+def test_lazyImportDefersImport():
+    sys.modules.pop("colorsys", None)
+    colorsys = lazyImport("colorsys")
+    assert not "colorsys" in sys.modules
+    assert colorsys.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert "colorsys" in sys.modules
+
+
+def test_lazyImportMissingAttribute():
+    with pytest.raises(AttributeError):
+        lazyImport("colorsys").notAnAttribute
+
+
+def test_lazyImportModuleGetattr():
+    # NumPy imports some of its submodules through its module __getattr__,
+    # so they are not in its namespace until accessed.
+    pytest.importorskip("numpy")
+    np = lazyImport("numpy")
+    assert np.random.default_rng(0).random() < 1.0
+    assert np.ma.masked_array([1.0]).sum() == 1.0
+    assert np.char.upper("a") == "A"
+
+
+def test_bootstrapMeanCI():
+    numpy = pytest.importorskip("numpy")
+    from metamodeler.aggregation import bootstrapMeanCI
+    low, high = bootstrapMeanCI(numpy.array([[1.0, 2.0, 3.0]]))
+    assert 1.0 <= low[0] <= 2.0 <= high[0] <= 3.0